@@ -18,29 +18,69 @@
 ########################################################################
 
 
+import os
+import sys
 import numpy as np
 import pandas as pd
-import seaborn as sns
+import rasterio
 import matplotlib.pyplot as plt
 import matplotlib
 
+from ndvi_density import NDVIHistograms, ndvi_histograms, read_polygons
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from density_plot import plot_density
+
 matplotlib.rcParams.update({'font.size': 24})
 
-file_1999 = '1999_ndvi_epsg26917_clip_points.csv'
-data_1999 = pd.read_csv(file_1999)
-file_2019 = '2019_ndvi_epsg26917_clip_points.csv'
-data_2019 = pd.read_csv(file_2019)
+#with ndvi_source = 'points', the NDVI of the mine polygon is read from the point CSVs
+#archived with this script (the pixels of the polygon exported from GIS). With
+#'landsat', it is computed from the red and near-infrared bands of the two Landsat images
+#(see ndvi_density.py), which have to be downloaded first and set below together with
+#polygon_path.
+ndvi_source = 'points'
+
+#red and near-infrared bands of the two images (Landsat 7 bands 3 and 4, Landsat 8 bands
+#4 and 5), the polygon file of the mine polygon (only used with ndvi_source = 'landsat'),
+#and the number of worker processes
+landsat_bands = {'1999': ('LE07_L1TP_018034_19990818_20161002_01_T1_B3.TIF',
+                          'LE07_L1TP_018034_19990818_20161002_01_T1_B4.TIF'),
+                 '2019': ('LC08_L1TP_018034_20190614_20190620_01_T1_B4.TIF',
+                          'LC08_L1TP_018034_20190614_20190620_01_T1_B5.TIF')}
+polygon_path = ''
+n_workers = 1
+
+if ndvi_source == 'landsat':
+    missing = [path for bands in landsat_bands.values() for path in bands + (polygon_path,)
+               if not (path and os.path.exists(path))]
+    if missing:
+        raise FileNotFoundError("ndvi_source = 'landsat' needs the Landsat bands and the mine "
+                                'polygon file; set landsat_bands and polygon_path (missing: %s)'
+                                % ', '.join(sorted(set(repr(path) for path in missing))))
+elif ndvi_source != 'points':
+    raise ValueError("ndvi_source must be 'points' or 'landsat', not %r" % (ndvi_source,))
 
+#NDVI histograms of the mine polygon for each year
+histograms = {}
+for year, (red_path, nir_path) in landsat_bands.items():
+    if ndvi_source == 'points':
+        data = pd.read_csv(year + '_ndvi_epsg26917_clip_points.csv')
+        histograms[year] = NDVIHistograms.from_values(data.NDVI)
+    else:
+        with rasterio.open(red_path) as red:
+            polygons, groups, names = read_polygons(polygon_path, red.crs)
+        histograms[year] = ndvi_histograms(red_path, nir_path, polygons, groups,
+                                           n_workers=n_workers)
 
 fig4 = plt.figure(figsize=(8, 5))
 ax4 = plt.subplot()
-sns.kdeplot(data_1999.NDVI, #bw=20, 
+plot_density(ax4, *histograms['1999'].density(),
              color = 'darkblue', label='1999',
              linewidth=5,
-           linestyle='--', common_norm = True)
-sns.kdeplot(data_2019.NDVI, #bw=20, 
+           linestyle='--')
+plot_density(ax4, *histograms['2019'].density(),
              color = 'darkgreen', label='2019',
-             linewidth=5, common_norm = True)
+             linewidth=5)
 ax4.set_xlabel('Summer NDVI')
 ax4.set_ylabel('Probability density')
 ax4.legend()
@@ -0,0 +1,249 @@
+########################################################################
+#NDVI distributions of mine polygons straight from the Landsat bands (Figure 10).
+
+#Brief description: fig10.py originally drew the NDVI densities of one mine polygon from
+#point CSVs exported by GIS (one row per clipped pixel) with seaborn's kdeplot, which
+#keeps every pixel in memory and sums over all of them for every point of the curve. That
+#is fine for the few thousand pixels of one polygon but not for the vegetation recovery
+#of every mine complex, hundreds of millions of pixels. ndvi_histograms() reads the red
+#and near-infrared bands of a Landsat scene in tiles of tile_size x tile_size cells,
+#rasterizes the polygons that intersect a tile into a label grid (tiles no polygon touches
+#are not read), computes the NDVI of the labelled pixels, and adds them to fine histograms
+#(NDVIHistograms), one per group of polygons (e.g. per mine complex). The tiles are
+#spread over a pool of worker processes and their histograms summed, so memory is bounded
+#by the tile size and the number of groups, not by the number of pixels.
+
+#NDVIHistograms.density() gives the curve kdeplot draws (Gaussian kernel with Scott's
+#rule bandwidth, from cut bandwidths below the smallest NDVI to cut bandwidths above the
+#largest) from the histogram alone: the bandwidth comes from the exact count, mean, and
+#variance kept alongside it, and the kernel sum runs over the occupied bins rather than the
+#pixels. With the default bins (0.00025 NDVI wide) the curve is the same as the one from
+#the pixels to well within the line width.
+
+#Run as a script, it computes the NDVI distributions of every polygon group of a polygon
+#file (e.g. the mine complexes) for every Landsat scene below and writes
+#ndvi_densities.csv (the density curve of every group and scene) and
+#ndvi_histograms_<year>.npz (the histograms of every scene, to combine or replot them
+#later).
+
+########################################################################
+
+import numpy as np
+import pandas as pd
+import rasterio
+from concurrent.futures import ProcessPoolExecutor
+from rasterio import features
+from rasterio.enums import MergeAlg
+from rasterio.windows import Window
+from rasterio.windows import bounds as window_bounds
+from shapely import STRtree
+from shapely.geometry import box
+from shapely.geometry import shape as to_shapely
+
+#number and range of the NDVI histogram bins (evenly spaced)
+n_bins = 8000
+ndvi_range = (-1.0, 1.0)
+
+class NDVIHistograms:
+
+    #empty histograms of n_groups groups of pixels. Besides the counts per bin, the number
+    #of pixels, the mean, the sum of squared deviations from the mean (m2), the minimum,
+    #and the maximum of every group are kept exactly.
+    def __init__(self, n_groups, n_bins=n_bins, ndvi_range=ndvi_range):
+        self.bins = np.linspace(ndvi_range[0], ndvi_range[1], n_bins + 1)
+        self.counts = np.zeros((n_groups, n_bins), dtype=np.int64)
+        self.n = np.zeros(n_groups, dtype=np.int64)
+        self.mean = np.zeros(n_groups)
+        self.m2 = np.zeros(n_groups)
+        self.min = np.full(n_groups, np.inf)
+        self.max = np.full(n_groups, -np.inf)
+
+    #histogram of one group of NDVI values (e.g. the pixels exported to a point CSV)
+    @classmethod
+    def from_values(cls, ndvi, n_bins=n_bins, ndvi_range=ndvi_range):
+        histograms = cls(1, n_bins, ndvi_range)
+        ndvi = np.asarray(ndvi, dtype=np.float64)
+        histograms.add(ndvi, np.zeros(len(ndvi), dtype=np.int64))
+        return histograms
+
+    #add NDVI values (within the range of the bins) of the groups groups
+    def add(self, ndvi, groups):
+        n_groups, n_bins = self.counts.shape
+        width = (self.bins[-1] - self.bins[0]) / n_bins
+        bin_index = np.clip(((ndvi - self.bins[0]) / width).astype(np.int64), 0, n_bins - 1)
+        self.counts += np.bincount(groups * n_bins + bin_index,
+                                   minlength=self.counts.size).reshape(self.counts.shape)
+
+        n = np.bincount(groups, minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(n > 0, np.bincount(groups, weights=ndvi, minlength=n_groups) / n, 0)
+        m2 = np.bincount(groups, weights=(ndvi - mean[groups]) ** 2, minlength=n_groups)
+        low, high = np.full(n_groups, np.inf), np.full(n_groups, -np.inf)
+        np.minimum.at(low, groups, ndvi)
+        np.maximum.at(high, groups, ndvi)
+        self._combine(slice(None), n, mean, m2, low, high)
+
+    #add the histograms of other (same bins); rows: the groups of self they belong to
+    #(default: the same groups)
+    def merge(self, other, rows=None):
+        rows = slice(None) if rows is None else np.asarray(rows)
+        self.counts[rows] += other.counts
+        self._combine(rows, other.n, other.mean, other.m2, other.min, other.max)
+        return self
+
+    #combine the moments of the groups rows with those of other pixels (Chan et al.'s
+    #pairwise update, which stays accurate over hundreds of millions of values)
+    def _combine(self, rows, n, mean, m2, low, high):
+        n_self = self.n[rows]
+        total = n_self + n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(total > 0, n / total, 0)
+        delta = mean - self.mean[rows]
+        self.mean[rows] += delta * share
+        self.m2[rows] += m2 + delta ** 2 * n_self * share
+        self.n[rows] = total
+        self.min[rows] = np.minimum(self.min[rows], low)
+        self.max[rows] = np.maximum(self.max[rows], high)
+
+    #Gaussian kernel density estimate of the NDVI of group (Scott's rule bandwidth) at
+    #gridsize points from cut bandwidths below its smallest to cut bandwidths above its
+    #largest value, like seaborn.kdeplot; returns the points and the densities
+    def density(self, group=0, gridsize=200, cut=3):
+        n = self.n[group]
+        bw = n ** (-1 / 5) * np.sqrt(self.m2[group] / (n - 1))
+        support = np.linspace(self.min[group] - cut * bw, self.max[group] + cut * bw, gridsize)
+        occupied = np.flatnonzero(self.counts[group])
+        centers = (self.bins[occupied] + self.bins[occupied + 1]) / 2
+        kernel = np.exp(-0.5 * ((support[:, None] - centers) / bw) ** 2)
+        return support, kernel @ self.counts[group, occupied] / (n * bw * np.sqrt(2 * np.pi))
+
+    #save the histograms to an .npz file, with the names of the groups
+    def save(self, path, names=None):
+        arrays = {name: getattr(self, name) for name in ('bins', 'counts', 'n', 'mean', 'm2', 'min', 'max')}
+        if names is not None:
+            arrays['names'] = np.asarray(names, dtype=str)
+        np.savez_compressed(path, **arrays)
+
+#NDVI histograms of the pixels inside polygons (shapely geometries in the CRS of the bands)
+#from the red and near-infrared band rasters red_path and nir_path, which must be on the
+#same grid. groups gives the group (0, 1, ...) of every polygon (default: every polygon
+#its own); a pixel belongs to a polygon if its center lies inside (where polygons of
+#different groups overlap, to the later one). band_scale = (scale, offset) converts the
+#stored values to reflectance (e.g. (0.0000275, -0.2) for Landsat Collection 2 surface
+#reflectance); pixels that are nodata, have red + near-infrared <= 0, or an NDVI outside
+#ndvi_range are skipped. The tiles are read by n_workers worker processes (1: in this
+#process).
+def ndvi_histograms(red_path, nir_path, polygons, groups=None, band_scale=(1.0, 0.0),
+                    tile_size=1024, n_workers=1, n_bins=n_bins, ndvi_range=ndvi_range):
+    groups = np.arange(len(polygons)) if groups is None else np.asarray(groups, dtype=np.int64)
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    settings = (red_path, nir_path, polygons, groups, band_scale, n_bins, ndvi_range)
+
+    #tiles that intersect at least one polygon
+    tree = STRtree(polygons)
+    with rasterio.open(red_path) as red, rasterio.open(nir_path) as nir:
+        if nir.shape != red.shape or nir.transform != red.transform:
+            raise ValueError('%s is not on the same grid as %s' % (nir.name, red.name))
+        tiles = [Window(col_off, row_off, min(tile_size, red.width - col_off),
+                        min(tile_size, red.height - row_off))
+                 for row_off in range(0, red.height, tile_size)
+                 for col_off in range(0, red.width, tile_size)]
+        tiles = [w for w in tiles if len(tree.query(box(*window_bounds(w, red.transform))))]
+
+    histograms = NDVIHistograms(n_groups, n_bins, ndvi_range)
+    if n_workers <= 1 or len(tiles) <= 1:
+        _open_bands(*settings)
+        for window in tiles:
+            histograms.merge(*_tile_histograms(window))
+        return histograms
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_open_bands,
+                             initargs=settings) as pool:
+        for part, rows in pool.map(_tile_histograms, tiles, chunksize=max(1, len(tiles) // (4 * n_workers))):
+            histograms.merge(part, rows)
+    return histograms
+
+#open the bands and index the polygons for _tile_histograms. Open dataset handles cannot
+#be shared between processes, so every worker process calls this once when it starts.
+def _open_bands(red_path, nir_path, polygons, groups, band_scale, n_bins, ndvi_range):
+    global _red, _nir, _polygons, _tree, _groups, _scale, _bins
+    _red, _nir = rasterio.open(red_path), rasterio.open(nir_path)
+    _polygons, _tree, _groups = polygons, STRtree(polygons), groups
+    _scale, _bins = band_scale, (n_bins, ndvi_range)
+
+#NDVI histograms of the groups with pixels in one tile, and the groups they belong to
+def _tile_histograms(window):
+    hits = np.sort(_tree.query(box(*window_bounds(window, _red.transform))))
+    n_groups = int(_groups.max()) + 1
+    labels = features.rasterize(((_polygons[i], _groups[i] + 1) for i in hits),
+                                out_shape=(window.height, window.width),
+                                transform=_red.window_transform(window), fill=0,
+                                dtype='uint16' if n_groups < np.iinfo('uint16').max else 'uint32',
+                                merge_alg=MergeAlg.replace)
+    inside = labels > 0
+    rows = np.unique(_groups[hits])
+    histograms = NDVIHistograms(len(rows), *_bins)
+    if not inside.any():
+        return histograms, rows
+
+    red = _red.read(1, window=window, masked=True)
+    nir = _nir.read(1, window=window, masked=True)
+    valid = ~(np.ma.getmaskarray(red) | np.ma.getmaskarray(nir))[inside]
+    red = red.data[inside][valid] * _scale[0] + _scale[1]
+    nir = nir.data[inside][valid] * _scale[0] + _scale[1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ndvi = (nir - red) / (nir + red)
+    keep = (nir + red > 0) & (ndvi >= _bins[1][0]) & (ndvi <= _bins[1][1])
+    group = labels[inside][valid][keep].astype(np.int64) - 1
+    histograms.add(ndvi[keep], np.searchsorted(rows, group))
+    return histograms, rows
+
+#polygons of a polygon file (e.g. a shapefile) as shapely geometries in the coordinate
+#reference system crs, with the group of every polygon and the group names: the values of
+#the attribute field (None: all polygons are one group)
+def read_polygons(path, crs, field=None):
+    import fiona
+    from rasterio.warp import transform_geom
+
+    with fiona.open(path) as src:
+        features_crs = src.crs
+        records = [(feature['geometry'], feature['properties'][field] if field else 'all')
+                   for feature in src]
+    polygons = [to_shapely(transform_geom(features_crs, crs, geometry) if features_crs != crs else geometry)
+                for geometry, _ in records]
+    names, groups = np.unique([str(name) for _, name in records], return_inverse=True)
+    return polygons, groups, list(names)
+
+if __name__ == '__main__':
+    #red and near-infrared bands of every Landsat scene: the Landsat 7 image of 1999 (bands
+    #3 and 4) and the Landsat 8 image of 2019 (bands 4 and 5) of fig10.py
+    landsat_bands = {'1999': ('LE07_L1TP_018034_19990818_20161002_01_T1_B3.TIF',
+                              'LE07_L1TP_018034_19990818_20161002_01_T1_B4.TIF'),
+                     '2019': ('LC08_L1TP_018034_20190614_20190620_01_T1_B4.TIF',
+                              'LC08_L1TP_018034_20190614_20190620_01_T1_B5.TIF')}
+
+    #polygon file of the mine areas and the attribute that names the mine complex of each
+    #polygon (None: all polygons together)
+    polygons_path = ''
+    group_field = None
+
+    #conversion of the stored band values (see ndvi_histograms), tile size in cells, and
+    #number of worker processes
+    band_scale = (1.0, 0.0)
+    tile_size = 1024
+    n_workers = 1
+
+    curves = []
+    for year, (red_path, nir_path) in landsat_bands.items():
+        with rasterio.open(red_path) as red:
+            polygons, groups, names = read_polygons(polygons_path, red.crs, group_field)
+        histograms = ndvi_histograms(red_path, nir_path, polygons, groups, band_scale, tile_size,
+                                     n_workers)
+        histograms.save('ndvi_histograms_' + year + '.npz', names)
+        for group, name in enumerate(names):
+            if histograms.n[group] < 2:
+                continue
+            ndvi, density = histograms.density(group)
+            curves.append(pd.DataFrame({'group': name, 'year': year, 'n_pixels': histograms.n[group],
+                                        'ndvi': ndvi, 'density': density}))
+    pd.concat(curves, ignore_index=True).to_csv('ndvi_densities.csv', index=False)
@@ -0,0 +1,171 @@
+########################################################################
+#Batch driver for the Bayesian rank correlations of Figure 4.
+
+#Brief description: the six spearman_bayes_*.R scripts each reload full_mining_stats.csv and
+#run 5 chains of 1e5 samples one after another, however early the chains have converged.
+#This script samples all six relationships in one job with the Python sampler
+#(spearman_sampler.py). The ranks of per_mined, which are the same for all relationships,
+#are computed once. The chains of all relationships are spread over a pool of worker
+#processes and extended in blocks of check_every samples; after every block a
+#relationship stops once its chains reach the R-hat and effective sample size targets (or
+#max_samples). The outputs are those of the R scripts, written to output_dir:
+#spearman_bayes_<relationship>.csv (posterior median, Bayes factor, 99% and 95% highest
+#posterior density intervals) and spearman_bayes_<relationship>_samples.csv, plus
+#spearman_bayes_convergence.csv with the number of samples, R-hat, and effective sample
+#size of every relationship. output_dir is not outputs/, which holds the results of the R
+#scripts that fig4.py reads, so a run never replaces the published numbers (see below for
+#the Bayes factors).
+
+#The Bayes factor needs the posterior density at rho = 0, which the R scripts estimate with
+#logspline (not available in Python). Here it is a Gaussian kernel density estimate where
+#the samples reach 0, which agrees with the R results. When 0 is far in the tail of the
+#posterior (no samples near it) the density there can only be extrapolated, here from a
+#normal fitted to the Fisher z-transformed samples; such Bayes factors (1e5 and more) can
+#differ from the logspline extrapolation by orders of magnitude and only their size class
+#is meaningful.
+
+########################################################################
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import beta, gaussian_kde, norm
+
+from spearman_sampler import (relationships, relationship_data, RankIndex, SpearmanChain, r_hat,
+                              pearson_to_spearman)
+
+#relationships to sample (see spearman_sampler.relationships)
+names = list(relationships)
+
+#chains per relationship, burn-in samples dropped from every chain, and kappa of the
+#stretched beta prior (as in the R scripts)
+n_chains = 5
+n_burnin = 1
+kappa = 1
+
+#every chain is extended by check_every samples at a time until the chains of its
+#relationship have an R-hat below target_r_hat and an effective sample size of at least
+#target_ess (over all chains), or max_samples samples each
+check_every = 5000
+max_samples = int(1e5)
+target_r_hat = 1.01
+target_ess = 20000
+
+#worker processes for the chains (1: sample in this process) and seed of the random numbers
+n_workers = os.cpu_count()
+seed = None
+
+#directory of the outputs; to draw Figure 4 from them, point the paths in fig4.py at it
+output_dir = 'outputs_python/'
+
+#effective sample size of chains of samples (chains x samples), from the autocorrelations
+#of the chains combined as in Stan (Geyer's initial monotone sequence)
+def effective_sample_size(samples):
+    m, n = samples.shape
+    centered = samples - samples.mean(axis=1, keepdims=True)
+    size = 1 << int(np.ceil(np.log2(2 * n)))
+    f = np.fft.rfft(centered, size, axis=1)
+    autocov = np.fft.irfft(f * np.conj(f), size, axis=1)[:, :n] / n
+    within = np.mean(autocov[:, 0] * n / (n - 1))
+    var_plus = within * (n - 1) / n + (samples.mean(axis=1).var(ddof=1) if m > 1 else 0)
+    rho = 1 - (within - autocov.mean(axis=0)) / var_plus
+    rho[0] = 1
+
+    #sums of consecutive pairs of autocorrelations, up to the first that is not positive,
+    #made monotone
+    pairs = rho[:n - n % 2:2] + rho[1::2]
+    stop = np.flatnonzero(pairs <= 0)
+    pairs = np.minimum.accumulate(pairs[:stop[0] if len(stop) else len(pairs)])
+    tau = max(-1 + 2 * pairs.sum(), 1 / np.log10(m * n))
+    return m * n / tau
+
+#highest posterior density interval holding cred_mass of the samples (as HDInterval::hdi)
+def hdi(samples, cred_mass):
+    samples = np.sort(samples)
+    n = len(samples)
+    gap = max(1, min(n - 1, int(round(n * cred_mass))))
+    i = np.argmin(samples[gap:] - samples[:n - gap])
+    return samples[i], samples[i + gap]
+
+#two-sided Bayes factor BF10 of Spearman's rho against rho = 0 from posterior samples
+#(Savage-Dickey density ratio, as computeBayesFactorOneZero with whichTest = "Spearman")
+def bayes_factor(rho_samples, kappa=1):
+    prior_density = beta.pdf(0.5, 1 / kappa, 1 / kappa) / 2
+    kde = gaussian_kde(rho_samples)
+    if np.mean(np.abs(rho_samples) <= kde.factor * rho_samples.std()) >= 1e-3:
+        posterior_density = kde(0)[0]
+    else:
+        #rho = 2 sin(pi rho_s / 6), so d(atanh rho)/d(rho_s) = pi / 3 at 0
+        z = np.arctanh(2 * np.sin(np.pi * rho_samples / 6))
+        posterior_density = norm.pdf(0, z.mean(), z.std()) * np.pi / 3
+    return prior_density / posterior_density
+
+#extend a chain by n_steps samples (in a worker process); returns the chain and samples
+def _extend(chain, n_steps):
+    return chain, chain.sample(n_steps)
+
+#sample all relationships: dict of name -> (Spearman samples of all chains, R-hat, effective
+#sample size, samples per chain)
+def sample_relationships(mining_data, names, n_chains=5, n_burnin=1, kappa=1, check_every=5000,
+                         max_samples=int(1e5), target_r_hat=1.01, target_ess=20000, n_workers=1,
+                         seed=None):
+    #x is per_mined of the same watersheds in every relationship: rank it once
+    x_index = RankIndex(relationship_data(mining_data, names[0])[0])
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(names) * n_chains))
+    chains = {name: [SpearmanChain(x_index, RankIndex(relationship_data(mining_data, name)[1]),
+                                   kappa, next(seeds)) for _ in range(n_chains)]
+              for name in names}
+    samples = {name: [[] for _ in range(n_chains)] for name in names}
+    results = {}
+
+    pool = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    try:
+        while len(results) < len(names):
+            active = [name for name in names if name not in results]
+            n_steps = {name: min(check_every, max_samples - sum(map(len, samples[name][0])))
+                       for name in active}
+            jobs = [(name, i) for name in active for i in range(n_chains)]
+            if pool is None:
+                done = [_extend(chains[name][i], n_steps[name]) for name, i in jobs]
+            else:
+                done = pool.map(_extend, [chains[name][i] for name, i in jobs],
+                                [n_steps[name] for name, i in jobs])
+            for (name, i), (chain, new_samples) in zip(jobs, done):
+                chains[name][i] = chain
+                samples[name][i].append(new_samples)
+
+            for name in active:
+                pearson = np.array([np.concatenate(s) for s in samples[name]])[:, n_burnin:]
+                chains_r_hat, ess = r_hat(pearson), effective_sample_size(pearson)
+                n = pearson.shape[1] + n_burnin
+                print('%s: %d samples per chain, R-hat %.4f, ESS %.0f' % (name, n, chains_r_hat, ess))
+                if (chains_r_hat < target_r_hat and ess >= target_ess) or n >= max_samples:
+                    results[name] = (pearson_to_spearman(pearson.ravel()), chains_r_hat, ess, n)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+if __name__ == '__main__':
+    mining_data = pd.read_csv('../full_mining_stats.csv')
+    os.makedirs(output_dir, exist_ok=True)
+    results = sample_relationships(mining_data, names, n_chains, n_burnin, kappa, check_every,
+                                   max_samples, target_r_hat, target_ess, n_workers, seed)
+
+    convergence = []
+    for name, (rho_samples, chains_r_hat, ess, n) in results.items():
+        cred_interval_99 = hdi(rho_samples, 0.99)
+        cred_interval_95 = hdi(rho_samples, 0.95)
+        export_df = pd.DataFrame({'labels_column': ['posterior_median', 'bayes_factor',
+                                                    'cred_interval_99_min', 'cred_interval_99_max',
+                                                    'cred_interval_95_min', 'cred_interval_95_max'],
+                                  'values_column': [np.median(rho_samples), bayes_factor(rho_samples, kappa),
+                                                    cred_interval_99[0], cred_interval_99[1],
+                                                    cred_interval_95[0], cred_interval_95[1]]})
+        export_df.to_csv(os.path.join(output_dir, 'spearman_bayes_' + name + '.csv'), index=False)
+        pd.DataFrame({'x': rho_samples}).to_csv(os.path.join(output_dir, 'spearman_bayes_' + name + '_samples.csv'),
+                                                index=False)
+        convergence.append({'relationship': name, 'samples_per_chain': n, 'r_hat': chains_r_hat,
+                            'ess': ess})
+    pd.DataFrame(convergence).to_csv(os.path.join(output_dir, 'spearman_bayes_convergence.csv'), index=False)
@@ -0,0 +1,180 @@
+########################################################################
+#Bayesian Spearman's rho in Python (Figure 4 statistics).
+
+#Brief description: a port of spearmanGibbsSampler (spearmanSampler.R, from the supplement
+#of van Doorn et al., 2020; https://osf.io/gny35/) that scales to thousands of watersheds.
+#The R sampler updates the latent normal values one observation at a time and, for every
+#update, scans all n latent values for the truncation bounds (the largest value of a lower
+#rank and the smallest value of a higher rank) and for the mean of the tied values, so a
+#sweep costs O(n^2) interpreted operations.
+
+#Here the ranks are fixed once in a RankIndex, which orders the observations by rank and
+#groups ties. Because the latent values always respect the ranks, the lower bound of an
+#observation is the maximum of the group just below its own and the upper bound the
+#minimum of the group just above, so every bound is an O(1) lookup in the per-group
+#maxima and minima. Observations in groups of even rank are conditionally independent
+#given those in odd groups (and vice versa), so each sweep updates all even groups at once
+#and then all odd groups, with vectorized truncated normal draws: O(n) array operations
+#per sweep. This blocked scan leaves the posterior unchanged (it only replaces the random
+#scan order of the R code). The Metropolis step for rho is the same as in R.
+
+#Run as a script, it samples the relationship below from ../full_mining_stats.csv and
+#writes spearman_bayes_<relationship>_samples.csv like the R scripts, but to
+#outputs_python/ rather than to outputs/ (the results of the R scripts).
+
+########################################################################
+
+import os
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+from scipy.stats import rankdata
+
+#relationships of the Figure 4 statistics: name -> function of the mining statistics
+#table giving y (x is always per_mined)
+relationships = {
+    'RATIO_elev': lambda d: d['post_mean_elev'] / d['pre_mean_elev'],
+    'RATIO_slope': lambda d: d['post_mean_slope'] / d['pre_mean_slope'],
+    'RATIO_SA': lambda d: d['post_mean_SA'] / d['pre_mean_SA'],
+    'W2_elev': lambda d: d['W2_elev'],
+    'W2_slope': lambda d: d['W2_slope'],
+    'W2_SA': lambda d: d['W2_SA'],
+}
+
+#x (percent mined) and y of a relationship for the watersheds of the mining statistics
+#table that lie more than min_coverage within the Ross et al. DEMs (as in the R scripts)
+def relationship_data(mining_data, relationship, min_coverage=0.9):
+    data = mining_data[mining_data['per_Ross'] > min_coverage]
+    return data['per_mined'].to_numpy(), relationships[relationship](data).to_numpy()
+
+#the observations of one variable ordered by rank, with tied observations in one group
+class RankIndex:
+
+    def __init__(self, values):
+        self.ranks = rankdata(values) #average ranks of ties, as R's rank()
+        self.n = len(self.ranks)
+        self.order = np.argsort(self.ranks, kind='stable')
+        sorted_ranks = self.ranks[self.order]
+        self.starts = np.flatnonzero(np.r_[True, sorted_ranks[1:] != sorted_ranks[:-1]])
+        self.group = np.empty(self.n, dtype=np.int64)
+        self.group[self.order] = np.repeat(np.arange(len(self.starts)), np.diff(np.r_[self.starts, self.n]))
+        self.sizes = np.bincount(self.group)
+        self.has_ties = len(self.starts) < self.n
+
+        #observations of the even and of the odd groups
+        self.blocks = [np.flatnonzero(self.group % 2 == parity) for parity in (0, 1)]
+
+    #initial latent values: sorted standard normal draws assigned by rank, as in the R code
+    def initial_values(self, rng):
+        return np.sort(rng.standard_normal(self.n))[self.ranks.astype(np.int64) - 1]
+
+    #mean of the values of every observation's group (the values themselves if no ties)
+    def group_means(self, values):
+        if not self.has_ties:
+            return values
+        return (np.bincount(self.group, weights=values) / self.sizes)[self.group]
+
+    #truncation bounds of the observations idx: the maximum of the values of the group below
+    #theirs and the minimum of the values of the group above (-inf/inf at the ends)
+    def bounds(self, values, idx):
+        group_max = group_min = values[self.order]
+        if self.has_ties:
+            group_max = np.maximum.reduceat(group_min, self.starts)
+            group_min = np.minimum.reduceat(group_min, self.starts)
+        group = self.group[idx]
+        return np.r_[-np.inf, group_max][group], np.r_[group_min, np.inf][group + 1]
+
+#one Markov chain of the Spearman sampler; sample() can be called repeatedly to extend it
+class SpearmanChain:
+
+    def __init__(self, x_index, y_index, kappa=1, seed=None):
+        self.x_index, self.y_index = x_index, y_index
+        self.n = x_index.n
+        self.alpha = 1 / kappa
+        self.rng = np.random.default_rng(seed)
+        self.x = x_index.initial_values(self.rng)
+        self.y = y_index.initial_values(self.rng)
+        self.rho = np.corrcoef(self.x, self.y)[0, 1]
+
+    #n_steps more samples of rho (Pearson's correlation of the latent values)
+    def sample(self, n_steps):
+        samples = np.empty(n_steps)
+        proposals = self.rng.standard_normal(n_steps)
+        chance = self.rng.random(n_steps)
+        for j in range(n_steps):
+            #Gibbs sweep over the latent values with rho fixed
+            sd = np.sqrt(1 - self.rho ** 2)
+            self.x = self._update(self.x, self.x_index, self.rho * self.y_index.group_means(self.y), sd)
+            self.y = self._update(self.y, self.y_index, self.rho * self.x_index.group_means(self.x), sd)
+            self.x = (self.x - self.x.mean()) / self.x.std(ddof=1)
+            self.y = (self.y - self.y.mean()) / self.y.std(ddof=1)
+
+            #Metropolis step for rho, given the correlation of the latent values
+            r_obs = np.dot(self.x, self.y) / (self.n - 1)
+            rho_candidate = np.tanh(np.arctanh(self.rho) + proposals[j] / np.sqrt(self.n - 3))
+            log_acceptance = ((self.alpha - self.n / 2) * (np.log(1 - rho_candidate ** 2) - np.log(1 - self.rho ** 2))
+                              + self.n * ((1 - self.rho * r_obs) / (1 - self.rho ** 2)
+                                          - (1 - rho_candidate * r_obs) / (1 - rho_candidate ** 2)))
+            if chance[j] <= np.exp(log_acceptance):
+                self.rho = rho_candidate
+            samples[j] = self.rho
+        return samples
+
+    #new latent values of one variable: every observation drawn from its normal full
+    #conditional (mean mu) truncated to the bounds set by its neighbours in rank, the even
+    #groups first, then the odd groups
+    def _update(self, values, index, mu, sd):
+        values = values.copy()
+        for idx in index.blocks:
+            lower, upper = index.bounds(values, idx)
+            values[idx] = truncated_normal(lower, upper, mu[idx], sd, self.rng)
+        return values
+
+#draws from normal distributions (means mu, standard deviation sd) truncated to [lower,
+#upper], by inverting the normal CDF. Intervals above the mean are drawn mirrored, so the
+#CDF is always evaluated in its lower tail where it does not round to 1.
+def truncated_normal(lower, upper, mu, sd, rng):
+    a, b = (lower - mu) / sd, (upper - mu) / sd
+    flip = a > 0
+    a, b = np.where(flip, -b, a), np.where(flip, -a, b)
+    p_a, p_b = ndtr(a), ndtr(b)
+    z = np.clip(ndtri(p_a + (p_b - p_a) * rng.random(len(a))), a, b)
+    return mu + sd * np.where(flip, -z, z)
+
+#Gelman-Rubin potential scale reduction factor of chains of samples (chains x samples),
+#as computed by spearmanGibbsSampler
+def r_hat(samples):
+    n_chains, n = samples.shape
+    between = n / (n_chains - 1) * np.sum((samples.mean(axis=1) - samples.mean()) ** 2)
+    within = np.mean(samples.var(axis=1, ddof=1))
+    return np.sqrt(((n - 1) / n * within + between / n) / within)
+
+def pearson_to_spearman(rho):
+    return 6 / np.pi * np.arcsin(rho / 2)
+
+#posterior samples of Spearman's rho between x and y (all chains, one after another, each
+#without its first n_burnin samples) and the R-hat of the chains' Pearson samples, like
+#spearmanGibbsSampler(xVals, yVals, nSamples, kappaPriorParameter, nBurnin, nChains)
+def spearman_gibbs_sampler(x, y, n_samples=1000, kappa=1, n_burnin=1, n_chains=5, seed=None):
+    x_index, y_index = RankIndex(x), RankIndex(y)
+    seeds = np.random.SeedSequence(seed).spawn(n_chains)
+    samples = np.array([SpearmanChain(x_index, y_index, kappa, s).sample(n_samples)[n_burnin:]
+                        for s in seeds])
+    return pearson_to_spearman(samples.ravel()), r_hat(samples)
+
+if __name__ == '__main__':
+    #relationship to sample (see relationships) and sampler settings (those of the R scripts)
+    relationship = 'RATIO_SA'
+    n_samples = int(1e5)
+    n_chains = 5
+    n_burnin = 1
+    kappa = 1
+    seed = None
+
+    mining_data = pd.read_csv('../full_mining_stats.csv')
+    os.makedirs('outputs_python', exist_ok=True)
+    x, y = relationship_data(mining_data, relationship)
+    rho_samples, chains_r_hat = spearman_gibbs_sampler(x, y, n_samples, kappa, n_burnin, n_chains, seed)
+    print(relationship, 'R-hat', chains_r_hat)
+    pd.DataFrame({'x': rho_samples}).to_csv('outputs_python/spearman_bayes_' + relationship + '_samples.csv',
+                                            index=False)
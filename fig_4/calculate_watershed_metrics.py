@@ -22,8 +22,11 @@
 
 ########################################################################
 
+import os
+import sys
 import time
 import copy
+import warnings
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -41,7 +44,23 @@ from rasterio import features
 from rasterio.enums import MergeAlg
 import fiona
 from rasterio.mask import mask
-import ot
+from concurrent.futures import ProcessPoolExecutor
+from shapely.geometry import shape as to_shapely
+from pyproj import CRS
+
+from watershed_results import WatershedResults
+from zonal_stats import zonal_columns, zonal_statistics
+from watershed_checkpoint import (key_columns, files_key, window_key,
+                                  load_checkpoint)
+from tiled_routing import route_regional, RegionalRouting
+from wasserstein import distributions
+from grid_workspace import GridWorkspace
+from raster_cache import build_cache, TileIndex
+from read_ahead import prefetch, BackgroundWriter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from stage_timer import StageTimer, StageLog, stage
+from routing_cache import RoutingCache
 
 #input path must contain the pre- and post-mining DEMS as well as the mine extent dataset
 #available from archives by Ross et al. (2016) and Pericak et al. (2018) as noted above.
@@ -52,96 +71,217 @@ input_path = ''
 #it contains only polygons at at least partially overlap the DEM(s) of interest.
 shp_path = ''
 
-#read the shapefile of HUC12 watersheds that overlap the Ross DEM data extent
-#and create an empty dataframe to add our calculated data
-
-#n is the number of HUC-12 watersheds that overlap the DEMs of interest.
-n = 158
-
-shapes = gpd.gpd.read_file(shp_path)
-shapes['huc12'].head()
-df = pd.DataFrame()
-df['huc12']=shapes['huc12']
-df['geometry'] = shapes['geometry']
-df['per_mined'] = 0 
-df['pre_mean_elev'] = 0
-df['pre_mean_slope'] = 0
-df['pre_mean_d8'] = 0
-df['post_mean_elev'] = 0
-df['post_mean_slope'] = 0
-df['post_mean_d8']= 0
-df['per_mined']=0
-df['W2_elev'] =0
-df['W2_d8']=0
-df['W2_slope'] = 0
-df['pre_mean_SA'] = 0
-df['post_mean_SA'] = 0
-df['counter'] = np.arange(0, n, 1)
-
-#The full Ross DEM files are too large for landlab, so this loop will split the full DEM 
-#into bite-size HUC12 watersheds to process with Landlab
-#1. Open large DEM with Rasterio
-#2. Mask by HUC-12
-#3. Create landlab RasterModelGrids
-#4. Accumulate flow and calculate slope
-#5. Calculate variables 
-
-shapefile = fiona.open(shp_path, "r") 
-pre_elev = rasterio.open(input_path+'TauOld.asc') #pre-mining DEM (Ross et al., 2016)
-post_elev = rasterio.open(input_path+'TauNew.asc') #post-mining DEM (Ross et al., 2016)
-mine_mask = rasterio.open(input_path+'mine_mask.asc') #mined extent dataset (Pericak et al., 2018)
-
-counter = 0   
-#iterate through each HUC-12 watershed that at least partially overlaps the DEM
-for feature in shapefile:
-    shape = [feature["geometry"]]
-    
-	#MASK THE RASTERS TO THE WATERSHED, and then use Landlab to accumulate flow
-	#and extract elevation, slope, and drainage area
-	out_pre_elev, out_transform = mask(pre_elev, shape, crop=True)
-	out_post_elev, out_transform = mask(post_elev, shape, crop=True)
-	out_mine_mask, out_transform = mask(mine_mask,shape,crop=True)
-
-	pre_elev_ar = (out_pre_elev[0,:,:].astype('float64'))
-	post_elev_ar = (out_post_elev[0,:,:].astype('float64'))
-	mine_mask_ar = (out_mine_mask[0,:,:].astype('float64'))
-
-	pre_mg = RasterModelGrid((len(pre_elev_ar[:,]),len(pre_elev_ar[0])),10)
-	pre_mg.add_zeros("topographic__elevation", at="node")
-
-	post_mg = RasterModelGrid((len(post_elev_ar[:,]),len(post_elev_ar[0])),10)
-	post_mg.add_zeros("topographic__elevation", at="node")
-
-	pre_elev_ar_flat = pre_elev_ar.flatten()
-	post_elev_ar_flat = post_elev_ar.flatten()
-	mine_mask_ar_flat = mine_mask_ar.flatten()
-
-	pre_mg.at_node["topographic__elevation"][:] = pre_elev_ar_flat
-	post_mg.at_node["topographic__elevation"][:] = post_elev_ar_flat
-
-	pre_mg.set_closed_boundaries_at_grid_edges(True,True,True,True)
-	pre_mg.set_nodata_nodes_to_closed(pre_elev_ar_flat, -9999)
-	pre_mg.set_watershed_boundary_condition(pre_elev_ar_flat, nodata_value = -9999, return_outlet_id=True)
-	post_mg.set_closed_boundaries_at_grid_edges(True,True,True,True)
-	post_mg.set_nodata_nodes_to_closed(post_elev_ar_flat, -9999)
-	post_mg.set_watershed_boundary_condition(post_elev_ar_flat, nodata_value = -9999, return_outlet_id=True)
-
-	fa_pre = PriorityFloodFlowRouter(pre_mg,flow_metric="D8", suppress_out=True)
-	fa_post = PriorityFloodFlowRouter(post_mg,flow_metric="D8", suppress_out=True)
-
-	fa_pre.run_one_step()
-	fa_post.run_one_step()
-
-	pre_mg.calc_slope_at_node()
-	post_mg.calc_slope_at_node()
-
-	pre_elev_clipped = pre_mg.at_node['topographic__elevation'][pre_mg.core_nodes]
-	pre_slope_clipped = pre_mg.at_node['topographic__steepest_slope'][pre_mg.core_nodes]
-	pre_area_clipped = pre_mg.at_node['drainage_area'][pre_mg.core_nodes]
-	post_elev_clipped = post_mg.at_node['topographic__elevation'][post_mg.core_nodes]
-	post_slope_clipped = post_mg.at_node['topographic__steepest_slope'][post_mg.core_nodes]
-	post_area_clipped = post_mg.at_node['drainage_area'][post_mg.core_nodes]
-
+#number of worker processes used to process the HUC-12 watersheds. The watersheds do not
+#depend on each other, so with n_workers > 1 they are handed out to a process pool and
+#the results are gathered back in the order of the shapefile (i.e., by huc12). With 
+#n_workers = 1 the watersheds are processed one at a time in this process.
+n_workers = 1
+
+#with regional_routing = True, flow is routed once over the full pre- and post-mining
+#DEMs by the tiled, out-of-core router in tiled_routing.py (D8 only) and the elevation,
+#slope, and drainage area of every watershed are read off the regional result instead of
+#routing each clipped watershed with Landlab. Drainage area then includes flow from
+#upstream watersheds rather than starting from zero at every HUC-12 boundary. The routed
+#DEMs are kept in regional_routing_dir and reused by later runs; delete them to reroute.
+#tile_size (in cells) sets how much of a DEM is held in memory at once.
+regional_routing = False
+regional_routing_dir = 'regional_routing/'
+tile_size = 2048
+
+#the pre- and post-mining distributions of every variable are sorted once and compared
+#with the Wasserstein distance in wasserstein.py. With sketch_size set, watersheds with
+#more cells than that are summarized by a streaming quantile sketch of sketch_size points
+#instead, which bounds memory for very large basins (means stay exact, Wasserstein
+#distances become approximate). The sketches are fed blocks of about sketch_size cells;
+#with regional_routing these blocks are read from the regional result one at a time, so
+#the cells of a watershed are never all in memory at once. None always uses the full
+#sorted distributions.
+sketch_size = None
+
+#with compact = True, elevations and slopes are kept as float32 and the mine mask as uint8
+#from the masked reads through the statistics, and the regional routing products (if
+#used) are stored as float32, which roughly halves the memory per watershed so larger
+#windows or more workers fit on a node. Landlab still routes in float64, and drainage
+#area, means, and Wasserstein sums stay float64. Results agree with the default float64
+#run to float32 precision.
+compact = False
+
+#with routing_cache_dir set, the filled surface of every watershed grid is stored in a
+#content-addressed cache (see shared/routing_cache.py) under the hash of the grid's
+#elevations and closed nodes and the depression handling settings, and loaded from it
+#whenever the same grid is filled again, by this script or any other analysis using the
+#same directory, whatever its flow metric (depression_identification.py can share it).
+#Only the flow directions, slopes, and drainage areas are then computed. None always
+#fills.
+routing_cache_dir = None
+
+#parameters used to build the Landlab grids, route flow, and compare distributions. They
+#are part of the checkpoint keys, so changing any of them recomputes every watershed.
+routing_params = {'cellsize': 10, 'nodata_value': -9999, 'flow_metric': 'D8',
+                  'regional_routing': regional_routing, 'sketch_size': sketch_size,
+                  'compact': compact}
+
+#every finished watershed is written to this file straight away. When the script is
+#rerun, watersheds whose inputs and routing parameters are unchanged are read back from
+#it instead of being recomputed (see watershed_checkpoint.py). Delete it to start over.
+checkpoint_path = 'full_mining_stats_checkpoint.csv'
+
+#before any flow routing, the DEM coverage (per_Ross, the proportion of the watershed
+#covered by the Ross et al. (2016) DEM) and the proportion mined of every watershed are
+#calculated from a cheap masked count. Only watersheds for which screen_predicate returns
+#True are routed; the others are written out with their screening values only. Figure 4
+#only uses watersheds with more than 90% DEM coverage, so
+#   screen_predicate = lambda stats: stats['per_Ross'] > 0.9
+#skips routing every watershed that would be thrown away. None routes every watershed.
+screen_predicate = None
+
+#with zonal_screening = True the screening values come from a single streaming pass over
+#the rasters, with all watershed polygons rasterized into a label grid (zonal_stats.py),
+#instead of one masked read per watershed. This also adds pixel counts and mean DEM
+#elevations (zonal_columns) for every watershed to the output.
+zonal_screening = False
+
+#with raster_cache set to a directory, the three ASCII rasters are converted once into
+#tiled, compressed GeoTIFFs (with overviews) in that directory, which are read from then
+#on, so a masked read only decodes the blocks the watershed touches instead of parsing
+#text. The watersheds are then also processed block by block (see raster_cache.py) so
+#consecutive watersheds share blocks. The cache is rebuilt when a source file changes.
+#None reads the ASCII files directly.
+raster_cache = None
+
+#the wall time of every stage of every watershed (read, grid, routing, statistics, and
+#write, for the pre- and post-mining grids where it applies), the peak memory, the window
+#shape, and the number of core nodes are written to timing_path, one row per watershed
+#and stage (see shared/stage_timer.py), to find the watersheds that dominate the runtime
+#and to catch slowdowns, e.g. after a Landlab upgrade. trace_memory adds the peak traced
+#Python/NumPy memory of every stage, which slows the run down somewhat.
+timing_path = 'full_mining_stats_timing.csv'
+trace_memory = False
+timing_columns = ['rows', 'cols', 'pre_core_nodes', 'post_core_nodes']
+
+#with read_ahead = N > 0 and n_workers = 1, a background thread reads and masks the next
+#N watersheds while the current one is routed, and the finished watersheds are written to
+#the checkpoint and timing files by a second thread, so disk or network reads, routing,
+#and writing overlap (see read_ahead.py). At most N masked windows wait in memory. The
+#writer thread is also used with n_workers > 1. With trace_memory, the traced peaks of
+#overlapping stages are then mixed up. 0 runs the stages one after the other.
+read_ahead = 0
+
+#open the large DEMs and the mine extent dataset with Rasterio. Open dataset handles cannot
+#be shared between processes, so every worker process calls this once when it starts. Each
+#process also gets its own pool of Landlab grids that are reused between watersheds and
+#its own stage timer.
+def open_rasters(input_path):
+    global pre_elev, post_elev, mine_mask, workspace, timer
+    timer = StageTimer(trace_memory)
+    workspace = GridWorkspace(routing_params['cellsize'], routing_params['nodata_value'],
+                              routing_params['flow_metric'],
+                              dtype=np.float32 if compact else np.float64,
+                              cache=RoutingCache(routing_cache_dir) if routing_cache_dir else None)
+    pre_elev = rasterio.open(raster_path(input_path, 'TauOld')) #pre-mining DEM (Ross et al., 2016)
+    post_elev = rasterio.open(raster_path(input_path, 'TauNew')) #post-mining DEM (Ross et al., 2016)
+    mine_mask = rasterio.open(raster_path(input_path, 'mine_mask')) #mined extent dataset (Pericak et al., 2018)
+    if regional_routing:
+        global pre_routing, post_routing
+        pre_routing = RegionalRouting(regional_routing_dir+'TauOld')
+        post_routing = RegionalRouting(regional_routing_dir+'TauNew')
+
+#the ASCII raster name in input_path, or its cached GeoTIFF if raster_cache is set
+def raster_path(input_path, name):
+    if raster_cache:
+        return os.path.join(raster_cache, name+'.tif')
+    return input_path+name+'.asc'
+
+#variables calculated for every watershed, in the order they are written to the output
+metric_columns = ['per_Ross', 'per_mined', 'pre_mean_elev', 'pre_mean_slope',
+                  'pre_mean_d8', 'post_mean_elev', 'post_mean_slope', 'post_mean_d8',
+                  'W2_elev', 'W2_d8', 'W2_slope', 'pre_mean_SA', 'post_mean_SA', 'W2_SA']
+
+#screening pass for one watershed: count the pre-mining DEM cells with data and the mined
+#cells inside the watershed without building any grids. per_Ross is measured against the
+#polygon area so that parts of the watershed outside the DEM extent count as uncovered;
+#per_mined is defined exactly as in calculate_watershed_metrics (for routed watersheds,
+#the routed value is the one written out).
+def screen_watershed(geometry):
+    shape = [geometry]
+    out_pre_elev, out_transform = mask(pre_elev, shape, crop=True, filled=False)
+    out_mine_mask, out_transform = mask(mine_mask, shape, crop=True)
+
+    cell_area = abs(pre_elev.transform.a * pre_elev.transform.e)
+    mine_mask_ar = out_mine_mask[0,:,:]
+    return {'per_Ross': min(out_pre_elev.count() * cell_area / to_shapely(geometry).area, 1.0),
+            'per_mined': np.count_nonzero(mine_mask_ar == 1) / mine_mask_ar.size}
+
+#per_Ross divides DEM cell areas (in the units of the DEM transform) by polygon areas (in
+#the units of the shapefile), so both have to be in the same projected CRS. Raise if they
+#are not; warn if either has no CRS to check against (e.g. ASCII rasters without a .prj).
+def check_area_units(dem_crs, shapes_crs):
+    if dem_crs is None or shapes_crs is None:
+        warnings.warn('cannot check that the DEM and the watershed polygons share a projected '
+                      'CRS; per_Ross assumes they do')
+        return
+    dem_crs = CRS.from_user_input(dem_crs.to_wkt())
+    if not dem_crs.is_projected:
+        raise ValueError('the DEM CRS (%s) is not projected; per_Ross needs areas in linear '
+                         'units' % dem_crs.name)
+    if not dem_crs.equals(shapes_crs, ignore_axis_order=True):
+        raise ValueError('the watershed polygons (%s) are not in the CRS of the DEM (%s); '
+                         'reproject the shapefile first' % (shapes_crs.name, dem_crs.name))
+
+#MASK THE RASTERS TO THE WATERSHED (step 2 below)
+def read_watershed(geometry):
+    shape = [geometry]
+    out_pre_elev, out_transform = mask(pre_elev, shape, crop=True)
+    out_post_elev, out_transform = mask(post_elev, shape, crop=True)
+    out_mine_mask, out_transform = mask(mine_mask,shape,crop=True)
+
+    #no float64 copies here: the DEM windows are cast when they are written into the grids
+    pre_elev_ar = out_pre_elev[0,:,:]
+    post_elev_ar = out_post_elev[0,:,:]
+    mine_mask_ar = compact_mine_mask(out_mine_mask[0,:,:]) if compact else out_mine_mask[0,:,:]
+    return pre_elev_ar, post_elev_ar, mine_mask_ar
+
+#mined cells as a uint8 0/1 array (one byte per cell whatever the raster's data type)
+def compact_mine_mask(mine_mask_ar):
+    return (mine_mask_ar == 1).view(np.uint8)
+
+#use Landlab to accumulate flow and extract elevation, slope, and drainage area for a 
+#single HUC-12 watershed and return its variables (steps 3-5 below)
+def calculate_watershed_metrics(pre_elev_ar, post_elev_ar, mine_mask_ar, timer=None):
+    pre_elev_clipped, pre_slope_clipped, pre_area_clipped = workspace.route(
+        pre_elev_ar, timer=timer, label='pre_')
+    post_elev_clipped, post_slope_clipped, post_area_clipped = workspace.route(
+        post_elev_ar, timer=timer, label='post_')
+
+    with stage(timer, 'statistics'):
+        pre = watershed_distributions(cell_blocks(pre_elev_clipped, pre_slope_clipped,
+                                                  pre_area_clipped))
+        post = watershed_distributions(cell_blocks(post_elev_clipped, post_slope_clipped,
+                                                   post_area_clipped))
+        return watershed_statistics(pre, post, mine_mask_ar)
+
+#(elevation, slope, drainage area) of the cells of a watershed in blocks of at most
+#sketch_size cells (one block without a sketch)
+def cell_blocks(elev, slope, area):
+    size = routing_params['sketch_size'] or max(len(elev), 1)
+    for start in range(0, len(elev), size):
+        yield elev[start:start + size], slope[start:start + size], area[start:start + size]
+
+#variables compared before and after mining
+variables = ['elev', 'd8', 'slope', 'SA']
+
+#Distributions of the variables of one watershed from its (elevation, slope, drainage
+#area) blocks. The area-slope product is formed block by block, and with sketch_size each
+#block is added to the quantile sketches and dropped (see wasserstein.py).
+def watershed_distributions(blocks):
+    blocks = ({'elev': elev, 'd8': area, 'slope': slope, 'SA': area**0.5*slope}
+              for elev, slope, area in blocks)
+    return distributions(blocks, variables, routing_params['sketch_size'])
+
+#calculate the variables of one watershed from the Distributions of its variables before
+#and after mining (watershed_distributions) and its masked mine extent array
+def watershed_statistics(pre, post, mine_mask_ar):
+    mine_mask_ar_flat = mine_mask_ar.flatten()
 
     #CALCULATIONS
 
@@ -149,48 +289,235 @@ for feature in shapefile:
     per_mined = len(mine_mask_ar_flat[mine_mask_ar_flat == 1]) / len(mine_mask_ar_flat)
 
     #mean values
-    pre_mean_elev = np.mean(pre_elev_clipped)
-    pre_mean_slope = np.mean(pre_slope_clipped)
-    pre_mean_area = np.mean(pre_area_clipped)
-    pre_mean_SA = (np.mean(pre_area_clipped)**0.5) * (np.mean(pre_slope_clipped))
-    post_mean_elev = np.mean(post_elev_clipped)
-    post_mean_slope = np.mean(post_slope_clipped)
-    post_mean_area = np.mean(post_area_clipped)
-    post_mean_SA = (np.mean(post_area_clipped)**0.5) * (np.mean(post_slope_clipped))
-
-
-    #Wasserstein numbers for all variables
-    W2_2_elev = ot.wasserstein_1d(pre_elev_clipped, post_elev_clipped, p=2)
-    W2_elev = np.sqrt(W2_2_elev)
-
-    W2_2_d8 = ot.wasserstein_1d(pre_area_clipped, pre_area_clipped, p=2)
-    W2_d8 = np.sqrt(W2_2_d8)
-
-    W2_2_slope = ot.wasserstein_1d(pre_slope_clipped, post_slope_clipped, p=2)
-    W2_slope = np.sqrt(W2_2_slope)
-
-    W2_2_SA = ot.wasserstein_1d((pre_area_clipped**0.5*pre_slope_clipped),(post_area_clipped**0.5*post_slope_clipped),p=2)
-    W2_SA = np.sqrt(W2_2_SA)
-
-
-    df.loc[df.counter == counter, 'per_mined'] = per_mined
-    df.loc[df.counter == counter, 'pre_mean_elev'] = pre_mean_elev
-    df.loc[df.counter == counter, 'pre_mean_slope'] = pre_mean_slope
-    df.loc[df.counter == counter, 'pre_mean_d8'] = pre_mean_area
-    df.loc[df.counter == counter, 'post_mean_elev'] = post_mean_elev
-    df.loc[df.counter == counter, 'post_mean_slope'] = post_mean_slope
-    df.loc[df.counter == counter, 'post_mean_d8'] = post_mean_area
-    df.loc[df.counter == counter, 'W2_elev'] = W2_elev
-    df.loc[df.counter == counter, 'W2_d8'] = W2_d8
-    df.loc[df.counter == counter, 'W2_slope'] = W2_slope
-    df.loc[df.counter == counter, 'W2_SA'] = W2_SA
-    df.loc[df.counter == counter, 'pre_mean_SA'] = pre_mean_SA                                                   
-    df.loc[df.counter == counter, 'post_mean_SA'] = post_mean_SA 
-    
-    
-    print(counter)
-    counter += 1   
-
-#save results to csv
-df.to_csv('full_mining_stats.csv')
-
+    pre_mean_elev = pre['elev'].mean
+    pre_mean_slope = pre['slope'].mean
+    pre_mean_area = pre['d8'].mean
+    pre_mean_SA = (pre['d8'].mean**0.5) * (pre['slope'].mean)
+    post_mean_elev = post['elev'].mean
+    post_mean_slope = post['slope'].mean
+    post_mean_area = post['d8'].mean
+    post_mean_SA = (post['d8'].mean**0.5) * (post['slope'].mean)
+
+    #Wasserstein numbers for all variables. W2_d8 compares the pre-mining drainage areas
+    #with themselves, as in the published analysis, so it is 0.
+    W2_elev = pre['elev'].wasserstein(post['elev'], p=2)
+    W2_d8 = pre['d8'].wasserstein(pre['d8'], p=2)
+    W2_slope = pre['slope'].wasserstein(post['slope'], p=2)
+    W2_SA = pre['SA'].wasserstein(post['SA'], p=2)
+
+    return {'per_mined': per_mined,
+            'pre_mean_elev': pre_mean_elev,
+            'pre_mean_slope': pre_mean_slope,
+            'pre_mean_d8': pre_mean_area,
+            'post_mean_elev': post_mean_elev,
+            'post_mean_slope': post_mean_slope,
+            'post_mean_d8': post_mean_area,
+            'W2_elev': W2_elev,
+            'W2_d8': W2_d8,
+            'W2_slope': W2_slope,
+            'W2_SA': W2_SA,
+            'pre_mean_SA': pre_mean_SA,
+            'post_mean_SA': post_mean_SA}
+
+#mask one watershed and compare its window key with the one stored in the checkpoint
+#(previous_key, None if there is none). The watershed is only routed if the key changed;
+#otherwise None is returned in place of the variables and the checkpointed ones are used.
+#With regional_routing the variables are read off the regional result (no window key:
+#a watershed's drainage area depends on more than its own window). The stage timings of
+#the watershed are returned as well.
+def process_watershed(task):
+    return route_task(task, read_task(task, timer), timer)
+
+#first half of process_watershed: the raster reads (and the window key). Returns the data
+#for route_task, the key, and the descriptive values and stage rows recorded by timer.
+def read_task(task, timer):
+    huc12, geometry, previous_key = task
+    timer.start(huc12)
+    with timer.stage('read'):
+        if regional_routing:
+            out_mine_mask, out_transform = mask(mine_mask, [geometry], crop=True)
+            data = (out_mine_mask[0,:,:], regional_blocks(pre_routing, geometry),
+                    regional_blocks(post_routing, geometry))
+            key = None
+        else:
+            data = read_watershed(geometry)
+            key = window_key(data, routing_params)
+    timer.note(rows=data[0].shape[0], cols=data[0].shape[1])
+    info = timer.info
+    return data, key, info, timer.pop_rows()
+
+#(elevation, slope, drainage area) blocks of a watershed in a regional routing result.
+#Without sketch_size the whole window is read here, in the read stage; with sketch_size
+#the blocks of about sketch_size cells are read lazily while they are sketched, so only
+#one block of the window is in memory at a time.
+def regional_blocks(routing, geometry):
+    blocks = routing.read_watershed_blocks(geometry, routing_params['sketch_size'])
+    return blocks if routing_params['sketch_size'] else list(blocks)
+
+#second half of process_watershed: route the watershed read by read_task (unless its key
+#is unchanged) and calculate its variables
+def route_task(task, read, timer):
+    huc12, geometry, previous_key = task
+    data, key, info, read_rows = read
+    timer.start(huc12, **info)
+    if regional_routing:
+        out_mine_mask, pre_blocks, post_blocks = data
+        with timer.stage('statistics'):
+            pre = watershed_distributions(pre_blocks)
+            post = watershed_distributions(post_blocks)
+            metrics = watershed_statistics(pre, post,
+                                           compact_mine_mask(out_mine_mask) if compact
+                                           else out_mine_mask.astype('float64'))
+        timer.note(pre_core_nodes=pre['elev'].size, post_core_nodes=post['elev'].size)
+    elif key == previous_key:
+        metrics = None
+    else:
+        metrics = calculate_watershed_metrics(*data, timer=timer)
+    #the read rows also get the values noted while routing (the core node counts)
+    read_rows = [dict(row, **timer.info) for row in read_rows]
+    return key, metrics, read_rows + timer.pop_rows()
+
+#apply func (screen_watershed or process_watershed) to every task, either one at a time
+#in this process or spread across a pool of n_workers processes. pool.map hands back the
+#results in the same order as the tasks no matter which worker finishes first.
+def run_watersheds(func, tasks, n_workers=1):
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=open_rasters,
+                                 initargs=(input_path,)) as pool:
+            for result in pool.map(func, tasks, chunksize=1):
+                yield result
+    else:
+        open_rasters(input_path)
+        for task in tasks:
+            yield func(task)
+
+#process_watershed for every task in this process, with a background thread reading the
+#next depth watersheds (read_task) while the current one is routed (route_task). The
+#reader thread has its own stage timer; the dataset handles are only used by the reader.
+def run_pipelined(tasks, depth):
+    open_rasters(input_path)
+    reader_timer = StageTimer(trace_memory)
+    reads = prefetch(lambda task: read_task(task, reader_timer), tasks, depth)
+    for task, read in zip(tasks, reads):
+        yield route_task(task, read, timer)
+
+#add a finished watershed to the results (streamed to the checkpoint file) and log its
+#stage timings; run in the writer thread when read_ahead is set
+def write_watershed(results, timing, main_timer, huc12, metrics, keys, stage_rows):
+    main_timer.start(huc12)
+    with main_timer.stage('write'):
+        results.add(huc12, metrics, keys=keys)
+    timing.write(stage_rows + main_timer.pop_rows())
+
+if __name__ == '__main__':
+    #read the shapefile of HUC12 watersheds that overlap the Ross DEM data extent
+    #and set up an accumulator for our calculated data. Each finished watershed is
+    #streamed to the checkpoint file as soon as it is added.
+    shapes = gpd.gpd.read_file(shp_path)
+    columns = metric_columns + (zonal_columns if zonal_screening else [])
+    checkpoint = load_checkpoint(checkpoint_path, columns)
+    results = WatershedResults(shapes['huc12'], columns,
+                               stream_path=checkpoint_path, key_columns=key_columns)
+    run_key = files_key([input_path+'TauOld.asc', input_path+'TauNew.asc',
+                         input_path+'mine_mask.asc'], routing_params)
+    main_timer = StageTimer(trace_memory)
+    timing = StageLog(timing_path, timing_columns)
+
+    #The full Ross DEM files are too large for landlab, so this loop will split the full DEM 
+    #into bite-size HUC12 watersheds to process with Landlab
+    #1. Open large DEM with Rasterio
+    #2. Mask by HUC-12
+    #3. Create landlab RasterModelGrids
+    #4. Accumulate flow and calculate slope
+    #5. Calculate variables 
+
+    #convert the ASCII rasters to the tiled GeoTIFF cache (skipped if it is up to date)
+    if raster_cache:
+        main_timer.start('all')
+        with main_timer.stage('raster_cache'):
+            for name in ['TauOld', 'TauNew', 'mine_mask']:
+                build_cache(input_path+name+'.asc', raster_cache)
+        timing.write(main_timer.pop_rows())
+
+    #with regional_routing, route the full DEMs first (skipped if a previous run did)
+    if regional_routing:
+        for name in ['TauOld', 'TauNew']:
+            if not RegionalRouting.exists(regional_routing_dir+name):
+                main_timer.start(name)
+                with main_timer.stage('regional_routing'):
+                    route_regional(raster_path(input_path, name), regional_routing_dir+name, tile_size,
+                                   dtype=np.float32 if compact else np.float64)
+                timing.write(main_timer.pop_rows())
+
+    shapefile = fiona.open(shp_path, "r") 
+    geometries = [feature["geometry"] for feature in shapefile]
+
+    with rasterio.open(raster_path(input_path, 'TauOld')) as dem:
+        check_area_units(dem.crs, shapes.crs)
+
+    #screen all watersheds first; the screening values are kept for every watershed
+    main_timer.start('all')
+    with main_timer.stage('screening'):
+        if zonal_screening:
+            open_rasters(input_path)
+            zonal = zonal_statistics(geometries, pre_elev, post_elev, mine_mask)
+            screening = dict(zip(shapes['huc12'], zonal.to_dict('records')))
+        else:
+            screening = dict(zip(shapes['huc12'], run_watersheds(screen_watershed, geometries, n_workers)))
+    timing.write(main_timer.pop_rows())
+
+    #watersheds finished by an earlier run on the same input files and parameters are
+    #reused as they are, watersheds that fail the screen are written with their screening
+    #values only, and all others get a routing task
+    todo = []
+    tasks = []
+    for huc12, geometry in zip(shapes['huc12'], geometries):
+        keys, metrics = checkpoint.get(str(huc12), (None, None))
+        if keys is not None and keys['files_key'] == run_key:
+            results.add(huc12, metrics, stream=False)
+        elif screen_predicate is not None and not screen_predicate(screening[huc12]):
+            results.add(huc12, screening[huc12], stream=False)
+        else:
+            todo.append(huc12)
+            tasks.append((huc12, geometry, keys['window_key'] if keys else None))
+    print(len(results), 'watersheds reused from', checkpoint_path, 'or screened out')
+
+    #with the raster cache, process the watersheds block by block
+    if raster_cache:
+        with rasterio.open(raster_path(input_path, 'TauOld')) as dem:
+            order = TileIndex([task[1] for task in tasks], dem).spatial_order()
+        todo = [todo[i] for i in order]
+        tasks = [tasks[i] for i in order]
+
+    #with read_ahead, reading overlaps routing and the finished watersheds are written by
+    #a background thread
+    if read_ahead > 0 and n_workers == 1:
+        watershed_results = run_pipelined(tasks, read_ahead)
+    else:
+        watershed_results = run_watersheds(process_watershed, tasks, n_workers)
+    writer = BackgroundWriter() if read_ahead > 0 else None
+
+    counter = len(results)
+    #iterate through each remaining HUC-12 watershed that at least partially overlaps the DEM
+    for huc12, (key, metrics, stage_rows) in zip(todo, watershed_results):
+        if metrics is None:
+            metrics = checkpoint[str(huc12)][1]
+        else:
+            #the routed values take precedence; screening only adds per_Ross (and the
+            #zonal columns)
+            metrics = dict(screening[huc12], **metrics)
+        args = (results, timing, main_timer, huc12, metrics,
+                {'files_key': run_key, 'window_key': key}, stage_rows)
+        if writer is not None:
+            writer.submit(write_watershed, *args)
+        else:
+            write_watershed(*args)
+
+        print(counter)
+        counter += 1   
+    if writer is not None:
+        writer.close()
+
+    #save results to csv, joining the watershed outlines back on by huc12
+    results.write('full_mining_stats.csv', geometry=shapes)
+    timing.close()
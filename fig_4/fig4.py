@@ -21,10 +21,17 @@
 
 ########################################################################
 
+import os
+import sys
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from posterior_density import posterior_density
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from density_plot import plot_density
+
 df = pd.read_csv('full_mining_stats.csv')
 
 df_clip = df[df.per_Ross > 0.9]
@@ -33,24 +40,22 @@ elev_ratios = df_clip.post_mean_elev / df_clip.pre_mean_elev
 slope_ratios = df_clip.post_mean_slope / df_clip.pre_mean_slope
 SA_ratios = df_clip.post_mean_SA / df_clip.pre_mean_SA
 
-#import MCMC sampling data from Bayesian Spearman correlation
-df_MCMC_RATIO_elev = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_elev_samples.csv')
-df_MCMC_RATIO_slope = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_slope_samples.csv')
-df_MCMC_RATIO_SA = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_SA_samples.csv')
-df_MCMC_W2_elev = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_W2_elev_samples.csv')
-df_MCMC_W2_slope = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_W2_slope_samples.csv')
-df_MCMC_W2_SA = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_W2_SA_samples.csv')
-
-#import MCMC summary stats
-summ_stats_RATIO_elev = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_elev.csv')
-summ_stats_RATIO_slope = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_slope.csv')
-summ_stats_RATIO_SA = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_SA.csv')
-summ_stats_W2_elev = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_W2_elev.csv')
-summ_stats_W2_slope = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_W2_slope.csv')
-summ_stats_W2_SA = pd.read_csv('bayesian_rank_correlations/outputs/spearman_bayes_W2_SA.csv')
+#import MCMC sampling data and summary stats from Bayesian Spearman correlation as posterior
+#density curves (computed once per samples file and cached, see posterior_density.py)
+posterior_RATIO_elev = posterior_density('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_elev_samples.csv',
+                                         'bayesian_rank_correlations/outputs/spearman_bayes_RATIO_elev.csv')
+posterior_RATIO_slope = posterior_density('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_slope_samples.csv',
+                                          'bayesian_rank_correlations/outputs/spearman_bayes_RATIO_slope.csv')
+posterior_RATIO_SA = posterior_density('bayesian_rank_correlations/outputs/spearman_bayes_RATIO_SA_samples.csv',
+                                       'bayesian_rank_correlations/outputs/spearman_bayes_RATIO_SA.csv')
+posterior_W2_elev = posterior_density('bayesian_rank_correlations/outputs/spearman_bayes_W2_elev_samples.csv',
+                                      'bayesian_rank_correlations/outputs/spearman_bayes_W2_elev.csv')
+posterior_W2_slope = posterior_density('bayesian_rank_correlations/outputs/spearman_bayes_W2_slope_samples.csv',
+                                       'bayesian_rank_correlations/outputs/spearman_bayes_W2_slope.csv')
+posterior_W2_SA = posterior_density('bayesian_rank_correlations/outputs/spearman_bayes_W2_SA_samples.csv',
+                                    'bayesian_rank_correlations/outputs/spearman_bayes_W2_SA.csv')
 
 from matplotlib import gridspec
-import seaborn as sb
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 ms = 75 #standard marker size
 
@@ -124,18 +129,18 @@ ax1_ins.get_yaxis().set_visible(False)
 ax1_ins.spines['top'].set_visible(False)
 ax1_ins.spines['left'].set_visible(False)
 ax1_ins.spines['right'].set_visible(False)
-sb.kdeplot(df_MCMC_RATIO_elev.x, ax = ax1_ins, color = 'k', zorder = 0)
+plot_density(ax1_ins, posterior_RATIO_elev['x'], posterior_RATIO_elev['density'], color = 'k', zorder = 0)
 ax1_ins.set_xlabel('')
 ax1_ins.get_xaxis().set_ticks([])
-ax1_ins.scatter([summ_stats_RATIO_elev.values_column[2], summ_stats_RATIO_elev.values_column[3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
+ax1_ins.scatter([posterior_RATIO_elev['summary'][2], posterior_RATIO_elev['summary'][3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
 ax1_ins.patch.set_alpha(0.)
-ax1_ins.annotate(str(np.round(summ_stats_RATIO_elev.values_column[2], 2)), 
-                 (summ_stats_RATIO_elev.values_column[2],0), 
+ax1_ins.annotate(str(np.round(posterior_RATIO_elev['summary'][2], 2)), 
+                 (posterior_RATIO_elev['summary'][2],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
-ax1_ins.annotate(str(np.round(summ_stats_RATIO_elev.values_column[3], 2)), 
-                 (summ_stats_RATIO_elev.values_column[3],0), 
+ax1_ins.annotate(str(np.round(posterior_RATIO_elev['summary'][3], 2)), 
+                 (posterior_RATIO_elev['summary'][3],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
@@ -146,19 +151,19 @@ ax2_ins.get_yaxis().set_visible(False)
 ax2_ins.spines['top'].set_visible(False)
 ax2_ins.spines['left'].set_visible(False)
 ax2_ins.spines['right'].set_visible(False)
-sb.kdeplot(df_MCMC_RATIO_slope.x, ax = ax2_ins, color = 'k', zorder = 0)
+plot_density(ax2_ins, posterior_RATIO_slope['x'], posterior_RATIO_slope['density'], color = 'k', zorder = 0)
 ax2_ins.set_xlabel('')
 ax2_ins.get_xaxis().set_ticks([])
 ax2_ins.patch.set_alpha(0.)
-ax2_ins.scatter([summ_stats_RATIO_slope.values_column[2], summ_stats_RATIO_slope.values_column[3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
+ax2_ins.scatter([posterior_RATIO_slope['summary'][2], posterior_RATIO_slope['summary'][3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
 
-ax2_ins.annotate(str(np.round(summ_stats_RATIO_slope.values_column[2], 2)), 
-                 (summ_stats_RATIO_slope.values_column[2],0), 
+ax2_ins.annotate(str(np.round(posterior_RATIO_slope['summary'][2], 2)), 
+                 (posterior_RATIO_slope['summary'][2],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
-ax2_ins.annotate(str(np.round(summ_stats_RATIO_slope.values_column[3], 2)), 
-                 (summ_stats_RATIO_slope.values_column[3],0), 
+ax2_ins.annotate(str(np.round(posterior_RATIO_slope['summary'][3], 2)), 
+                 (posterior_RATIO_slope['summary'][3],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
@@ -169,19 +174,19 @@ ax3_ins.get_yaxis().set_visible(False)
 ax3_ins.spines['top'].set_visible(False)
 ax3_ins.spines['left'].set_visible(False)
 ax3_ins.spines['right'].set_visible(False)
-sb.kdeplot(df_MCMC_RATIO_SA.x, ax = ax3_ins, color = 'k', zorder = 0)
+plot_density(ax3_ins, posterior_RATIO_SA['x'], posterior_RATIO_SA['density'], color = 'k', zorder = 0)
 ax3_ins.set_xlabel('')
 ax3_ins.patch.set_alpha(0.)
 ax3_ins.get_xaxis().set_ticks([])
-ax3_ins.scatter([summ_stats_RATIO_SA.values_column[2], summ_stats_RATIO_SA.values_column[3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
+ax3_ins.scatter([posterior_RATIO_SA['summary'][2], posterior_RATIO_SA['summary'][3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
 
-ax3_ins.annotate(str(np.round(summ_stats_RATIO_SA.values_column[2], 2)), 
-                 (summ_stats_RATIO_SA.values_column[2],0), 
+ax3_ins.annotate(str(np.round(posterior_RATIO_SA['summary'][2], 2)), 
+                 (posterior_RATIO_SA['summary'][2],0), 
                  textcoords="offset points",
                  xytext=(0,hdpi_pad), 
                  ha='center') 
-ax3_ins.annotate(str(np.round(summ_stats_RATIO_SA.values_column[3], 2)), 
-                 (summ_stats_RATIO_SA.values_column[3],0), 
+ax3_ins.annotate(str(np.round(posterior_RATIO_SA['summary'][3], 2)), 
+                 (posterior_RATIO_SA['summary'][3],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
@@ -192,18 +197,18 @@ ax4_ins.get_yaxis().set_visible(False)
 ax4_ins.spines['top'].set_visible(False)
 ax4_ins.spines['left'].set_visible(False)
 ax4_ins.spines['right'].set_visible(False)
-sb.kdeplot(df_MCMC_W2_elev.x, ax = ax4_ins, color = 'k', zorder = 0)
+plot_density(ax4_ins, posterior_W2_elev['x'], posterior_W2_elev['density'], color = 'k', zorder = 0)
 ax4_ins.set_xlabel('')
 ax4_ins.get_xaxis().set_ticks([])
-ax4_ins.scatter([summ_stats_W2_elev.values_column[2], summ_stats_W2_elev.values_column[3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
+ax4_ins.scatter([posterior_W2_elev['summary'][2], posterior_W2_elev['summary'][3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
 
-ax4_ins.annotate(str(np.round(summ_stats_W2_elev.values_column[2], 2)), 
-                 (summ_stats_W2_elev.values_column[2],0), 
+ax4_ins.annotate(str(np.round(posterior_W2_elev['summary'][2], 2)), 
+                 (posterior_W2_elev['summary'][2],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
-ax4_ins.annotate(str(np.round(summ_stats_W2_elev.values_column[3], 2)), 
-                 (summ_stats_W2_elev.values_column[3],0), 
+ax4_ins.annotate(str(np.round(posterior_W2_elev['summary'][3], 2)), 
+                 (posterior_W2_elev['summary'][3],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
@@ -215,18 +220,18 @@ ax5_ins.get_yaxis().set_visible(False)
 ax5_ins.spines['top'].set_visible(False)
 ax5_ins.spines['left'].set_visible(False)
 ax5_ins.spines['right'].set_visible(False)
-sb.kdeplot(df_MCMC_W2_slope.x, ax = ax5_ins, color = 'k', zorder = 0)
+plot_density(ax5_ins, posterior_W2_slope['x'], posterior_W2_slope['density'], color = 'k', zorder = 0)
 ax5_ins.set_xlabel('')
 ax5_ins.get_xaxis().set_ticks([])
-ax5_ins.scatter([summ_stats_W2_slope.values_column[2], summ_stats_W2_slope.values_column[3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
+ax5_ins.scatter([posterior_W2_slope['summary'][2], posterior_W2_slope['summary'][3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
 
-ax5_ins.annotate(str(np.round(summ_stats_W2_slope.values_column[2], 2)), 
-                 (summ_stats_W2_slope.values_column[2],0), 
+ax5_ins.annotate(str(np.round(posterior_W2_slope['summary'][2], 2)), 
+                 (posterior_W2_slope['summary'][2],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
-ax5_ins.annotate(str(np.round(summ_stats_W2_slope.values_column[3], 2)), 
-                 (summ_stats_W2_slope.values_column[3],0), 
+ax5_ins.annotate(str(np.round(posterior_W2_slope['summary'][3], 2)), 
+                 (posterior_W2_slope['summary'][3],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
@@ -238,18 +243,18 @@ ax6_ins.get_yaxis().set_visible(False)
 ax6_ins.spines['top'].set_visible(False)
 ax6_ins.spines['left'].set_visible(False)
 ax6_ins.spines['right'].set_visible(False)
-sb.kdeplot(df_MCMC_W2_SA.x, ax = ax6_ins, color = 'k', zorder = 0)
+plot_density(ax6_ins, posterior_W2_SA['x'], posterior_W2_SA['density'], color = 'k', zorder = 0)
 ax6_ins.set_xlabel('')
 ax6_ins.get_xaxis().set_ticks([])
-ax6_ins.scatter([summ_stats_W2_SA.values_column[2], summ_stats_W2_SA.values_column[3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
+ax6_ins.scatter([posterior_W2_SA['summary'][2], posterior_W2_SA['summary'][3]], [0,0], clip_on=False, zorder = 4, edgecolor = 'k', facecolor = 'w', s = markersize)
 
-ax6_ins.annotate(str(np.round(summ_stats_W2_SA.values_column[2], 2)), 
-                 (summ_stats_W2_SA.values_column[2],0), 
+ax6_ins.annotate(str(np.round(posterior_W2_SA['summary'][2], 2)), 
+                 (posterior_W2_SA['summary'][2],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
-ax6_ins.annotate(str(np.round(summ_stats_W2_SA.values_column[3], 2)), 
-                 (summ_stats_W2_SA.values_column[3],0), 
+ax6_ins.annotate(str(np.round(posterior_W2_SA['summary'][3], 2)), 
+                 (posterior_W2_SA['summary'][3],0), 
                  textcoords="offset points", 
                  xytext=(0,hdpi_pad), 
                  ha='center') 
@@ -0,0 +1,134 @@
+########################################################################
+#Reusable Landlab grids and flow routers for calculate_watershed_metrics.py (Figure 4 data).
+
+#Brief description: the watershed loop used to build two new RasterModelGrids (with all
+#of their connectivity arrays and fields) for every HUC-12 watershed and to copy every
+#masked DEM window several times (astype, flatten, and the assignment into the elevation
+#field) on the way. A GridWorkspace keeps a small pool of grids keyed by shape. Window
+#shapes are rounded up to a multiple of block cells, so watersheds of similar size share
+#one grid; the window is written straight into the grid's elevation field (the only copy,
+#which also casts it to float64) and the rest of the grid is filled with nodata. The
+#extra rows and columns and the edges of the window itself are closed, so the core nodes,
+#the outlet, and the routing are exactly those of a grid built for the window alone. The
+#one exception is an outlet on the edge of the window: Landlab's depression filling
+#treats the edge of the grid specially, so those windows get a grid of their exact shape.
+
+#The PriorityFloodFlowRouter is still created for every watershed: it takes the closed
+#nodes and cell areas from the grid when it is created, so it has to be created after the
+#boundary conditions are set. It reuses the grid's existing output fields, which are
+#first put back to the values they had when the grid was new so that no state is carried
+#over from the previous watershed.
+
+########################################################################
+
+import os
+import sys
+from collections import OrderedDict
+import numpy as np
+from landlab import RasterModelGrid
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from stage_timer import stage
+from routing_cache import CachedFillRouter
+
+class GridWorkspace:
+
+    #cellsize, nodata_value, and flow_metric are used for every grid; at most max_grids
+    #grids (the most recently used ones) are kept. Landlab always routes in float64;
+    #dtype is the type of the elevations and slopes handed back (drainage area is always
+    #float64).
+    def __init__(self, cellsize, nodata_value, flow_metric, block=64, max_grids=4,
+                 dtype=np.float64, cache=None):
+        self.cellsize = cellsize
+        self.nodata_value = nodata_value
+        self.flow_metric = flow_metric
+        self.block = block
+        self.max_grids = max_grids
+        self.dtype = dtype
+        self.cache = cache
+        self._grids = OrderedDict()
+        self._initial = {}
+
+    #route flow over a masked DEM window (nodata outside the watershed) and return the
+    #elevation, steepest slope, and drainage area at the core nodes. With a StageTimer,
+    #setting up the grid and routing are timed as the stages label + 'grid' and
+    #label + 'routing' and the number of core nodes is noted as label + 'core_nodes'.
+    #With a RoutingCache (shared/routing_cache.py), the filled surface of a grid filled
+    #before (by any flow metric) is loaded from it, and only the flow directions, slopes,
+    #and drainage areas are computed.
+    def route(self, elev_ar, block=None, timer=None, label=''):
+        out = self._route(elev_ar, block, timer, label)
+        if timer is not None:
+            timer.note(**{label + 'core_nodes': len(out[2])})
+        return (out[0].astype(self.dtype, copy=False), out[1].astype(self.dtype, copy=False),
+                out[2])
+
+    def _route(self, elev_ar, block, timer, label):
+        with stage(timer, label + 'grid'):
+            grid = self._set_up(elev_ar, block or self.block)
+        if grid is None:
+            return self._route(elev_ar, 1, timer, label)
+
+        with stage(timer, label + 'routing'):
+            router = CachedFillRouter(grid, flow_metric=self.flow_metric,
+                                      suppress_out=True, cache=self.cache)
+            self._reset_fields(grid)
+            router.run_one_step()
+
+            core = grid.core_nodes
+            return (grid.at_node['topographic__elevation'][core],
+                    grid.at_node['topographic__steepest_slope'][core],
+                    grid.at_node['drainage_area'][core].copy())
+
+    #write the window into a grid from the pool and set its boundary conditions. Returns
+    #None if the window needs a grid of its exact shape instead (see above).
+    def _set_up(self, elev_ar, block):
+        rows, cols = elev_ar.shape
+        shape = (-(-rows // block) * block, -(-cols // block) * block)
+        grid = self._grid(shape)
+
+        elev = grid.at_node['topographic__elevation']
+        elev2d = elev.reshape(shape)
+        elev2d[:rows, :cols] = elev_ar
+        elev2d[rows:, :] = self.nodata_value
+        elev2d[:rows, cols:] = self.nodata_value
+
+        status = np.full(shape, grid.BC_NODE_IS_CORE, dtype=grid.status_at_node.dtype)
+        status[rows:, :] = grid.BC_NODE_IS_CLOSED
+        status[:, cols:] = grid.BC_NODE_IS_CLOSED
+        status[[0, rows - 1], :cols] = grid.BC_NODE_IS_CLOSED
+        status[:rows, [0, cols - 1]] = grid.BC_NODE_IS_CLOSED
+        grid.status_at_node = status.ravel()
+        grid.set_nodata_nodes_to_closed(elev, self.nodata_value)
+        outlet = grid.set_watershed_boundary_condition(elev, nodata_value=self.nodata_value,
+                                                       return_outlet_id=True)[0]
+        row, col = divmod(outlet, shape[1])
+        if shape != (rows, cols) and (row in (0, rows - 1) or col in (0, cols - 1)):
+            return None
+        return grid
+
+    def _grid(self, shape):
+        if shape in self._grids:
+            self._grids.move_to_end(shape)
+        else:
+            grid = RasterModelGrid(shape, self.cellsize)
+            grid.add_zeros('topographic__elevation', at='node')
+            self._grids[shape] = grid
+            if len(self._grids) > self.max_grids:
+                self._initial.pop(self._grids.popitem(last=False)[1], None)
+        return self._grids[shape]
+
+    #remember the initial value of every field of a new grid (a scalar for fields that
+    #start out constant, which is all but the fixed grid geometry) or restore it
+    def _reset_fields(self, grid):
+        if grid not in self._initial:
+            initial = {}
+            for name in grid.at_node.keys():
+                values = grid.at_node[name]
+                if name != 'topographic__elevation':
+                    constant = values.size and np.all(values == values.flat[0])
+                    initial[name] = values.flat[0] if constant else values.copy()
+            self._initial[grid] = initial
+        else:
+            for name, value in self._initial[grid].items():
+                grid.at_node[name][...] = value
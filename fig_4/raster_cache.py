@@ -0,0 +1,92 @@
+########################################################################
+#Tiled GeoTIFF cache of the regional rasters and a spatial tile index (Figure 4 data).
+
+#Brief description: the pre- and post-mining DEMs and the mine extent raster come as
+#ESRI ASCII grids, which have no internal blocks, so every masked read of a watershed has
+#to parse text (GDAL scans the file up to the rows it needs). build_cache() converts each
+#of them once into a tiled, compressed GeoTIFF (blocks of block_size x block_size cells,
+#DEFLATE with a predictor, plus average overviews for quick looks at the whole region) in
+#a cache directory; a watershed read from the cache only decodes the blocks its window
+#touches. The cache is rebuilt automatically when the size or modification time of the
+#source file changes.
+
+#TileIndex puts the bounding boxes of the HUC-12 watersheds in an R-tree (shapely's
+#STRtree) to find the watersheds that touch a block of the cache. spatial_order() uses it
+#to process the watersheds block by block, so consecutive watersheds mostly read blocks
+#GDAL still holds in its block cache.
+
+########################################################################
+
+import os
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+from shapely import STRtree
+from shapely.geometry import box
+from shapely.geometry import shape as to_shapely
+
+#path of the cached GeoTIFF of src_path in cache_dir, converting it first if there is no
+#up-to-date cache
+def build_cache(src_path, cache_dir, block_size=512, overviews=(2, 4, 8, 16, 32)):
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, os.path.splitext(os.path.basename(src_path))[0] + '.tif')
+    stat = os.stat(src_path)
+    source = {'source_size': str(stat.st_size), 'source_mtime': str(stat.st_mtime_ns)}
+    if os.path.exists(cache_path):
+        with rasterio.open(cache_path) as cached:
+            if all(cached.tags().get(k) == v for k, v in source.items()):
+                return cache_path
+
+    #write to a temporary file so an interrupted conversion never looks finished
+    tmp_path = cache_path + '.partial'
+    with rasterio.open(src_path) as src:
+        profile = src.profile.copy()
+        profile.update(driver='GTiff', tiled=True, blockxsize=block_size,
+                       blockysize=block_size, compress='deflate', BIGTIFF='IF_SAFER',
+                       predictor=3 if np.dtype(src.dtypes[0]).kind == 'f' else 2)
+        with rasterio.open(tmp_path, 'w', **profile) as dst:
+            for row_off in range(0, src.height, block_size):
+                window = Window(0, row_off, src.width, min(block_size, src.height - row_off))
+                dst.write(src.read(window=window), window=window)
+            levels = [f for f in overviews if min(src.shape) // f > 0]
+            if levels:
+                dst.build_overviews(levels, Resampling.average)
+                dst.update_tags(ns='rio_overview', resampling='average')
+            dst.update_tags(**source)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+class TileIndex:
+
+    #geometries: GeoJSON-like watershed geometries; dataset: an open raster on the grid
+    #the watersheds are read from (e.g. a cached GeoTIFF), whose block size sets the tiles
+    def __init__(self, geometries, dataset):
+        self.transform = dataset.transform
+        self.shape = dataset.shape
+        self.block_rows, self.block_cols = dataset.block_shapes[0]
+        self.n_block_rows = -(-self.shape[0] // self.block_rows)
+        self.n_block_cols = -(-self.shape[1] // self.block_cols)
+        self.boxes = [box(*to_shapely(geometry).bounds) for geometry in geometries]
+        self.tree = STRtree(self.boxes)
+
+    #indices of the watersheds whose bounding boxes touch block (row, col)
+    def watersheds(self, row, col):
+        window = Window(col * self.block_cols, row * self.block_rows,
+                        self.block_cols, self.block_rows)
+        bounds = rasterio.windows.bounds(window, self.transform)
+        return sorted(self.tree.query(box(*bounds)).tolist())
+
+    #all watershed indices, ordered block by block (row by row of blocks, snaking back
+    #and forth so consecutive blocks are neighbors); watersheds outside the raster last
+    def spatial_order(self):
+        order = []
+        seen = np.zeros(len(self.boxes), dtype=bool)
+        for r in range(self.n_block_rows):
+            cols = range(self.n_block_cols) if r % 2 == 0 else range(self.n_block_cols - 1, -1, -1)
+            for c in cols:
+                for i in self.watersheds(r, c):
+                    if not seen[i]:
+                        seen[i] = True
+                        order.append(i)
+        return order + np.flatnonzero(~seen).tolist()
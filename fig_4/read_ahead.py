@@ -0,0 +1,90 @@
+########################################################################
+#Read-ahead and background writing for the watershed loop (Figure 4 data).
+
+#Brief description: run one after the other, the watershed loop reads and masks the
+#rasters while the CPU idles and then routes flow while the disk idles. prefetch() runs the
+#read step for the next watersheds in a background thread and hands the results over
+#through a bounded queue, so at most depth watersheds are held in memory ahead of the one
+#being routed; BackgroundWriter takes the finished rows off the main thread in the same
+#way. GDAL and NumPy release the GIL while they read and decode, so this overlaps I/O
+#with routing even without worker processes, which matters most on network filesystems.
+
+#Only the reader thread may use the dataset handles it reads from while prefetch() runs.
+#Exceptions raised in either thread are re-raised in the main thread.
+
+########################################################################
+
+import queue
+import threading
+
+_done = object()
+
+#apply func to every item in a background thread, at most depth items ahead of the
+#consumer, and yield the results in the order of items
+def prefetch(func, items, depth=2):
+    results = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def read():
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                results.put((func(item), None))
+        except BaseException as error:
+            results.put((None, error))
+        results.put((_done, None))
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    try:
+        while True:
+            result, error = results.get()
+            if error is not None:
+                raise error
+            if result is _done:
+                break
+            yield result
+    finally:
+        #let the reader finish its current item and stop
+        stop.set()
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+class BackgroundWriter:
+
+    #calls submitted with submit() are run one at a time, in order, in a background thread;
+    #at most maxsize calls wait in the queue before submit() blocks
+    def __init__(self, maxsize=64):
+        self._calls = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        if self._error is not None:
+            raise self._error
+        self._calls.put((func, args, kwargs))
+
+    #wait for all submitted calls to finish
+    def close(self):
+        self._calls.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            if self._error is None:
+                func, args, kwargs = call
+                try:
+                    func(*args, **kwargs)
+                except BaseException as error:
+                    self._error = error
@@ -0,0 +1,529 @@
+########################################################################
+#Tiled, out-of-core D8 flow routing over the full regional DEMs (Figure 4 data).
+
+#Brief description: the full Ross et al. (2016) DEMs are too large to route in one
+#Landlab grid, so calculate_watershed_metrics.py originally clipped and routed every
+#HUC-12 watershed on its own. That makes drainage area start from zero at every HUC-12
+#boundary and routes the cells on shared edges twice. route_regional() instead routes
+#flow over the whole DEM while only ever holding one tile (plus a one-cell halo) in
+#memory; everything else lives in .npy memory maps in a work directory.
+
+#The steps follow Barnes (2016, Parallel priority-flood depression filling for trillion
+#cell digital elevation models, Computers & Geosciences 96, 56-68) and Barnes (2017,
+#Parallel non-divergent flow accumulation for trillion cell digital elevation models on
+#desktops or clusters, Environmental Modelling & Software 92, 202-212):
+#
+#   1. every tile is depression-filled on its own with all of its edge cells (and all
+#      cells next to nodata) as outlets, and each cell is labeled with the outlet that
+#      flooded it. Neighboring cells with different labels, within and across tiles,
+#      define a graph of labels whose edges are weighted by the higher of the two filled
+#      elevations.
+#   2. a priority-flood over that (small) graph, starting from the outlets of the whole
+#      DEM (cells on its edge or next to nodata), gives the water level of every label,
+#      and the depression-filled elevation of every cell is the higher of its tile-level
+#      filled elevation and the level of its label. This is exactly the surface a single
+#      priority-flood over the whole DEM would produce.
+#   3. D8 receivers are the steepest downhill neighbor on the filled surface. Cells on
+#      flats (filled depressions) drain along the shortest path to the edge of the flat;
+#      the distances are found tile by tile and exchanged through the halos until no tile
+#      changes. Outlets of the DEM drain out of it. Slope is measured to the receiver on
+#      the original DEM and, as in Landlab's PriorityFloodFlowRouter, never negative.
+#   4. drainage area is accumulated inside every tile, the flow leaving each tile is
+#      passed on through a graph of tile exit cells, and every tile is accumulated once
+#      more with that inflow added where it enters.
+
+#Products (all on the DEM grid, in work_dir): elevation (nodata as NaN), filled,
+#receiver (D8 direction code 0-7, 8 for outlets, 255 for nodata), slope, and
+#drainage_area, plus meta.json with the georeferencing. Elevation, filled elevation, and
+#slope are stored as dtype (float64 by default); float32 halves their size on disk and in
+#every tile and, because filling only ever copies existing elevations, is lossless for a
+#float32 DEM. Drainage area is always accumulated and stored as float64. RegionalRouting reads them and
+#returns the values inside a watershed.
+
+#The products must not depend on the tile size. Run as a script, this file checks that on
+#random DEMs of several shapes (including DEMs shorter or narrower than one tile) with
+#tile_size_mismatches().
+
+########################################################################
+
+import os
+import sys
+import json
+import heapq
+import numpy as np
+import rasterio
+from rasterio import features
+from rasterio.windows import Window, from_bounds
+from affine import Affine
+from shapely.geometry import shape as to_shapely
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from priority_flood import (priority_flood, edge_and_nodata_cells, d8_offsets,
+                            d8_lengths, compiled, loop_arrays)
+
+products = ['elevation', 'filled', 'receiver', 'slope', 'drainage_area']
+
+outlet_code = 8
+nodata_code = 255
+unresolved_code = 9
+far = np.iinfo(np.int32).max
+
+#route flow over the DEM at dem_path in tiles of tile_size x tile_size cells and write
+#the products to work_dir. Returns a RegionalRouting for the results.
+def route_regional(dem_path, work_dir, tile_size=2048, block_rows=512, dtype=np.float64):
+    os.makedirs(work_dir, exist_ok=True)
+    with rasterio.open(dem_path) as dem:
+        shape = dem.shape
+        meta = {'shape': list(shape), 'transform': list(dem.transform)[:6],
+                'crs': dem.crs.to_wkt() if dem.crs else None, 'tile_size': tile_size}
+        z = _create(work_dir, 'elevation', dtype, shape)
+        for row_off in range(0, shape[0], block_rows):
+            window = Window(0, row_off, shape[1], min(block_rows, shape[0] - row_off))
+            z[window.row_off:window.row_off + window.height] = \
+                dem.read(1, window=window, masked=True).astype(dtype).filled(np.nan)
+    z.flush()
+
+    transform = Affine(*meta['transform'])
+    cellsize = abs(transform.a)
+    tiles = _tiles(shape, tile_size)
+
+    filled = _create(work_dir, 'filled', dtype, shape)
+    labels = _create(work_dir, 'labels', np.int64, shape)
+    levels = _label_levels(z, filled, labels, tiles, tile_size)
+    for r0, c0, h, w in tiles:
+        lab = labels[r0:r0 + h, c0:c0 + w]
+        f = filled[r0:r0 + h, c0:c0 + w]
+        f[lab >= 0] = np.maximum(f[lab >= 0], levels[lab[lab >= 0]])
+    filled.flush()
+    del labels
+    os.remove(os.path.join(work_dir, 'labels.npy'))
+
+    receiver = _create(work_dir, 'receiver', np.uint8, shape)
+    dist = _create(work_dir, 'flat_distance', np.int32, shape)
+    slope = _create(work_dir, 'slope', dtype, shape)
+    _receivers(z, filled, receiver, dist, slope, tiles, tile_size, cellsize)
+
+    area = _create(work_dir, 'drainage_area', np.float64, shape)
+    _accumulate(filled, receiver, dist, area, tiles, cellsize**2)
+    for ar in (receiver, slope, area):
+        ar.flush()
+    del dist
+    os.remove(os.path.join(work_dir, 'flat_distance.npy'))
+
+    with open(os.path.join(work_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return RegionalRouting(work_dir)
+
+class RegionalRouting:
+
+    def __init__(self, work_dir):
+        with open(os.path.join(work_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.transform = Affine(*self.meta['transform'])
+        self.shape = tuple(self.meta['shape'])
+        for name in products:
+            setattr(self, name, np.load(os.path.join(work_dir, name + '.npy'), mmap_mode='r'))
+
+    #True if work_dir holds a finished set of products
+    @staticmethod
+    def exists(work_dir):
+        return os.path.exists(os.path.join(work_dir, 'meta.json'))
+
+    #elevation, slope, and drainage area of the cells with data inside a GeoJSON-like
+    #watershed geometry; only the watershed's bounding window is read from disk, in blocks
+    #of whole rows with about block_cells cells each (the whole window in one block if
+    #None), one at a time as the blocks are consumed
+    def read_watershed_blocks(self, geometry, block_cells=None):
+        polygon = to_shapely(geometry)
+        window = from_bounds(*polygon.bounds, transform=self.transform)
+        window = window.round_offsets(op='floor').round_lengths(op='ceil')
+        window = window.intersection(Window(0, 0, self.shape[1], self.shape[0]))
+        block_rows = window.height if block_cells is None else max(block_cells // max(window.width, 1), 1)
+
+        for row_off in range(window.row_off, window.row_off + window.height, block_rows):
+            height = min(block_rows, window.row_off + window.height - row_off)
+            block = Window(window.col_off, row_off, window.width, height)
+            rows = slice(row_off, row_off + height)
+            cols = slice(window.col_off, window.col_off + window.width)
+
+            inside = features.geometry_mask([polygon], out_shape=(height, window.width),
+                                            transform=rasterio.windows.transform(block, self.transform),
+                                            invert=True)
+            elev = np.asarray(self.elevation[rows, cols])
+            inside &= ~np.isnan(elev)
+            yield (elev[inside], np.asarray(self.slope[rows, cols])[inside],
+                   np.asarray(self.drainage_area[rows, cols])[inside])
+
+def _create(work_dir, name, dtype, shape):
+    return np.lib.format.open_memmap(os.path.join(work_dir, name + '.npy'), mode='w+',
+                                     dtype=dtype, shape=shape)
+
+def _tiles(shape, tile_size):
+    return [(r0, c0, min(tile_size, shape[0] - r0), min(tile_size, shape[1] - c0))
+            for r0 in range(0, shape[0], tile_size) for c0 in range(0, shape[1], tile_size)]
+
+#a tile of ar with a halo of one cell on every side; cells beyond the edge of ar are fill
+def _with_halo(ar, r0, c0, h, w, fill):
+    out = np.full((h + 2, w + 2), fill, dtype=ar.dtype)
+    rs, re = max(r0 - 1, 0), min(r0 + h + 1, ar.shape[0])
+    cs, ce = max(c0 - 1, 0), min(c0 + w + 1, ar.shape[1])
+    out[rs - r0 + 1:re - r0 + 1, cs - c0 + 1:ce - c0 + 1] = ar[rs:re, cs:ce]
+    return out
+
+#the eight D8 neighbors of every cell of a tile, taken from the tile with its halo
+def _neighbors(halo, h, w):
+    return [halo[1 + dr:1 + dr + h, 1 + dc:1 + dc + w] for dr, dc in d8_offsets]
+
+#reduce a list of label pairs to one edge per pair with the lowest weight
+def _min_edges(a, b, weight):
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    order = np.lexsort((weight, hi, lo))
+    lo, hi, weight = lo[order], hi[order], weight[order]
+    first = np.ones(len(lo), dtype=bool)
+    first[1:] = (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+    return lo[first], hi[first], weight[first]
+
+#label graph edges between all pairs of neighboring cells (a: first cells, b: second
+#cells) with different labels
+def _pair_edges(lab_a, lab_b, f_a, f_b):
+    keep = (lab_a >= 0) & (lab_b >= 0) & (lab_a != lab_b)
+    return lab_a[keep], lab_b[keep], np.maximum(f_a[keep], f_b[keep])
+
+#steps 1 and 2: fill every tile, label its cells, and solve for the water level of every
+#label. filled holds the tile-level filled elevations and labels the global labels on
+#return. tile_size is the stride of the tiles (edge tiles can be smaller).
+def _label_levels(z, filled, labels, tiles, tile_size):
+    n_labels = 0
+    ocean_labels, ocean_levels = [], []
+    edges = []
+    for r0, c0, h, w in tiles:
+        zt = np.asarray(z[r0:r0 + h, c0:c0 + w])
+        valid = ~np.isnan(zt)
+        outlets = edge_and_nodata_cells(~np.isnan(_with_halo(z, r0, c0, h, w, np.nan)))[1:-1, 1:-1]
+        seeds = np.zeros((h, w), dtype=bool)
+        seeds[[0, -1], :] = True
+        seeds[:, [0, -1]] = True
+        seeds = valid & (seeds | outlets)
+
+        f, lab = priority_flood(zt, valid, seeds, return_labels=True)
+        lab[lab >= 0] += n_labels
+        n_labels += int(seeds.sum())
+        filled[r0:r0 + h, c0:c0 + w] = f
+        labels[r0:r0 + h, c0:c0 + w] = lab
+
+        #outlets of the DEM drain into the "ocean" at their own elevation
+        ocean_labels.append(lab[seeds & outlets])
+        ocean_levels.append(zt[seeds & outlets])
+
+        for a, b, fa, fb in [(lab[:, :-1], lab[:, 1:], f[:, :-1], f[:, 1:]),
+                             (lab[:-1, :], lab[1:, :], f[:-1, :], f[1:, :]),
+                             (lab[:-1, :-1], lab[1:, 1:], f[:-1, :-1], f[1:, 1:]),
+                             (lab[:-1, 1:], lab[1:, :-1], f[:-1, 1:], f[1:, :-1])]:
+            edges.append(_min_edges(*_pair_edges(a, b, fa, fb)))
+
+    #edges between neighboring cells on either side of every tile boundary
+    rows, cols = z.shape
+    for c in range(tile_size, cols, tile_size):
+        la, lb = np.asarray(labels[:, c - 1]), np.asarray(labels[:, c])
+        fa, fb = np.asarray(filled[:, c - 1]), np.asarray(filled[:, c])
+        for sa, sb in [(slice(None), slice(None)), (slice(None, -1), slice(1, None)),
+                       (slice(1, None), slice(None, -1))]:
+            edges.append(_min_edges(*_pair_edges(la[sa], lb[sb], fa[sa], fb[sb])))
+    for r in range(tile_size, rows, tile_size):
+        la, lb = np.asarray(labels[r - 1, :]), np.asarray(labels[r, :])
+        fa, fb = np.asarray(filled[r - 1, :]), np.asarray(filled[r, :])
+        for sa, sb in [(slice(None), slice(None)), (slice(None, -1), slice(1, None)),
+                       (slice(1, None), slice(None, -1))]:
+            edges.append(_min_edges(*_pair_edges(la[sa], lb[sb], fa[sa], fb[sb])))
+
+    lo, hi, weight = _min_edges(*[np.concatenate(e) for e in zip(*edges)]) if edges else \
+        (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0))
+    return _flood_label_graph(n_labels, lo, hi, weight,
+                              np.concatenate(ocean_labels), np.concatenate(ocean_levels))
+
+#priority-flood over the label graph: the level of a label is the lowest possible
+#highest weight along any path of edges from the ocean to it
+def _flood_label_graph(n_labels, lo, hi, weight, ocean_labels, ocean_levels):
+    src = np.concatenate([lo, hi])
+    dst = np.concatenate([hi, lo])
+    wgt = np.concatenate([weight, weight])
+    order = np.argsort(src, kind='stable')
+    start = np.searchsorted(src[order], np.arange(n_labels + 1))
+    arrays = loop_arrays(np.full(n_labels, np.inf), start, dst[order], wgt[order].astype(np.float64),
+                         ocean_labels.astype(np.int64), ocean_levels.astype(np.float64))
+    _flood_graph(*arrays)
+    return np.asarray(arrays[0], dtype=np.float64)
+
+@compiled
+def _flood_graph(level, start, dst, wgt, ocean_labels, ocean_levels):
+    heap = [(0.0, 0)]
+    heap.pop()
+    for k in range(len(ocean_labels)):
+        lab, lev = ocean_labels[k], ocean_levels[k]
+        if lev < level[lab]:
+            level[lab] = lev
+            heap.append((lev, lab))
+    heapq.heapify(heap)
+    while heap:
+        lev, a = heapq.heappop(heap)
+        if lev > level[a]:
+            continue
+        for k in range(start[a], start[a + 1]):
+            b = dst[k]
+            new = max(lev, wgt[k])
+            if new < level[b]:
+                level[b] = new
+                heapq.heappush(heap, (new, b))
+
+#step 3: D8 receivers, flat distances, and slopes
+def _receivers(z, filled, receiver, dist, slope, tiles, tile_size, cellsize):
+    has_flats = set()
+    for t, (r0, c0, h, w) in enumerate(tiles):
+        fh = _with_halo(filled, r0, c0, h, w, np.nan)
+        f = fh[1:-1, 1:-1]
+        valid = ~np.isnan(f)
+        outlets = edge_and_nodata_cells(~np.isnan(fh))[1:-1, 1:-1]
+        drops = np.stack([(f - fn) / length for fn, length in zip(_neighbors(fh, h, w), d8_lengths)])
+        drops[np.isnan(drops)] = -np.inf
+        steepest = np.argmax(drops, axis=0)
+        has_lower = np.max(drops, axis=0) > 0
+
+        code = np.where(has_lower, steepest, unresolved_code).astype(np.uint8)
+        code[outlets] = outlet_code
+        code[~valid] = nodata_code
+        receiver[r0:r0 + h, c0:c0 + w] = code
+        d = np.where(code == unresolved_code, far, 0).astype(np.int32)
+        d[~valid] = -1
+        dist[r0:r0 + h, c0:c0 + w] = d
+        if (code == unresolved_code).any():
+            has_flats.add(t)
+
+    #flat distances, exchanged between tiles until nothing changes
+    index = {(r0, c0): t for t, (r0, c0, h, w) in enumerate(tiles)}
+    dirty = set(has_flats)
+    while dirty:
+        t = min(dirty)
+        dirty.discard(t)
+        r0, c0, h, w = tiles[t]
+        if _flat_distances(filled, receiver, dist, r0, c0, h, w):
+            for dr in (-tile_size, 0, tile_size):
+                for dc in (-tile_size, 0, tile_size):
+                    u = index.get((r0 + dr, c0 + dc))
+                    if u is not None and u != t and u in has_flats:
+                        dirty.add(u)
+
+    for r0, c0, h, w in tiles:
+        fh = _with_halo(filled, r0, c0, h, w, np.nan)
+        dh = _with_halo(dist, r0, c0, h, w, -1)
+        zh = _with_halo(z, r0, c0, h, w, np.nan)
+        code = np.array(receiver[r0:r0 + h, c0:c0 + w])
+        f, d, zt = fh[1:-1, 1:-1], dh[1:-1, 1:-1], zh[1:-1, 1:-1]
+
+        #cells on flats drain to the first neighbor on the same flat that is one step
+        #closer to its edge
+        flat = code == unresolved_code
+        for k, (fn, dn) in enumerate(zip(_neighbors(fh, h, w), _neighbors(dh, h, w))):
+            take = flat & (code == unresolved_code) & (fn == f) & (dn >= 0) & (dn == d - 1)
+            code[take] = k
+        receiver[r0:r0 + h, c0:c0 + w] = code
+
+        s = np.zeros((h, w))
+        for k, (zn, length) in enumerate(zip(_neighbors(zh, h, w), d8_lengths)):
+            to_k = code == k
+            s[to_k] = (zt[to_k] - zn[to_k]) / (length * cellsize)
+        s = np.maximum(s, 0)
+        s[np.isnan(zt)] = np.nan
+        slope[r0:r0 + h, c0:c0 + w] = s
+
+#shortest D8 distance from every flat cell of one tile to the edge of its flat, given
+#the current distances in the tile and its halo. Returns True if a distance on the edge
+#of the tile changed (so neighboring tiles need to be updated too).
+def _flat_distances(filled, receiver, dist, r0, c0, h, w):
+    fh = _with_halo(filled, r0, c0, h, w, np.nan)
+    dh = _with_halo(dist, r0, c0, h, w, -1)
+    f, d = fh[1:-1, 1:-1], dh[1:-1, 1:-1].copy()
+    flat = np.asarray(receiver[r0:r0 + h, c0:c0 + w]) == unresolved_code
+
+    #candidate distances from neighbors on the same flat (including the halo)
+    cand = np.full((h, w), far, dtype=np.int64)
+    for fn, dn in zip(_neighbors(fh, h, w), _neighbors(dh, h, w)):
+        ok = flat & (fn == f) & (dn >= 0) & (dn < far)
+        cand[ok] = np.minimum(cand[ok], dn[ok].astype(np.int64) + 1)
+    start = flat & (cand < d)
+    if not start.any():
+        return False
+
+    before = d.copy()
+    start_idx = np.flatnonzero(start)
+    arrays = loop_arrays(d.ravel().astype(np.int64), f.ravel().astype(np.float64), flat.ravel(),
+                         np.array(d8_offsets, dtype=np.int64), start_idx, cand.ravel()[start_idx])
+    _flat_flood(*arrays, h, w)
+    d = np.asarray(arrays[0]).reshape(h, w).astype(np.int32)
+
+    dist[r0:r0 + h, c0:c0 + w] = d
+    changed = d != before
+    return bool(changed[[0, -1], :].any() or changed[:, [0, -1]].any())
+
+#shortest-path search of _flat_distances over the flattened tile: d (distances) is updated
+#from the start cells start_idx, at distances start_d, along cells of the same flat
+@compiled
+def _flat_flood(d, f, flat, offsets, start_idx, start_d, h, w):
+    heap = [(0, 0)]
+    heap.pop()
+    for k in range(len(start_idx)):
+        d[start_idx[k]] = start_d[k]
+        heap.append((start_d[k], start_idx[k]))
+    heapq.heapify(heap)
+    while heap:
+        dd, i = heapq.heappop(heap)
+        if dd > d[i]:
+            continue
+        r, c = i // w, i % w
+        for k in range(len(offsets)):
+            rr, cc = r + offsets[k][0], c + offsets[k][1]
+            if 0 <= rr < h and 0 <= cc < w:
+                j = rr * w + cc
+                if flat[j] and f[j] == f[i] and d[j] > dd + 1:
+                    d[j] = dd + 1
+                    heapq.heappush(heap, (dd + 1, j))
+
+#global (row, col) of the receiver of every cell of a tile; outlets and nodata cells
+#point to themselves
+def _receiver_cells(code, r0, c0, h, w):
+    rows, cols = np.mgrid[r0:r0 + h, c0:c0 + w]
+    rr, cc = rows.copy(), cols.copy()
+    for k, (dr, dc) in enumerate(d8_offsets):
+        to_k = code == k
+        rr[to_k] += dr
+        cc[to_k] += dc
+    return rows, cols, rr, cc
+
+#step 4: drainage area
+def _accumulate(filled, receiver, dist, area, tiles, cell_area):
+    ncols = filled.shape[1]
+    exits = []          #(filled, dist, exit cell, receiver cell, local area) of every exit
+    terminal_of = {}    #perimeter cell -> cell where flow from it leaves its tile (or -1)
+    for r0, c0, h, w in tiles:
+        a, rec_local, inside, code, rr, cc = _accumulate_tile(filled, receiver, dist,
+                                                              r0, c0, h, w, cell_area, None)
+        rows, cols = np.mgrid[r0:r0 + h, c0:c0 + w]
+        glob = (rows * ncols + cols).ravel()
+
+        #follow receivers inside the tile to where the flow leaves it
+        is_exit = (code.ravel() < outlet_code) & ~inside
+        term = np.where(is_exit | (rec_local < 0), np.arange(h * w), rec_local)
+        while True:
+            nxt = term[term]
+            if np.array_equal(nxt, term):
+                break
+            term = nxt
+        perim = np.zeros((h, w), dtype=bool)
+        perim[[0, -1], :] = True
+        perim[:, [0, -1]] = True
+        perim = perim.ravel() & (code.ravel() != nodata_code)
+        for p, tp in zip(glob[perim].tolist(), term[perim].tolist()):
+            terminal_of[p] = glob[tp] if is_exit[tp] else -1
+
+        f = np.asarray(filled[r0:r0 + h, c0:c0 + w]).ravel()
+        d = np.asarray(dist[r0:r0 + h, c0:c0 + w]).ravel()
+        for i in np.flatnonzero(is_exit).tolist():
+            exits.append((f[i], d[i], int(glob[i]),
+                          int(rr.flat[i] * ncols + cc.flat[i]), a.flat[i]))
+
+    #pass the flow leaving every tile on to the tile it enters, from the highest exit
+    #cell to the lowest so every exit's inflow is complete before it is passed on
+    exits.sort(key=lambda e: (-e[0], -e[1]))
+    through = {}
+    inflow = {}
+    for f, d, x, e, local in exits:
+        total = local + through.get(x, 0.0)
+        inflow[e] = inflow.get(e, 0.0) + total
+        t = terminal_of.get(e, -1)
+        if t >= 0:
+            through[t] = through.get(t, 0.0) + total
+
+    inflow_cells = np.array(sorted(inflow), dtype=np.int64)
+    inflow = (inflow_cells, np.array([inflow[e] for e in inflow_cells.tolist()], dtype=np.float64))
+    for r0, c0, h, w in tiles:
+        a = _accumulate_tile(filled, receiver, dist, r0, c0, h, w, cell_area, inflow)[0]
+        area[r0:r0 + h, c0:c0 + w] = a
+
+#accumulate drainage area inside one tile, adding inflow (sorted global cells and the
+#areas flowing into them, or None) where flow enters the tile. Cells are visited from high to low filled elevation (and, on flats,
+#from far from to close to the edge of the flat), so every cell is visited after all of
+#its donors.
+def _accumulate_tile(filled, receiver, dist, r0, c0, h, w, cell_area, inflow):
+    ncols = filled.shape[1]
+    code = np.asarray(receiver[r0:r0 + h, c0:c0 + w])
+    f = np.asarray(filled[r0:r0 + h, c0:c0 + w]).ravel()
+    d = np.asarray(dist[r0:r0 + h, c0:c0 + w]).ravel()
+    rows, cols, rr, cc = _receiver_cells(code, r0, c0, h, w)
+    inside = ((rr >= r0) & (rr < r0 + h) & (cc >= c0) & (cc < c0 + w)).ravel()
+    rec_local = ((rr - r0) * w + (cc - c0)).ravel()
+    sink = (code.ravel() >= outlet_code)
+    rec_local[sink | ~inside] = -1
+
+    valid = code.ravel() != nodata_code
+    a = np.where(valid, cell_area, 0.0)
+    if inflow is not None and len(inflow[0]):
+        glob = (rows * ncols + cols).ravel()
+        k = np.minimum(np.searchsorted(inflow[0], glob), len(inflow[0]) - 1)
+        enters = valid & (inflow[0][k] == glob)
+        a[enters] += inflow[1][k[enters]]
+
+    order = np.lexsort((-d, -np.nan_to_num(f, nan=-np.inf)))
+    order = order[rec_local[order] >= 0]
+    arrays = loop_arrays(a, rec_local, order)
+    _pass_down(*arrays)
+    a = np.array(arrays[0], dtype=np.float64)
+    a[~valid] = np.nan
+    return a.reshape(h, w), rec_local, inside, code, rr, cc
+
+
+#add the drainage area of every cell to its receiver rec[i], in the order given
+@compiled
+def _pass_down(a, rec, order):
+    for i in order:
+        a[rec[i]] += a[i]
+
+#products of route_regional that differ between a single-tile run and runs with each of
+#tile_sizes on the DEM at dem_path: list of (tile_size, product) pairs, empty if routing
+#does not depend on the tile size (as it must not)
+def tile_size_mismatches(dem_path, work_dir, tile_sizes, dtype=np.float64):
+    with rasterio.open(dem_path) as dem:
+        reference = route_regional(dem_path, os.path.join(work_dir, 'one_tile'), max(dem.shape),
+                                   dtype=dtype)
+    mismatches = []
+    for tile_size in tile_sizes:
+        routed = route_regional(dem_path, os.path.join(work_dir, 'tile_%d' % tile_size),
+                                tile_size, dtype=dtype)
+        for name in products:
+            if not np.array_equal(getattr(reference, name), getattr(routed, name), equal_nan=True):
+                mismatches.append((tile_size, name))
+    return mismatches
+
+#run as a script: check that random DEMs with flats and nodata, square and non-square, some
+#shorter or narrower than one tile, are routed the same with every tile size
+if __name__ == '__main__':
+    import tempfile
+    from rasterio.transform import from_origin
+
+    cases = [((40, 40), [16, 8]), ((10, 100), [16, 7, 3]), ((20, 70), [32, 16, 9]),
+             ((70, 20), [32, 16, 9]), ((33, 57), [64, 10, 5])]
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for shape, tile_sizes in cases:
+            for seed in range(3):
+                rng = np.random.default_rng(seed)
+                z = np.round(rng.random(shape) * 20 + 0.3 * np.add.outer(np.arange(shape[0]),
+                                                                        np.arange(shape[1])), 1)
+                z[rng.random(shape) < 0.02] = -9999
+                dem_path = os.path.join(tmp, 'dem.tif')
+                with rasterio.open(dem_path, 'w', driver='GTiff', width=shape[1], height=shape[0],
+                                   count=1, dtype='float64', nodata=-9999,
+                                   transform=from_origin(0, shape[0] * 10, 10, 10)) as dst:
+                    dst.write(z, 1)
+                mismatches = tile_size_mismatches(dem_path, os.path.join(tmp, 'routing'), tile_sizes)
+                failed |= bool(mismatches)
+                print(shape, 'seed', seed, 'OK' if not mismatches else 'differs: %s' % mismatches)
+    sys.exit(1 if failed else 0)
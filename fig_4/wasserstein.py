@@ -0,0 +1,134 @@
+########################################################################
+#1-D Wasserstein distances between pre- and post-mining distributions (Figure 4 data).
+
+#Brief description: calculate_watershed_metrics.py used to call POT's ot.wasserstein_1d
+#four times per watershed (elevation, drainage area, slope, and area-slope product), and
+#every call sorted both of its input arrays again. Here every pre- and post-mining
+#distribution is sorted exactly once into a Distribution, which then serves the
+#Wasserstein distance, its quantiles, and its mean, and distributions() builds the
+#Distributions of all variables of a watershed in one call. POT is no longer imported.
+
+#For very large watersheds, distributions() can instead summarize every variable by a
+#streaming quantile sketch (QuantileSketch). The values then arrive in blocks (e.g. a few
+#rows of a raster window at a time), each block is added to the sketches and dropped, and
+#a sketch never holds more than a fixed number of weighted points, so memory does not grow
+#with the number of cells. Means are exact either way; Wasserstein distances from a sketch
+#are approximate, with an error that shrinks as sketch_size grows.
+
+#float32 samples are sorted and kept as float32 (half the memory); means, differences,
+#and sums are taken in float64.
+
+########################################################################
+
+import numpy as np
+
+#p-th power of the p-Wasserstein distance between two 1-D distributions given by sorted
+#values and optional weights (equal weights if None), i.e. the same quantity as
+#ot.wasserstein_1d(u_values, v_values, u_weights, v_weights, p). The distance is the
+#integral over q in (0, 1] of |F_u^-1(q) - F_v^-1(q)|^p, which for step quantile
+#functions is a sum over the merged breakpoints of both cumulative distributions.
+def wasserstein_1d(u_values, v_values, u_weights=None, v_weights=None, p=2):
+    if len(u_values) == 0 or len(v_values) == 0:
+        return np.nan
+    u_cdf = _cdf(len(u_values), u_weights)
+    v_cdf = _cdf(len(v_values), v_weights)
+    qs = np.unique(np.concatenate([u_cdf, v_cdf]))
+    u_q = u_values[np.minimum(np.searchsorted(u_cdf, qs), len(u_values) - 1)].astype(np.float64)
+    v_q = v_values[np.minimum(np.searchsorted(v_cdf, qs), len(v_values) - 1)]
+    return np.sum(np.diff(qs, prepend=0.0) * np.abs(u_q - v_q)**p)
+
+#cumulative distribution at each sorted value, ending at exactly 1
+def _cdf(n, weights):
+    if weights is None:
+        cdf = np.arange(1, n + 1) / n
+    else:
+        cdf = np.cumsum(weights) / np.sum(weights)
+    cdf[-1] = 1.0
+    return cdf
+
+class Distribution:
+
+    #values: the sample (any shape, flattened; float32 samples stay float32), sorted in full
+    def __init__(self, values):
+        values = np.asarray(values).ravel()
+        if values.dtype not in (np.float32, np.float64):
+            values = values.astype(np.float64)
+        self.size = values.size
+        self.mean = np.mean(values, dtype=np.float64) if values.size else np.nan
+        self.values, self.weights = np.sort(values), None
+
+    #Distribution summarized by a QuantileSketch (with the exact size and mean of the
+    #stream the sketch was fed)
+    @classmethod
+    def from_sketch(cls, sketch):
+        distribution = cls.__new__(cls)
+        distribution.size = sketch.count
+        distribution.mean = sketch.total / sketch.count if sketch.count else np.nan
+        distribution.values, distribution.weights = sketch.values, sketch.weights
+        return distribution
+
+    #value of the (inverted) cumulative distribution at probability q (scalar or array)
+    def quantile(self, q):
+        if self.size == 0:
+            return np.full(np.shape(q), np.nan)[()]
+        cdf = _cdf(len(self.values), self.weights)
+        return self.values[np.minimum(np.searchsorted(cdf, q), len(self.values) - 1)]
+
+    #p-Wasserstein distance to another Distribution
+    def wasserstein(self, other, p=2):
+        return wasserstein_1d(self.values, other.values, self.weights, other.weights, p)**(1 / p)
+
+class QuantileSketch:
+
+    #summary of a stream of values by at most size weighted points. Whenever the summary
+    #grows past size points it is compressed by merging runs of neighboring points that
+    #hold equal shares of the total weight into their weighted mean, so the total weight
+    #and the mean of the stream are kept exactly.
+    #count and total of the values seen so far are kept as well, for an exact mean.
+    def __init__(self, size=10000):
+        self.size = size
+        self.values = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.count = 0
+        self.total = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.count += values.size
+        self.total += np.sum(values)
+        merged = np.concatenate([self.values, values])
+        weights = np.concatenate([self.weights, np.ones(values.size)])
+        order = np.argsort(merged, kind='stable')
+        self.values, self.weights = merged[order], weights[order]
+        if len(self.values) > self.size:
+            self._compress()
+
+    def _compress(self):
+        cum = np.cumsum(self.weights)
+        mid = cum - self.weights / 2
+        bins = np.minimum((mid / cum[-1] * self.size).astype(np.int64), self.size - 1)
+        weights = np.bincount(bins, weights=self.weights, minlength=self.size)
+        sums = np.bincount(bins, weights=self.weights * self.values, minlength=self.size)
+        keep = weights > 0
+        self.values, self.weights = sums[keep] / weights[keep], weights[keep]
+
+#Distributions of the variables names from blocks, an iterable of dicts of arrays with
+#those keys (a watershed's cells, in one block or a few rows at a time). Without
+#sketch_size, all blocks of a variable are joined and sorted once. With sketch_size, each
+#block is added to a QuantileSketch of that size per variable and dropped, so memory is
+#bounded by sketch_size and the largest block rather than by the number of cells; samples
+#of up to sketch_size values stay exact.
+def distributions(blocks, names, sketch_size=None):
+    if sketch_size is None:
+        parts = {name: [] for name in names}
+        for block in blocks:
+            for name in names:
+                parts[name].append(np.asarray(block[name]).ravel())
+        return {name: Distribution(parts[name][0] if len(parts[name]) == 1
+                                   else np.concatenate(parts[name] or [np.zeros(0)]))
+                for name in names}
+    sketches = {name: QuantileSketch(sketch_size) for name in names}
+    for block in blocks:
+        for name in names:
+            sketches[name].update(block[name])
+    return {name: Distribution.from_sketch(sketches[name]) for name in names}
@@ -0,0 +1,76 @@
+########################################################################
+#Checkpointing for calculate_watershed_metrics.py (Figure 4 data).
+
+#Brief description: calculate_watershed_metrics.py streams every finished watershed to a
+#checkpoint csv (see watershed_results.py) together with two keys:
+#
+#   files_key:  checksum of TauOld.asc, TauNew.asc, mine_mask.asc and the routing
+#               parameters used for the run
+#   window_key: checksum of the pre-mining, post-mining and mine mask data inside
+#               the watershed and the routing parameters
+#
+#When the script is restarted, a watershed whose files_key still matches is reused
+#without reading any data. If one of the input rasters has changed (e.g. after a mine
+#mask update), the watershed is masked again and only routed if its window_key no longer
+#matches, so that only watersheds whose own data or parameters changed are recomputed.
+
+########################################################################
+
+import os
+import csv
+import json
+import hashlib
+
+key_columns = ['files_key', 'window_key']
+
+#sha256 of a file, read in chunks so that multi-GB DEMs are never held in memory
+def file_checksum(path, chunk_size=1 << 24):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def params_checksum(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+#key for a whole run: the checksums of the input rasters plus the routing parameters
+def files_key(paths, params):
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(file_checksum(path).encode())
+    h.update(params_checksum(params).encode())
+    return h.hexdigest()
+
+#key for a single watershed: the masked data of every input raster plus the routing
+#parameters. The array shapes are included so that windows with the same bytes but a
+#different crop cannot collide.
+def window_key(arrays, params):
+    h = hashlib.sha256()
+    for ar in arrays:
+        h.update(str((ar.shape, ar.dtype.str)).encode())
+        h.update(memoryview(ar).cast('B') if ar.flags.c_contiguous else ar.tobytes())
+    h.update(params_checksum(params).encode())
+    return h.hexdigest()
+
+#read a checkpoint csv written by WatershedResults into {huc12: (keys, metrics)}, with
+#huc12 as a string. Rows are
+#appended as watersheds finish, so when a huc12 appears more than once the last row wins.
+#Returns an empty checkpoint if the file does not exist or was written for other columns.
+def load_checkpoint(path, columns):
+    checkpoint = {}
+    if not os.path.exists(path):
+        return checkpoint
+    header = ['huc12'] + key_columns + list(columns)
+    with open(path, newline='') as f:
+        lines = f.readlines()
+    if lines and not lines[-1].endswith('\n'):
+        lines = lines[:-1] #partially written row from an interrupted run
+    reader = csv.reader(lines)
+    if next(reader, None) != header:
+        return checkpoint
+    for row in reader:
+        keys = dict(zip(key_columns, row[1:3]))
+        metrics = {col: float(value) for col, value in zip(columns, row[3:])}
+        checkpoint[row[0]] = (keys, metrics)
+    return checkpoint
@@ -0,0 +1,94 @@
+########################################################################
+#Result accumulator for calculate_watershed_metrics.py (Figure 4 data).
+
+#Brief description: the watershed loop used to write every variable into a pandas
+#DataFrame (which also carried the full polygon geometry) with one df.loc assignment per
+#variable per watershed. Each of those assignments scans the whole frame, so the
+#bookkeeping grew quadratically with the number of watersheds. WatershedResults instead
+#keeps one preallocated float64 array per variable, indexed by huc12, optionally streams
+#each finished row to a csv file as soon as it is added, and only builds the DataFrame
+#(and joins the geometry back on by huc12) once, when the results are written.
+
+########################################################################
+
+import os
+import csv
+import numpy as np
+import pandas as pd
+
+class WatershedResults:
+
+    #huc12s gives the row order of the output; columns are the names of the variables
+    #that will be added for each watershed. If stream_path is given, every row is
+    #appended to that csv file as soon as it is added, together with any key_columns
+    #(e.g. the input checksums used by watershed_checkpoint.py). An existing stream file
+    #with the same header is appended to rather than overwritten so that a restarted run
+    #keeps the rows that were already finished.
+    def __init__(self, huc12s, columns, stream_path=None, key_columns=()):
+        self.huc12 = np.asarray(huc12s)
+        self.columns = list(columns)
+        self.key_columns = list(key_columns)
+        self.row_of = {huc12: row for row, huc12 in enumerate(self.huc12)}
+        self.values = {col: np.full(len(self.huc12), np.nan) for col in self.columns}
+        self.done = np.zeros(len(self.huc12), dtype=bool)
+
+        self._stream = None
+        if stream_path is not None:
+            header = ['huc12'] + self.key_columns + self.columns
+            append = False
+            if os.path.exists(stream_path):
+                with open(stream_path, newline='') as f:
+                    append = next(csv.reader(f), None) == header
+            if append:
+                _drop_partial_row(stream_path)
+            self._stream = open(stream_path, 'a' if append else 'w', newline='')
+            self._writer = csv.writer(self._stream)
+            if not append:
+                self._writer.writerow(header)
+
+    def __len__(self):
+        return int(self.done.sum())
+
+    #store the variables calculated for one watershed; variables missing from metrics
+    #are left as NaN. keys holds the values of the key_columns; stream=False skips the
+    #stream file for rows that are already in it.
+    def add(self, huc12, metrics, keys=None, stream=True):
+        row = self.row_of[huc12]
+        for col in self.columns:
+            self.values[col][row] = metrics.get(col, np.nan)
+        self.done[row] = True
+
+        if stream and self._stream is not None:
+            keys = keys or {}
+            self._writer.writerow([huc12] + [keys[col] for col in self.key_columns]
+                                  + [metrics.get(col, np.nan) for col in self.columns])
+            self._stream.flush()
+            os.fsync(self._stream.fileno())
+
+    #build the output table in a single step. geometry, if given, is a (geo)DataFrame with
+    #'huc12' and 'geometry' columns that is joined onto the results by huc12.
+    def to_frame(self, geometry=None):
+        df = pd.DataFrame({'huc12': self.huc12})
+        if geometry is not None:
+            df = df.merge(geometry[['huc12', 'geometry']], on='huc12', how='left')
+        for col in self.columns:
+            df[col] = self.values[col]
+        df['counter'] = np.arange(len(self.huc12))
+        return df
+
+    def write(self, path, geometry=None):
+        self.close()
+        self.to_frame(geometry).to_csv(path)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+#a run that was killed while writing leaves an unterminated last line in the stream
+#file; cut it off so that appended rows start on a line of their own
+def _drop_partial_row(path):
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
@@ -0,0 +1,105 @@
+########################################################################
+#Zonal statistics for all HUC-12 watersheds in a single pass (Figure 4 data).
+
+#Brief description: instead of masking the pre-mining DEM, post-mining DEM, and mine
+#extent rasters once per watershed (three masked reads per polygon), the watershed
+#polygons are rasterized into an integer label grid aligned with the DEM and every
+#per-watershed statistic is accumulated with np.bincount while the rasters are read
+#once, block of rows by block of rows. The label grid is rasterized block by block as
+#well, using only the polygons that intersect the block, so memory stays bounded by the
+#block size rather than the size of the regional DEM. Blocks that no polygon touches
+#are not read at all.
+
+#Adding a new zonal variable only requires one more bincount in the loop below.
+
+########################################################################
+
+import numpy as np
+import pandas as pd
+from rasterio import features
+from rasterio.enums import MergeAlg
+from rasterio.windows import Window
+from rasterio.windows import bounds as window_bounds
+from shapely import STRtree
+from shapely.geometry import box
+from shapely.geometry import shape as to_shapely
+
+#variables returned by zonal_statistics (besides per_Ross and per_mined)
+zonal_columns = ['n_cells', 'n_dem_cells', 'pre_zonal_mean_elev', 'post_zonal_mean_elev']
+
+#calculate per-watershed statistics for a list of GeoJSON-like geometries from open
+#rasterio datasets of the pre-mining DEM, post-mining DEM and mine extent, which must be
+#on the same grid. Returns a DataFrame with one row per geometry (in the same order):
+#   n_cells:              number of cells inside the watershed
+#   n_dem_cells:          number of those cells with pre-mining DEM data
+#   per_Ross:             proportion of the watershed area covered by the pre-mining DEM
+#   per_mined:            mined cells / cells in the watershed's bounding window, the
+#                         same definition as in calculate_watershed_metrics.py
+#   pre/post_zonal_mean_elev: mean DEM elevation over the cells with data
+def zonal_statistics(geometries, pre_elev, post_elev, mine_mask, block_rows=512):
+    for ds in (post_elev, mine_mask):
+        if ds.shape != pre_elev.shape or ds.transform != pre_elev.transform:
+            raise ValueError('%s is not on the same grid as %s' % (ds.name, pre_elev.name))
+
+    polygons = [to_shapely(geometry) for geometry in geometries]
+    n = len(polygons)
+    tree = STRtree(polygons)
+    label_dtype = 'uint16' if n < np.iinfo('uint16').max else 'uint32'
+    height, width = pre_elev.shape
+
+    #label 0 is "outside every watershed"; watershed i has label i + 1
+    n_cells = np.zeros(n + 1)
+    n_pre = np.zeros(n + 1)
+    n_post = np.zeros(n + 1)
+    pre_sum = np.zeros(n + 1)
+    post_sum = np.zeros(n + 1)
+    n_mined = np.zeros(n + 1)
+
+    for row_off in range(0, height, block_rows):
+        window = Window(0, row_off, width, min(block_rows, height - row_off))
+        hits = tree.query(box(*window_bounds(window, pre_elev.transform)))
+        if len(hits) == 0:
+            continue
+
+        labels = features.rasterize(((polygons[i], i + 1) for i in hits),
+                                    out_shape=(window.height, window.width),
+                                    transform=pre_elev.window_transform(window),
+                                    fill=0, dtype=label_dtype, merge_alg=MergeAlg.replace)
+        inside = labels > 0
+        if not inside.any():
+            continue
+        lab = labels[inside]
+
+        pre = pre_elev.read(1, window=window, masked=True)
+        post = post_elev.read(1, window=window, masked=True)
+        mined = mine_mask.read(1, window=window, masked=True).filled(0)[inside] == 1
+
+        pre_valid = ~np.ma.getmaskarray(pre)[inside]
+        post_valid = ~np.ma.getmaskarray(post)[inside]
+
+        n_cells += np.bincount(lab, minlength=n + 1)
+        n_pre += np.bincount(lab, weights=pre_valid, minlength=n + 1)
+        n_post += np.bincount(lab, weights=post_valid, minlength=n + 1)
+        pre_sum += np.bincount(lab, weights=np.where(pre_valid, pre.data[inside], 0.0), minlength=n + 1)
+        post_sum += np.bincount(lab, weights=np.where(post_valid, post.data[inside], 0.0), minlength=n + 1)
+        n_mined += np.bincount(lab, weights=mined, minlength=n + 1)
+
+    #size of the cropped window rasterio.mask would read for each watershed
+    window_cells = np.array([_window_size(pre_elev, geometry) for geometry in geometries])
+    area = np.array([polygon.area for polygon in polygons])
+    cell_area = abs(pre_elev.transform.a * pre_elev.transform.e)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({'n_cells': n_cells[1:].astype('int64'),
+                             'n_dem_cells': n_pre[1:].astype('int64'),
+                             'per_Ross': np.minimum(n_pre[1:] * cell_area / area, 1.0),
+                             'per_mined': n_mined[1:] / window_cells,
+                             'pre_zonal_mean_elev': pre_sum[1:] / n_pre[1:],
+                             'post_zonal_mean_elev': post_sum[1:] / n_post[1:]})
+
+def _window_size(dataset, geometry):
+    try:
+        window = features.geometry_window(dataset, [geometry])
+    except ValueError: #watershed entirely outside the raster
+        return np.nan
+    return window.height * window.width
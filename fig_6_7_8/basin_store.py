@@ -0,0 +1,145 @@
+########################################################################
+#Per-DEM elevation statistics shared by fig7.py and fig8.py (Figures 7-8).
+
+#Brief description: both figures drop the closed depressions that lie below the 20th
+#percentile of pre-mining elevation in their basin (valley bottoms, which are unmined and
+#full of DEM artifacts). Loading ten whole DEMs with np.genfromtxt just to get one number
+#per basin takes minutes and gigabytes. elevation_percentile() instead computes the
+#percentiles of a DEM once, in a streaming pass over its rows, and stores them in a small
+#JSON file next to the DEM (<dem>.stats.json); later calls read them from there. The
+#stored file is recomputed when the DEM changes (different size or modification time).
+
+#The percentiles are exact (identical to np.percentile of the cells with elevation > 0,
+#the valid cells of the study DEMs) but the DEM is never held in memory: a first pass
+#counts the values in fine histogram bins (the leading bits of their float32
+#representation, which sort the same way as the values), a second pass keeps only the
+#values of the bins that hold the ranks needed for the requested percentiles.
+
+########################################################################
+
+import os
+import json
+import numpy as np
+
+from depression_statistics import read_ascii_header
+
+#percentiles stored for every DEM (any other percentile is added to the store when it is
+#first asked for)
+default_percentiles = list(range(0, 101))
+
+#number of DEM rows parsed at a time
+chunk_rows = 256
+
+#bits of the float32 representation dropped to get the histogram bin of a value (12: 2^19
+#bins over the positive floats, about 0.05% of the value wide)
+bin_shift = 12
+
+#path of the stored statistics of a DEM
+def stats_path(dem_path):
+    return dem_path + '.stats.json'
+
+#the value at percentile q of the cells of the ESRI ASCII DEM at dem_path with elevation
+#> 0, read from the store (computed and stored first if needed)
+def elevation_percentile(dem_path, q):
+    return elevation_percentiles(dem_path, [q])[q]
+
+#dict of percentile -> value for the requested percentiles of a DEM (see
+#elevation_percentile)
+def elevation_percentiles(dem_path, percentiles=default_percentiles):
+    stats = _load(dem_path)
+    missing = [q for q in percentiles if _key(q) not in stats['percentiles']]
+    if missing:
+        wanted = sorted(set(missing) | set(default_percentiles) | set(map(float, stats['percentiles'])))
+        stats = dem_statistics(dem_path, wanted)
+        _save(dem_path, stats)
+    return {q: stats['percentiles'][_key(q)] for q in percentiles}
+
+#statistics of the cells with elevation > 0 of a DEM: count, min, max, mean, and the
+#requested percentiles (as a dict keyed by the percentile as a string)
+def dem_statistics(dem_path, percentiles=default_percentiles):
+    #pass 1: histogram of the valid values
+    counts = np.zeros(1 << (31 - bin_shift), dtype=np.int64)
+    total, low, high = 0.0, np.inf, -np.inf
+    for values in _chunks(dem_path):
+        counts += np.bincount(_bins(values), minlength=counts.size)
+        total += values.sum()
+        low, high = min(low, values.min(initial=np.inf)), max(high, values.max(initial=-np.inf))
+    n = int(counts.sum())
+    stats = {'count': n, 'percentiles': {}}
+    if n == 0:
+        stats.update(min=None, max=None, mean=None)
+        stats['percentiles'] = {_key(q): None for q in percentiles}
+        return stats
+    stats.update(min=float(low), max=float(high), mean=total / n)
+
+    #ranks needed for every percentile (np.percentile's linear interpolation between the
+    #values at floor(h) and ceil(h), h = q / 100 (n - 1)), and the bins they fall in
+    h = {q: q / 100. * (n - 1) for q in percentiles}
+    ranks = sorted({int(np.floor(v)) for v in h.values()} | {int(np.ceil(v)) for v in h.values()})
+    ends = np.cumsum(counts)
+    bins = np.unique(np.searchsorted(ends, ranks, side='right'))
+
+    #pass 2: the values of those bins, sorted, give the values at the ranks
+    kept = [values[np.isin(_bins(values), bins)] for values in _chunks(dem_path)]
+    kept = np.sort(np.concatenate(kept))
+    starts = ends - counts
+    kept_starts = np.concatenate([[0], np.cumsum(counts[bins])])
+
+    def value(rank):
+        b = np.searchsorted(ends, rank, side='right')
+        return kept[kept_starts[np.searchsorted(bins, b)] + rank - starts[b]]
+
+    for q, hq in h.items():
+        lo, hi = int(np.floor(hq)), int(np.ceil(hq))
+        v_lo, v_hi, t = value(lo), value(hi), hq - lo
+        #interpolated the way np.percentile does it, so the results are bit-identical
+        v = v_hi - (v_hi - v_lo) * (1 - t) if t >= 0.5 else v_lo + (v_hi - v_lo) * t
+        stats['percentiles'][_key(q)] = float(v)
+    return stats
+
+#values (float64) of the cells with elevation > 0 of a DEM, chunk_rows rows at a time
+def _chunks(dem_path):
+    skip = len(read_ascii_header(dem_path))
+    with open(dem_path) as f:
+        for _ in range(skip):
+            next(f)
+        while True:
+            lines = [line for _, line in zip(range(chunk_rows), f)]
+            if not lines:
+                break
+            values = np.array(''.join(lines).split(), dtype=np.float64)
+            yield values[values > 0]
+
+#histogram bins of positive values (monotonic in the value)
+def _bins(values):
+    return values.astype(np.float32).view(np.int32) >> bin_shift
+
+def _key(q):
+    return repr(float(q))
+
+#stored statistics of a DEM, or empty ones if there are none or the DEM has changed
+def _load(dem_path):
+    try:
+        with open(stats_path(dem_path)) as f:
+            stats = json.load(f)
+        if stats['source'] == _source(dem_path):
+            return stats
+    except (OSError, ValueError, KeyError):
+        pass
+    return {'percentiles': {}}
+
+def _save(dem_path, stats):
+    stats = dict(stats, source=_source(dem_path))
+    path = stats_path(dem_path)
+    tmp_path = '%s.%d.partial' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(stats, f, indent=1)
+        os.replace(tmp_path, path)
+    except OSError: #read-only DEM directory: the statistics are recomputed next time
+        pass
+
+#size and modification time of a DEM, which identify its version
+def _source(dem_path):
+    st = os.stat(dem_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
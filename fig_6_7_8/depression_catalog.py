@@ -0,0 +1,153 @@
+########################################################################
+#Columnar catalog of the closed depressions of all basins and epochs (Figures 7-8).
+
+#Brief description: fig7.py and fig8.py used to read ten depression tables (one per basin
+#and pre-/post-mining epoch) and filter each of them again for every histogram they drew.
+#A DepressionCatalog holds all depressions in one table with typed columns (basin and epoch
+#as categories, the statistics as float64), sorted so that the depressions of a basin and
+#epoch are one contiguous block. A query applies the mined/unmined and elevation
+#predicates once, as vectorized comparisons over the whole catalog, and returns the
+#selected values, their sums, or their histograms for every (basin, epoch) group; the
+#histograms of all groups come from a single np.bincount.
+
+#open_catalog() keeps the catalog on disk as Parquet (if pyarrow is installed; otherwise as
+#a pickle) and rebuilds it from the depression tables whenever one of them is newer. Only
+#the columns and basins asked for are read from a Parquet catalog.
+
+########################################################################
+
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError: #the catalog is then stored as a pickle
+    pyarrow = None
+
+#types of the depression table columns (see depression_statistics.table_columns); other
+#columns are kept as pandas reads them
+column_dtypes = {'fid': 'int64', 'cat': 'int64', 'value': 'int64', 'area (m^2)': 'float64',
+                 'prop_of_sink_minedmean': 'float64', '_ELEVmean': 'float64',
+                 '_ELEVFILLEDmean': 'float64', 'volume (m^3)': 'float64'}
+
+class DepressionCatalog:
+
+    #table: one row per depression, with 'basin' and 'epoch' columns
+    def __init__(self, table):
+        table = table.astype({'basin': 'category', 'epoch': 'category'})
+        self.table = table.sort_values(['basin', 'epoch'], kind='stable').reset_index(drop=True)
+
+        #(basin, epoch) -> slice of the rows of the group
+        basin = self.table['basin'].cat.codes.to_numpy()
+        epoch = self.table['epoch'].cat.codes.to_numpy()
+        starts = np.flatnonzero(np.diff(basin) | np.diff(epoch)) + 1
+        starts = np.concatenate([[0], starts]) if len(basin) else starts
+        ends = np.append(starts[1:], len(basin))
+        basins, epochs = self.table['basin'].cat.categories, self.table['epoch'].cat.categories
+        self.groups = {(basins[basin[s]], epochs[epoch[s]]): slice(s, e)
+                       for s, e in zip(starts, ends)}
+
+    #catalog of the depression tables in sources, a dict of (basin, epoch) -> CSV path or
+    #DataFrame
+    @classmethod
+    def from_tables(cls, sources):
+        tables = []
+        for (basin, epoch), source in sources.items():
+            table = pd.read_csv(source) if isinstance(source, str) else source.copy()
+            table = table.astype({c: t for c, t in column_dtypes.items() if c in table})
+            tables.append(table.assign(basin=basin, epoch=epoch))
+        return cls(pd.concat(tables, ignore_index=True))
+
+    #boolean mask of the depressions that satisfy the predicates: mining is 'mined' (at
+    #least mined_threshold of the depression mined), 'unmined' (less than
+    #unmined_threshold), or None (all); elevation_above is a threshold on _ELEVmean, either
+    #one value or a dict of basin -> value (basins missing from it are not selected)
+    def select(self, mining=None, elevation_above=None, mined_threshold=0.9,
+               unmined_threshold=0.1):
+        keep = np.ones(len(self.table), dtype=bool)
+        if mining == 'mined':
+            keep &= self.table['prop_of_sink_minedmean'].to_numpy() >= mined_threshold
+        elif mining == 'unmined':
+            keep &= self.table['prop_of_sink_minedmean'].to_numpy() < unmined_threshold
+        elif mining is not None:
+            raise ValueError("mining must be 'mined', 'unmined', or None, not %r" % (mining,))
+        if elevation_above is not None:
+            if isinstance(elevation_above, dict):
+                basins = self.table['basin'].cat.categories
+                thresholds = np.array([elevation_above.get(b, np.inf) for b in basins])
+                elevation_above = thresholds[self.table['basin'].cat.codes.to_numpy()]
+            keep &= self.table['_ELEVmean'].to_numpy() > elevation_above
+        return keep
+
+    #dict of (basin, epoch) -> values of column for the selected depressions
+    def values(self, column, **predicates):
+        keep = self.select(**predicates)
+        values = self.table[column].to_numpy()
+        return {key: values[rows][keep[rows]] for key, rows in self.groups.items()}
+
+    #dict of (basin, epoch) -> sum of column over the selected depressions (NaN values are
+    #skipped, as pandas does)
+    def sums(self, column, **predicates):
+        return {key: np.nansum(values) for key, values in self.values(column, **predicates).items()}
+
+    #dict of (basin, epoch) -> histogram (np.histogram counts) of column over the selected
+    #depressions, for the bin edges bins
+    def histograms(self, column, bins, **predicates):
+        bins = np.asarray(bins, dtype=np.float64)
+        n_bins = len(bins) - 1
+        values = self.table[column].to_numpy()
+        bin_index = np.searchsorted(bins, values, side='right') - 1
+        bin_index[values == bins[-1]] = n_bins - 1 #the last bin includes its right edge
+        keep = self.select(**predicates) & (bin_index >= 0) & (bin_index < n_bins)
+
+        group_index = np.empty(len(values), dtype=np.int64)
+        for i, rows in enumerate(self.groups.values()):
+            group_index[rows] = i
+        counts = np.bincount(group_index[keep] * n_bins + bin_index[keep],
+                             minlength=len(self.groups) * n_bins).reshape(-1, n_bins)
+        return dict(zip(self.groups, counts))
+
+    #write the catalog to path (without extension; .parquet or .pkl is added); returns the
+    #path written
+    def save(self, path):
+        if pyarrow is not None:
+            path += '.parquet'
+            self.table.to_parquet(path + '.partial', index=False)
+        else:
+            path += '.pkl'
+            self.table.to_pickle(path + '.partial')
+        os.replace(path + '.partial', path)
+        return path
+
+    #catalog stored at path (without extension) by save(); from a Parquet file only the
+    #columns (plus basin and epoch) and basins asked for are read
+    @classmethod
+    def load(cls, path, columns=None, basins=None):
+        if columns is not None:
+            columns = ['basin', 'epoch'] + [c for c in columns if c not in ('basin', 'epoch')]
+        stored = stored_path(path)
+        if stored is None:
+            raise FileNotFoundError('no depression catalog at ' + path)
+        if stored.endswith('.parquet'):
+            filters = [('basin', 'in', list(basins))] if basins is not None else None
+            return cls(pd.read_parquet(stored, columns=columns, filters=filters))
+        table = pd.read_pickle(stored)
+        if basins is not None:
+            table = table[table['basin'].isin(basins)]
+        return cls(table[columns] if columns is not None else table)
+
+#the file save() wrote for path, or None. A pickle is not used if pyarrow is installed, so
+#the catalog is converted to Parquet on its next rebuild.
+def stored_path(path):
+    path += '.parquet' if pyarrow is not None else '.pkl'
+    return path if os.path.exists(path) else None
+
+#the catalog stored at path (without extension), rebuilt from sources (a dict of (basin,
+#epoch) -> CSV path) first if it is missing or older than any of them. columns and basins
+#are passed to DepressionCatalog.load.
+def open_catalog(path, sources, columns=None, basins=None):
+    stored = stored_path(path)
+    if stored is None or any(os.path.getmtime(s) > os.path.getmtime(stored) for s in sources.values()):
+        DepressionCatalog.from_tables(sources).save(path)
+    return DepressionCatalog.load(path, columns=columns, basins=basins)
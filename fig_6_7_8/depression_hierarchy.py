@@ -0,0 +1,355 @@
+########################################################################
+#Depression hierarchy (merge tree of nested closed depressions) of a DEM (Figures 6-8
+#data).
+
+#Brief description: after fr.remove_depressions() a cell is only flooded or not, and every
+#what-if question (how much water is stored above some elevation, or in mined cells, or
+#after a spill point is cut down) meant routing the DEM again. build_hierarchy() computes,
+#once per DEM, the hierarchy of its depressions in the sense of Barnes et al. (2020, Earth
+#Surface Dynamics 8, 431-445): every local minimum is the pit of a leaf depression, two
+#depressions that spill into each other merge into a parent depression at their common
+#spill elevation, and a depression whose spill leads to an outlet is a top-level
+#depression. Every depression records its pit and spill elevations and the elevation at
+#which its children merged, and its cells are kept together, so its area and volume at any
+#water level are a sum over its cells. The filled surface, and with it any storage total
+#for any selection of cells, follows from the spill elevations without routing again.
+
+#The leaf depressions are the basins of a flood from all local minima and the outlets at
+#once (shared/priority_flood.py): every cell belongs to the minimum (or outlet) it can be
+#reached from by a path that never rises above it. Neighboring basins spill into each
+#other at the lowest of the higher elevations of the neighboring cell pairs on their
+#border (D8 neighbors), and these spill edges are merged from lowest to highest as in
+#Kruskal's algorithm. Local minima that cannot hold water (a flat or a cell that spills
+#at its own elevation) are folded into the depression they spill into.
+
+#A DepressionHierarchy can be saved to and loaded from a compressed .npz file.
+
+########################################################################
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from priority_flood import priority_flood, edge_and_nodata_cells, d8_offsets
+
+#build the hierarchy of depressions of z (a 2-D array). valid marks the cells with data;
+#water leaves the grid through the outlets (default: valid cells on the edge of the array
+#or next to nodata). cell_area scales areas and volumes.
+def build_hierarchy(z, valid, outlets=None, cell_area=1.0):
+    z = np.asarray(z, dtype=np.float64)
+    valid = np.asarray(valid, dtype=bool)
+    outlets = edge_and_nodata_cells(valid) if outlets is None else np.asarray(outlets, dtype=bool) & valid
+
+    #seed a basin at every valid cell without a lower valid neighbor, and at every outlet
+    padded = np.pad(np.where(valid, z, np.inf), 1, constant_values=np.inf)
+    lowest = np.full(z.shape, np.inf)
+    for dr, dc in d8_offsets:
+        lowest = np.minimum(lowest, padded[1 + dr:padded.shape[0] - 1 + dr,
+                                           1 + dc:padded.shape[1] - 1 + dc])
+    seeds = valid & (outlets | (lowest >= z))
+    filled, label = priority_flood(z, valid, seeds, return_labels=True)
+
+    #basins flooded from an outlet are all one region, 'outside' (region n)
+    n = int(seeds.sum())
+    region = np.where(valid, label, -1)
+    is_outside = outlets[seeds]
+    region[valid] = np.where(is_outside[region[valid]], n, region[valid])
+
+    #lowest spill elevation between every pair of neighboring regions
+    a, b, spill = [], [], []
+    for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        r0, r1 = max(0, -dr), z.shape[0] - max(0, dr)
+        c0, c1 = max(0, -dc), z.shape[1] - max(0, dc)
+        ra = region[r0:r1, c0:c1]
+        rb = region[r0 + dr:r1 + dr, c0 + dc:c1 + dc]
+        border = (ra >= 0) & (rb >= 0) & (ra != rb)
+        a.append(np.minimum(ra, rb)[border])
+        b.append(np.maximum(ra, rb)[border])
+        spill.append(np.maximum(z[r0:r1, c0:c1], z[r0 + dr:r1 + dr, c0 + dc:c1 + dc])[border])
+    a, b, spill = np.concatenate(a), np.concatenate(b), np.concatenate(spill)
+    order = np.lexsort((spill, b, a))
+    a, b, spill = a[order], b[order], spill[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    a, b, spill = a[first], b[first], spill[first]
+    order = np.argsort(spill, kind='stable')
+    a, b, spill = a[order], b[order], spill[order]
+
+    pit = np.full(n + 1, np.inf)
+    np.minimum.at(pit, region[valid], z[valid])
+
+    #merge the regions along the spill edges from the lowest up. Node i < n starts out as
+    #the leaf depression of region i; merged depressions are appended.
+    nodes = _Nodes(pit[:n])
+    for i in np.flatnonzero(is_outside).tolist():
+        nodes.into[i] = -1
+    find = _UnionFind(n + 1)
+    node_of = {i: i for i in range(n) if not is_outside[i]}
+    outside = n
+    for ra, rb, s in zip(a.tolist(), b.tolist(), spill.tolist()):
+        ca, cb = find(ra), find(rb)
+        if ca == cb:
+            continue
+        if cb == find(outside):
+            ca, cb = cb, ca
+        if ca == find(outside):
+            #depression cb overflows out of the grid at s
+            nodes.drain(node_of.pop(cb), s)
+            find.union(cb, ca)
+            continue
+        na, nb = node_of.pop(ca), node_of.pop(cb)
+        if s <= nodes.pit[na]:
+            merged = nodes.absorb(na, nb)
+        elif s <= nodes.pit[nb]:
+            merged = nodes.absorb(nb, na)
+        else:
+            merged = nodes.join(na, nb, s)
+        node_of[find.union(ca, cb)] = merged
+    for node in node_of.values(): #depressions with no way out
+        nodes.drain(node, np.inf, to_outside=False)
+
+    region_node = np.append(nodes.final_node(np.arange(n)), -1)
+    return DepressionHierarchy(z, valid, region, region_node, *nodes.arrays(), cell_area)
+
+class DepressionHierarchy:
+
+    #z, valid: the DEM; region: basin of every cell (-1 for nodata); region_node: node of
+    #every basin (-1 for basins that drain out); parent, spill, pit, merge, to_outside: one
+    #entry per node (parent -1 for top-level depressions, merge -inf for leaves)
+    def __init__(self, z, valid, region, region_node, parent, spill, pit, merge,
+                 to_outside, cell_area=1.0):
+        self.z = z
+        self.valid = valid
+        self.region = region
+        self.region_node = region_node
+        self.parent = parent
+        self.spill = spill
+        self.pit = pit
+        self.merge = merge
+        self.to_outside = to_outside
+        self.cell_area = cell_area
+        self._index()
+
+    #children of every node, and the cells of every node's subtree as a contiguous range
+    #of self._cells (flat cell indices, sorted by the depth-first order of the nodes)
+    def _index(self):
+        n = len(self.parent)
+        self.children = [[] for _ in range(n)]
+        for node, parent in enumerate(self.parent.tolist()):
+            if parent >= 0:
+                self.children[parent].append(node)
+        self.top = np.flatnonzero(self.parent < 0)
+
+        rank = np.empty(n, dtype=np.int64)
+        self._start = np.empty(n, dtype=np.int64)
+        self._end = np.empty(n, dtype=np.int64)
+        order = []
+        stack = list(self.top[::-1])
+        while stack:
+            node = stack.pop()
+            rank[node] = len(order)
+            order.append(node)
+            stack.extend(self.children[node][::-1])
+
+        node_of_cell = np.full(self.z.size, -1, dtype=np.int64)
+        inside = self.valid.ravel() & (self.region.ravel() >= 0)
+        node_of_cell[inside] = self.region_node[self.region.ravel()[inside]]
+        self._node_of_cell = node_of_cell.reshape(self.z.shape)
+        cells = np.flatnonzero(node_of_cell >= 0)
+        cell_rank = rank[node_of_cell[cells]]
+        sort = np.argsort(cell_rank, kind='stable')
+        self._cells = cells[sort]
+        self._cell_z = self.z.ravel()[self._cells]
+        counts = np.bincount(cell_rank, minlength=n)
+        starts = np.concatenate([[0], np.cumsum(counts)])
+        #a subtree is its node followed by its descendants in depth-first order
+        size = np.ones(n, dtype=np.int64)
+        for node in reversed(order):
+            if self.parent[node] >= 0:
+                size[self.parent[node]] += size[node]
+        self._start[:] = starts[rank]
+        self._end[:] = starts[rank + size]
+
+    def __len__(self):
+        return len(self.parent)
+
+    #elevations of the cells of node and all depressions nested in it
+    def cell_elevations(self, node):
+        return self._cell_z[self._start[node]:self._end[node]]
+
+    #volume of water stored in node with its surface at level (default: its spill
+    #elevation; levels above the spill elevation are cut off there). Below the elevation
+    #at which its children merged, the children hold separate pools.
+    def volume(self, node, level=None):
+        level = self.spill[node] if level is None else min(level, self.spill[node])
+        if level < self.merge[node]:
+            return sum(self.volume(child, level) for child in self.children[node])
+        z = self.cell_elevations(node)
+        return np.sum(level - z[z < level]) * self.cell_area
+
+    #flooded area of node with its surface at level (as in volume)
+    def area(self, node, level=None):
+        level = self.spill[node] if level is None else min(level, self.spill[node])
+        if level < self.merge[node]:
+            return sum(self.area(child, level) for child in self.children[node])
+        return np.count_nonzero(self.cell_elevations(node) < level) * self.cell_area
+
+    #one row per depression: parent, number of children, pit, merge, and spill elevations,
+    #whether it overflows out of the grid, and its area and volume when full
+    def table(self):
+        return pd.DataFrame({'node': np.arange(len(self)), 'parent': self.parent,
+                             'children': [len(c) for c in self.children],
+                             'pit_elevation': self.pit, 'merge_elevation': self.merge,
+                             'spill_elevation': self.spill, 'to_outside': self.to_outside,
+                             'area': [self.area(i) for i in range(len(self))],
+                             'volume': [self.volume(i) for i in range(len(self))]})
+
+    #water surface of every cell (-inf where no water is stored). With breach = (node,
+    #level), the outlet of node is cut down to level: node and the depressions nested in it
+    #are drained down to level, the depressions it was nested in no longer fill above its
+    #old spill elevation, and their other sub-depressions stay full up to their own spill
+    #elevations.
+    def water_level(self, breach=None):
+        level = np.full(len(self), -np.inf)
+        for top in self.top.tolist():
+            self._set_level(level, top, self.spill[top])
+        if breach is not None:
+            node, breach_level = breach
+            self._set_level(level, node, min(breach_level, self.spill[node]))
+            child = node
+            while self.parent[child] >= 0:
+                parent = self.parent[child]
+                #the parent's own cells (folded-in flats above the merge) hold no water
+                level[parent] = -np.inf
+                for sibling in self.children[parent]:
+                    if sibling != child:
+                        self._set_level(level, sibling, self.spill[sibling])
+                child = parent
+        out = np.full(self.z.shape, -np.inf)
+        has_node = self._node_of_cell >= 0
+        out[has_node] = level[self._node_of_cell[has_node]]
+        return out
+
+    def _set_level(self, level, node, value):
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            level[n] = value
+            stack.extend(self.children[n])
+
+    #depression-filled elevation (breach as in water_level)
+    def filled(self, breach=None):
+        return np.where(self.valid, np.maximum(self.z, self.water_level(breach)), self.z)
+
+    #total volume stored in the DEM's depressions, counting only the cells in mask (e.g.
+    #the mined cells) and cells whose ground elevation is above min_elevation (e.g. the 20th
+    #percentile of elevation); breach as in water_level
+    def storage(self, mask=None, min_elevation=None, breach=None):
+        depth = self.filled(breach) - self.z
+        select = self.valid & (depth > 0)
+        if mask is not None:
+            select &= mask
+        if min_elevation is not None:
+            select &= self.z > min_elevation
+        return np.sum(depth[select]) * self.cell_area
+
+    def save(self, path):
+        np.savez_compressed(path, z=self.z, valid=self.valid, region=self.region,
+                            region_node=self.region_node, parent=self.parent,
+                            spill=self.spill, pit=self.pit, merge=self.merge,
+                            to_outside=self.to_outside, cell_area=self.cell_area)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['z'], f['valid'], f['region'], f['region_node'], f['parent'],
+                       f['spill'], f['pit'], f['merge'], f['to_outside'],
+                       float(f['cell_area']))
+
+#the depressions while the hierarchy is built
+class _Nodes:
+
+    def __init__(self, pit):
+        self.pit = list(pit)
+        n = len(self.pit)
+        self.spill = [np.inf] * n
+        self.merge = [-np.inf] * n
+        self.parent = [-1] * n
+        self.to_outside = [False] * n
+        self.into = list(range(n)) #node a node was folded into (itself if it was not)
+
+    #fold node (which cannot hold water) into other
+    def absorb(self, node, other):
+        self.into[node] = other
+        self.pit[other] = min(self.pit[other], self.pit[node])
+        return other
+
+    #new depression holding a and b, which spill into each other at s
+    def join(self, a, b, s):
+        new = len(self.pit)
+        self.pit.append(min(self.pit[a], self.pit[b]))
+        self.spill.append(np.inf)
+        self.merge.append(s)
+        self.parent.append(-1)
+        self.to_outside.append(False)
+        self.into.append(new)
+        self.spill[a] = self.spill[b] = s
+        self.parent[a] = self.parent[b] = new
+        return new
+
+    #node is a top-level depression spilling at s (out of the grid if to_outside); if it
+    #cannot hold water its cells drain out of the grid
+    def drain(self, node, s, to_outside=True):
+        if to_outside and s <= self.pit[node]:
+            self.into[node] = -1
+        else:
+            self.spill[node] = s
+            self.to_outside[node] = to_outside
+
+    def _resolve(self, node):
+        while node >= 0 and self.into[node] != node:
+            node = self.into[node]
+        return node
+
+    #final node ids (after removing folded nodes) of the given original nodes
+    def final_node(self, nodes):
+        keep = self._keep()
+        new_id = np.cumsum(keep) - 1
+        out = np.array([self._resolve(i) for i in np.asarray(nodes).tolist()], dtype=np.int64)
+        return np.where(out >= 0, new_id[np.maximum(out, 0)], -1)
+
+    def _keep(self):
+        return np.array([self.into[i] == i for i in range(len(self.pit))], dtype=bool)
+
+    #parent, spill, pit, merge, and to_outside arrays of the remaining nodes
+    def arrays(self):
+        keep = self._keep()
+        new_id = np.cumsum(keep) - 1
+        parent = np.array(self.parent, dtype=np.int64)
+        parent = np.where(parent >= 0, new_id[np.maximum(parent, 0)], -1)[keep]
+        return (parent, np.array(self.spill)[keep], np.array(self.pit)[keep],
+                np.array(self.merge)[keep], np.array(self.to_outside)[keep])
+
+#union-find over regions (path halving, union by size)
+class _UnionFind:
+
+    def __init__(self, n):
+        self.root = list(range(n))
+        self.size = [1] * n
+
+    def __call__(self, i):
+        root = self.root
+        while root[i] != i:
+            root[i] = root[root[i]]
+            i = root[i]
+        return i
+
+    #join the sets with roots a and b; returns the new root
+    def union(self, a, b):
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.root[b] = a
+        self.size[a] += self.size[b]
+        return a
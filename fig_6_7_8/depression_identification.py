@@ -20,7 +20,8 @@
 
 #NOTE: the folder 'flowrouting_output', which holds the results of this analysis, is
 #empty in our archived version because the file sizes are too large to archive (total 
-#several GB). This script will generate those outputs.
+#several GB). This script will generate those outputs; with output_format = 'tif' they
+#are written as compressed GeoTIFFs that take a fraction of the space.
 
 ########################################################################
 
@@ -32,9 +33,35 @@ from landlab.components import (
 import matplotlib.pyplot as plt
 from landlab.io.esri_ascii import write_esri_ascii
 from landlab.components.depression_finder.lake_mapper import _FLOODED
+import numpy as np
+import glob
+import os
+import sys
+import warnings
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from stage_timer import StageTimer, StageLog
+from routing_cache import RoutingCache, CachedFillRouter
+from batch_pool import run_batch
+from depression_statistics import (read_ascii_header, read_ascii, align_grid,
+                                   depression_table)
+from routing_outputs import write_outputs
+from depression_hierarchy import build_hierarchy
+from priority_flood import priority_flood, update_fill
 
 path = './input_dems/'
 
+#with compact = True the flood status grid is kept as uint8 (one byte per cell) instead of
+#float64; the elevations stay float64 because Landlab routes in float64
+compact = False
+
+#wall time and peak memory of every stage (read, grid, cache, routing, fill, flood_status,
+#write, statistics, hierarchy) for every DEM, with its grid shape and numbers of core
+#nodes, depressions, and cells filled (reflooded), are written to this csv file (see
+#shared/stage_timer.py); trace_memory adds the peak traced memory of every stage
+timing_path = './flowrouting_output/depression_identification_timing.csv'
+trace_memory = False
+
 #input DEMs: pre is pre-mined and post is post-mined
 filenames = ['ben_pre_10m', 
 'ben_post_10m', 
@@ -47,34 +74,345 @@ filenames = ['ben_pre_10m',
 'whiteoak_pre_10m',
 'whiteoak_post_10m']
 
-#iterate through files and route flow to find depressions on each one
-for name in filenames:
-	filepath = path + name + '.asc'
-	mg, z = read_esri_ascii(filepath, name='topographic__elevation') 
+#to process other DEMs, set dem_glob to a pattern of ESRI ASCII files (e.g.
+#'./input_dems/*_10m.asc'); it replaces filenames, and every output is named after its
+#input file. None processes filenames in path.
+dem_glob = None
+
+#the DEMs are routed by a pool of n_workers processes, largest first (see
+#shared/batch_pool.py). A DEM is only started while the estimated memory of all running
+#DEMs stays below memory_limit_gb (None: no limit), estimated as bytes_per_cell times the
+#number of cells in the DEM's header. bytes_per_cell is a rough figure for a Dinf grid
+#with depression filling; check it against max_rss_mb in the timing file. A DEM that
+#fails is reported at the end and does not stop the others.
+n_workers = 1
+memory_limit_gb = None
+bytes_per_cell = 600
+
+#output_format = 'asc' writes the depression-free elevation and flood status as ESRI
+#ASCII grids (several GB for the five basins); 'tif' writes tiled, compressed GeoTIFFs
+#with a bit-packed flood status and the depression-free elevation as float32 if compact
+#is set, about an order of magnitude smaller and faster to write (see routing_outputs.py).
+#The ASCII DEMs carry no CRS, so output_crs is attached to the GeoTIFFs (the DEMs of Ross
+#et al. (2016) are in UTM zone 17N, NAD83).
+output_format = 'asc'
+output_crs = 'EPSG:26917'
+
+#every closed depression (connected flooded cells) is labeled and its area, mean
+#elevation, mean depression-free elevation, volume, and proportion mined are written to
+#the table fig7.py and fig8.py read (see depression_statistics.py; this replaces the
+#zonal statistics done by hand in QGIS), in depression_table_dir. The tables are named
+#<basin>_<epoch>_depressions_prop_mined_elev_filled.csv like the ones the figures read,
+#with basin the name in table_basins of the DEM name up to its first underscore (e.g.
+#bencreek_pre_... for ben_pre_10m). DEMs not named <basin>_<pre or post>_... keep their
+#own name.
+#The mining mask of a DEM is found in mining_masks by the same part of its name. Every
+#DEM is routed and its grids written; only the table of a DEM whose mask is not in
+#mining_masks or not on disk is skipped, with a warning, so no table with an empty
+#proportion mined (whose depressions fig7.py would all drop) is written by accident. Map
+#a basin to None to write its tables without proportion mined on purpose. The archive has
+#the masks of Ben Creek, Mud River, and White Oak only; add those of Laurel Creek and
+#Spruce Fork to ./mining_masks/ to make their tables. connectivity is 4 (edge neighbors,
+#as in QGIS polygonization) or 8.
+depression_tables = True
+depression_table_dir = './'
+table_basins = {'ben': 'bencreek', 'laurel': 'laurelcreek', 'mud': 'mudriver',
+                'spruce': 'sprucefork', 'whiteoak': 'whiteoak'}
+mining_masks = {'ben': './mining_masks/bencreek_k_10m.asc',
+                'laurel': './mining_masks/laurelcreek_k_10m.asc',
+                'mud': './mining_masks/mudriver_k_10m.asc',
+                'spruce': './mining_masks/sprucefork_k_10m.asc',
+                'whiteoak': './mining_masks/whiteoak_k_10m.asc'}
+connectivity = 4
+
+#with depression_hierarchies = True, the hierarchy of nested depressions of every DEM
+#(pits, spill elevations, and the cells of every depression; see depression_hierarchy.py)
+#is saved to ./flowrouting_output/<DEM name>_depression_hierarchy.npz. Load it with
+#DepressionHierarchy.load() to ask for storage volumes (above an elevation, in mined
+#cells, per water level, or after breaching a spill point) without routing the DEM again.
+#Its filled surface is the exact one; Landlab's (with epsilon=True) is raised by tiny
+#increments across flats.
+depression_hierarchies = False
+
+#PriorityFlood routing and depression filling settings
+router_params = {'flow_metric': 'Dinf', 'runoff_rate': None,
+                 'update_flow_depressions': True, 'depression_handler': 'fill',
+                 'exponent': 1, 'epsilon': True, 'accumulate_flow': True,
+                 'accumulate_flow_hill': False}
+
+#with routing_cache_dir set, the filled surface of every DEM is stored in a
+#content-addressed cache under the hash of the DEM, its boundary conditions, and the
+#depression handling settings of router_params (see shared/routing_cache.py), and a DEM
+#filled before is loaded from it instead of being filled again, whatever the flow metric
+#it was routed with; the flow directions and drainage areas are still computed. The
+#directory can be shared with calculate_watershed_metrics.py. None always fills.
+routing_cache_dir = None
+
+#with incremental_fill = True, depressions are filled with shared/priority_flood.py
+#instead of Landlab, and the result (filled surface and flood tree) of every DEM is saved
+#to ./flowrouting_output/<DEM name>_flood_tree.npz. A post-mining DEM ('_post' in its
+#name) is then not filled from scratch but updated from its pre-mining DEM (the same name
+#with '_pre'), flooding again only the cells that changed, the depressions they touch, and
+#the cells upstream of those (see update_fill in shared/priority_flood.py), so the time
+#depends on the disturbed area rather than on the size of the basin. A DEM saved as
+#'_post' can itself be renamed '_pre' to update it for a later mining epoch. The result
+#is identical to a full fill by priority_flood, which is exact and is also what Landlab
+#computes with epsilon=False. With epsilon=True Landlab raises flats by tiny increments
+#that depend on the order in which RichDEM visits their cells, and flags the raised cells
+#as flooded; an update cannot reproduce that, so incremental_fill needs
+#router_params['epsilon'] = False. Run the script with --check to compare the incremental
+#fill with a full Landlab run on synthetic DEMs. No drainage area is computed in this
+#mode.
+incremental_fill = False
+if incremental_fill and router_params['epsilon']:
+	raise ValueError("incremental_fill needs router_params['epsilon'] = False: Landlab's "
+	                 'epsilon gradient across flats cannot be updated incrementally')
+
+#estimated peak memory of routing one DEM in GB, from the size in its header
+def estimate_memory(filepath):
+	header = read_ascii_header(filepath)
+	return header['ncols'] * header['nrows'] * bytes_per_cell / 2**30
+
+#why the depression table of a DEM cannot be written (its mining mask is missing), or
+#None if it can
+def missing_mining_mask(name):
+	basin = name.split('_')[0]
+	if basin not in mining_masks:
+		return 'no mining mask for %r in mining_masks (map it to None for no proportion mined)' % basin
+	if mining_masks[basin] is not None and not os.path.exists(mining_masks[basin]):
+		return 'mining mask %s not found' % mining_masks[basin]
+	return None
+
+#mining mask of a DEM (1 mined, 0 unmined, NaN no data) on the DEM's grid, or None if
+#its basin is mapped to None in mining_masks
+def read_mining_mask(name, dem_header):
+	mask_path = mining_masks[name.split('_')[0]]
+	if mask_path is None:
+		return None
+	mask_header, mask = read_ascii(mask_path)
+	mask = np.where(mask == mask_header.get('nodata_value'), np.nan, mask == 1)
+	return align_grid(mask_header, mask, dem_header)
+
+#path of the depression table of a DEM, named as fig7.py and fig8.py read it
+def depression_table_path(name):
+	parts = name.split('_')
+	if len(parts) > 1 and parts[1] in ('pre', 'post'):
+		name = table_basins.get(parts[0], parts[0]) + '_' + parts[1]
+	return os.path.join(depression_table_dir, name + '_depressions_prop_mined_elev_filled.csv')
+
+#depression table of a routed grid (north-up, like the ASCII files)
+def write_depression_table(mg, name, dem_header):
+	def field(name):
+		return np.flipud(mg.at_node[name].reshape(mg.shape))
+	table = depression_table(field('flood_status'), field('topographic__elevation'),
+	                         field('depression_free_elevation'), dem_header['cellsize']**2,
+	                         mined=read_mining_mask(name, dem_header), connectivity=connectivity)
+	table.to_csv(depression_table_path(name), index=False)
+	return len(table)
+
+#north-up elevations, valid cells, and outlets of a grid with boundary conditions set
+def flood_inputs(mg, z):
+	status = np.flipud(np.asarray(mg.status_at_node).reshape(mg.shape))
+	return (np.flipud(np.asarray(z).reshape(mg.shape)), status != mg.BC_NODE_IS_CLOSED,
+	        status == mg.BC_NODE_IS_FIXED_VALUE)
+
+def flood_tree_path(name):
+	return "./flowrouting_output/" + name + "_flood_tree.npz"
 
-	outlet_id = mg.set_watershed_boundary_condition(z,
+def save_flood_tree(name, z, valid, outlets, filled, parents):
+	path = flood_tree_path(name)
+	tmp_path = path[:-4] + '.%d.partial.npz' % os.getpid()
+	np.savez_compressed(tmp_path, z=z, valid=valid, outlets=outlets, filled=filled,
+	                    parents=parents)
+	os.replace(tmp_path, path)
+
+#saved flood tree of the DEM at filepath, filling the DEM first if it has none
+def flood_tree(filepath):
+	name = os.path.splitext(os.path.basename(filepath))[0]
+	if not os.path.exists(flood_tree_path(name)):
+		mg, z = read_esri_ascii(filepath, name='topographic__elevation')
+		mg.set_watershed_boundary_condition(z, nodata_value = -99999,
+		                                    remove_disconnected=True)
+		z, valid, outlets = flood_inputs(mg, z)
+		filled, parents = priority_flood(z, valid, outlets, return_parents=True)
+		save_flood_tree(name, z, valid, outlets, filled, parents)
+	with np.load(flood_tree_path(name)) as f:
+		return {key: f[key] for key in f.files}
+
+#depression-free elevation (in node order) of a grid with boundary conditions set, by
+#priority_flood or, for a post-mining DEM, by updating the fill of its pre-mining DEM
+def fill_incrementally(mg, z, name, filepath, timer):
+	z, valid, outlets = flood_inputs(mg, z)
+	base = None
+	if '_post' in name:
+		pre_filepath = os.path.join(os.path.dirname(filepath),
+		                            os.path.basename(filepath).replace('_post', '_pre'))
+		if os.path.exists(pre_filepath):
+			base = flood_tree(pre_filepath)
+	if (base is not None and np.array_equal(base['valid'], valid)
+	        and np.array_equal(base['outlets'], outlets)):
+		filled, parents, region = update_fill(base['z'], base['filled'], base['parents'],
+		                                      z, valid, outlets)
+		timer.note(reflooded=int(region.sum()))
+	else:
+		filled, parents = priority_flood(z, valid, outlets, return_parents=True)
+		timer.note(reflooded=int(valid.sum()))
+	save_flood_tree(name, z, valid, outlets, filled, parents)
+	return np.flipud(filled).ravel()
+
+#write a synthetic pre- and post-mining DEM pair to directory (random terrain on a slope,
+#rounded to make flats, draining to one outlet; the post-mining DEM has a flattened mine
+#and a valley fill) and return their paths
+def write_synthetic_dems(directory, seed, shape=(40, 60)):
+	rng = np.random.default_rng(seed)
+	z = np.round(rng.random(shape) * 8 + 0.2 * np.add.outer(np.arange(shape[0]), np.arange(shape[1])), 0)
+	z[shape[0] // 2, 0] = z.min() - 5
+	post = z.copy()
+	post[5:15, 20:35] = np.round(post[5:15, 20:35].mean(), 0)
+	post[25:30, 30:50] = np.maximum(post[25:30, 30:50], post[25:30, 30:50].max())
+	paths = []
+	for epoch, values in (('pre', z), ('post', post)):
+		path = os.path.join(directory, 'synthetic%d_%s_10m.asc' % (seed, epoch))
+		header = 'ncols %d\nnrows %d\nxllcorner 0\nyllcorner 0\ncellsize 10\nNODATA_value -99999' % shape[::-1]
+		np.savetxt(path, values, fmt='%.1f', header=header, comments='')
+		paths.append(path)
+	return paths
+
+#depression-free elevation and flood status of the core nodes of the DEM at filepath,
+#filled incrementally (fill_incrementally) or routed by Landlab with params
+def check_fill(filepath, params=None):
+	name = os.path.splitext(os.path.basename(filepath))[0]
+	mg, z = read_esri_ascii(filepath, name='topographic__elevation')
+	mg.set_watershed_boundary_condition(z, nodata_value = -99999, remove_disconnected=True)
+	if params is None:
+		timer = StageTimer()
+		filled = fill_incrementally(mg, z, name, filepath, timer)
+	else:
+		fr = PriorityFloodFlowRouter(mg, 'topographic__elevation', suppress_out=True, **params)
+		fr.run_one_step()
+		fr.remove_depressions()
+		filled = mg.at_node['depression_free_elevation']
+	filled = np.asarray(filled)[mg.core_nodes]
+	return filled, filled > z[mg.core_nodes]
+
+#run as `python depression_identification.py --check`: fill synthetic pre- and post-mining
+#DEMs incrementally (the post-mining DEM updated from the pre-mining one) and route them
+#with Landlab under router_params, and compare the depression-free elevations and flood
+#status of their core nodes. With epsilon=True, which incremental_fill refuses, the
+#differences are only reported, and the comparison that has to agree is made with
+#epsilon=False. Returns the exit status.
+def check_incremental_fill(seeds=range(3)):
+	import tempfile
+	cases = [('router_params', router_params)]
+	if router_params['epsilon']:
+		cases.append(('router_params with epsilon=False', dict(router_params, epsilon=False)))
+	failed = False
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as tmp:
+		os.chdir(tmp)
+		os.makedirs('flowrouting_output')
+		try:
+			for seed in seeds:
+				paths = write_synthetic_dems(tmp, seed)
+				incremental = [check_fill(filepath) for filepath in paths]
+				for label, params in cases:
+					for filepath, (filled, flooded) in zip(paths, incremental):
+						full_filled, full_flooded = check_fill(filepath, params)
+						mismatches = (int(np.sum(filled != full_filled)),
+						              int(np.sum(flooded != full_flooded)))
+						must_agree = not params['epsilon']
+						failed |= must_agree and any(mismatches)
+						print(os.path.basename(filepath), label + ':',
+						      'OK' if not any(mismatches) else
+						      '%d filled elevations and %d flood status cells differ%s'
+						      % (mismatches + ('' if must_agree else ' (expected)',)))
+		finally:
+			os.chdir(cwd)
+	return 1 if failed else 0
+
+#route flow over one DEM to find its depressions and write the depression-free elevation
+#and flood status grids; returns the stage timings
+def identify_depressions(filepath):
+	name = os.path.splitext(os.path.basename(filepath))[0]
+	timer = StageTimer(trace_memory)
+	timer.start(name)
+	with timer.stage('read'):
+		mg, z = read_esri_ascii(filepath, name='topographic__elevation') 
+		dem_header = read_ascii_header(filepath)
+
+	with timer.stage('grid'):
+		outlet_id = mg.set_watershed_boundary_condition(z,
                                                 nodata_value = -99999, 
                                                 return_outlet_id=True,
                                                remove_disconnected=True)
 
-	fr=PriorityFloodFlowRouter(mg,'topographic__elevation',
-                                                flow_metric='Dinf',
-                                                runoff_rate= None,
-                           						update_flow_depressions=True,
-                                                depression_handler = 'fill',
-                                                exponent = 1,
-                                                epsilon=True,
-                                                accumulate_flow = True, 
-                                                accumulate_flow_hill = False,
-                                                suppress_out=True)
-
-	fr.run_one_step()
-	fr.remove_depressions()
-	fs = mg.add_zeros('flood_status', at='node')
-	mg.at_node['flood_status'][mg.at_node['depression_free_elevation'] > mg.at_node['topographic__elevation']] = 1
-
-	#save depression-free elevation (surface as if all sinks are filled)
-	write_esri_ascii("./flowrouting_output/" + name + "_depression_free_elev.asc", mg, names = ['depression_free_elevation'])
-	
-	#save flood status (1 for flooded areas, 0 elsewhere)
-	write_esri_ascii("./flowrouting_output/" + name + "_flood_status.asc", mg, names = ['flood_status'])
\ No newline at end of file
+	if incremental_fill:
+		with timer.stage('fill'):
+			mg.add_field('depression_free_elevation', fill_incrementally(mg, z, name, filepath, timer),
+			             at='node', clobber=True)
+	else:
+		#the filled surface comes from the cache if this DEM was filled before
+		cache = RoutingCache(routing_cache_dir) if routing_cache_dir is not None else None
+		with timer.stage('routing'):
+			fr=CachedFillRouter(mg,'topographic__elevation', suppress_out=True, cache=cache,
+			                    **router_params)
+
+			fr.run_one_step()
+
+		with timer.stage('fill'):
+			fr.remove_depressions()
+
+	with timer.stage('flood_status'):
+		fs = mg.add_zeros('flood_status', at='node', dtype=np.uint8 if compact else float)
+		mg.at_node['flood_status'][mg.at_node['depression_free_elevation'] > mg.at_node['topographic__elevation']] = 1
+	timer.note(rows=mg.shape[0], cols=mg.shape[1], core_nodes=mg.number_of_core_nodes)
+
+	with timer.stage('write'):
+		#save depression-free elevation (surface as if all sinks are filled) and flood
+		#status (1 for flooded areas, 0 elsewhere)
+		write_outputs(mg, name, dem_header, './flowrouting_output/', output_format,
+		              dtype=np.float32 if compact else np.float64, crs=output_crs)
+
+	missing = missing_mining_mask(name) if depression_tables else None
+	if missing is not None:
+		warnings.warn('no depression table written for %s: %s' % (name, missing))
+	elif depression_tables:
+		with timer.stage('statistics'):
+			timer.note(depressions=write_depression_table(mg, name, dem_header))
+
+	if depression_hierarchies:
+		with timer.stage('hierarchy'):
+			status = np.flipud(mg.status_at_node.reshape(mg.shape))
+			hierarchy = build_hierarchy(np.flipud(z.reshape(mg.shape)),
+			                            status != mg.BC_NODE_IS_CLOSED,
+			                            outlets=status == mg.BC_NODE_IS_FIXED_VALUE,
+			                            cell_area=dem_header['cellsize']**2)
+			hierarchy.save("./flowrouting_output/" + name + "_depression_hierarchy.npz")
+	return timer.pop_rows()
+
+if __name__ == '__main__':
+	if sys.argv[1:] == ['--check']:
+		sys.exit(check_incremental_fill())
+
+	if dem_glob is not None:
+		filepaths = sorted(glob.glob(dem_glob))
+	else:
+		filepaths = [path + name + '.asc' for name in filenames]
+
+	#iterate through files and route flow to find depressions on each one
+	timing = StageLog(timing_path, ['rows', 'cols', 'core_nodes', 'depressions', 'reflooded'])
+	failed = []
+	for filepath, rows, error in run_batch(identify_depressions, filepaths, n_workers,
+	                                       estimate=estimate_memory, memory_limit=memory_limit_gb):
+		if error is not None:
+			failed.append(filepath)
+			print('failed:', filepath)
+			print(error)
+		else:
+			timing.write(rows)
+			print('done:', filepath)
+	timing.close()
+
+	if failed:
+		print(len(failed), 'of', len(filepaths), 'DEMs failed:', ', '.join(failed))
+		sys.exit(1)
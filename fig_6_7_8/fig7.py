@@ -23,51 +23,52 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
 from matplotlib.gridspec import GridSpec
 
+from basin_store import elevation_percentile
+from depression_catalog import open_catalog
+
 #thresholds: if >90% of a given depression is mapped as mined, we call it "mined."
 #if <10% of a depression has been mined, we call it "unmined."
 mined_threshold = 0.9
 unmined_threshold = 0.1
 
-#import DEMs
-ben_pre_topo = np.genfromtxt("input_dems/bencreek/bencreek_pre_10m.asc", skip_header = 6)
-ben_post_topo = np.genfromtxt("input_dems/bencreek/bencreek_post_10m.asc", skip_header = 6)
-laurel_pre_topo = np.genfromtxt("input_dems/laurelcreek/laurelcreek_pre_10m.asc", skip_header = 6)
-laurel_post_topo = np.genfromtxt("input_dems/laurelcreek/laurelcreek_post_10m.asc", skip_header = 6)
-mud_pre_topo = np.genfromtxt("input_dems/mudriver/mudriver_pre_10m.asc", skip_header = 6)
-mud_post_topo = np.genfromtxt("input_dems/mudriver/mudriver_post_10m.asc", skip_header = 6)
-spruce_pre_topo = np.genfromtxt("input_dems/sprucefork/sprucefork_pre_10m.asc", skip_header = 6)
-spruce_post_topo = np.genfromtxt("input_dems/sprucefork/sprucefork_post_10m.asc", skip_header = 6)
-white_pre_topo = np.genfromtxt("input_dems/whiteoak/whiteoak_pre_10m.asc", skip_header = 6)
-white_post_topo = np.genfromtxt("input_dems/whiteoak/whiteoak_post_10m.asc", skip_header = 6)
-
 #calculate the xxth percentile of pre-mining elevation for each basin. This will be used 
 #to mask out closed depressions that fall low in the landscape because they are in
 #river valleys which are 1) unmined and 2) very subject to DEM errors that generate sinks.
+#The percentiles are computed once per DEM and stored next to it (see basin_store.py), so
+#the DEMs are not loaded here.
 
 percentile = 20
-ben_elev_threshold = np.percentile(ben_pre_topo[ben_pre_topo > 0], percentile)
-laurel_elev_threshold = np.percentile(laurel_pre_topo[laurel_pre_topo > 0], percentile)
-mud_elev_threshold = np.percentile(mud_pre_topo[mud_pre_topo > 0], percentile)
-spruce_elev_threshold = np.percentile(spruce_pre_topo[spruce_pre_topo > 0], percentile)
-white_elev_threshold = np.percentile(white_pre_topo[white_pre_topo > 0], percentile)
+ben_elev_threshold = elevation_percentile("input_dems/bencreek/bencreek_pre_10m.asc", percentile)
+laurel_elev_threshold = elevation_percentile("input_dems/laurelcreek/laurelcreek_pre_10m.asc", percentile)
+mud_elev_threshold = elevation_percentile("input_dems/mudriver/mudriver_pre_10m.asc", percentile)
+spruce_elev_threshold = elevation_percentile("input_dems/sprucefork/sprucefork_pre_10m.asc", percentile)
+white_elev_threshold = elevation_percentile("input_dems/whiteoak/whiteoak_pre_10m.asc", percentile)
 
 #import dataset of closed depressions with proportion mined and average elevation;
 #these data derive from flow routing ('see depression_identification.py') and have had
 #proportion mined, depression mean elevation, and depression filled surface elevation 
-#data added by using the zonal statistics tool in QGIS.
-ben_pre = pd.read_csv('bencreek_pre_depressions_prop_mined_elev_filled.csv')
-ben_post = pd.read_csv('bencreek_post_depressions_prop_mined_elev_filled.csv')
-laurel_pre = pd.read_csv('laurelcreek_pre_depressions_prop_mined_elev_filled.csv')
-laurel_post = pd.read_csv('laurelcreek_post_depressions_prop_mined_elev_filled.csv')
-mud_pre = pd.read_csv('mudriver_pre_depressions_prop_mined_elev_filled.csv')
-mud_post = pd.read_csv('mudriver_post_depressions_prop_mined_elev_filled.csv')
-spruce_pre = pd.read_csv('sprucefork_pre_depressions_prop_mined_elev_filled.csv')
-spruce_post = pd.read_csv('sprucefork_post_depressions_prop_mined_elev_filled.csv')
-white_pre = pd.read_csv('whiteoak_pre_depressions_prop_mined_elev_filled.csv')
-white_post = pd.read_csv('whiteoak_post_depressions_prop_mined_elev_filled.csv')
+#data added by using the zonal statistics tool in QGIS. depression_identification.py now
+#writes the same tables itself (see depression_statistics.py). The ten tables are combined
+#into one catalog (see depression_catalog.py), which is rebuilt when a table changes.
+basins = {'ben': 'bencreek', 'laurel': 'laurelcreek', 'mud': 'mudriver', 'spruce': 'sprucefork',
+          'white': 'whiteoak'}
+catalog = open_catalog('depression_catalog',
+                       {(basin, epoch): name + '_' + epoch + '_depressions_prop_mined_elev_filled.csv'
+                        for basin, name in basins.items() for epoch in ['pre', 'post']},
+                       columns=['area (m^2)', 'prop_of_sink_minedmean', '_ELEVmean'])
+
+#histograms of depression area for every basin and epoch, for mined and unmined depressions
+#above the elevation threshold of their basin
+elev_thresholds = {'ben': ben_elev_threshold, 'laurel': laurel_elev_threshold,
+                   'mud': mud_elev_threshold, 'spruce': spruce_elev_threshold,
+                   'white': white_elev_threshold}
+bins = np.logspace(2, 6, num=20)
+mined_counts = catalog.histograms('area (m^2)', bins, mining='mined', elevation_above=elev_thresholds,
+                                  mined_threshold=mined_threshold)
+unmined_counts = catalog.histograms('area (m^2)', bins, mining='unmined', elevation_above=elev_thresholds,
+                                    unmined_threshold=unmined_threshold)
 
 #generate Figure 7
 fig = plt.figure(figsize=(8,10))
@@ -85,11 +86,10 @@ ax9 = fig.add_subplot(gs[8], sharex = ax1, sharey = ax1)
 ax10 = fig.add_subplot(gs[9], sharex = ax1, sharey = ax1)
 
 #plot 1: ben creek, mined areas
-bins = np.logspace(2, 6, num=20)
-ax1.hist(ben_post['area (m^2)'][ben_post['prop_of_sink_minedmean'] >= mined_threshold][ben_post['_ELEVmean'] > ben_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5, label = 'Post-mining DEM')
-ax1.hist(ben_post['area (m^2)'][ben_post['prop_of_sink_minedmean'] >= mined_threshold][ben_post['_ELEVmean'] > ben_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax1.hist(ben_pre['area (m^2)'][ben_pre['prop_of_sink_minedmean'] >= mined_threshold][ben_pre['_ELEVmean'] > ben_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5, label = 'Pre-mining DEM')
-ax1.hist(ben_pre['area (m^2)'][ben_pre['prop_of_sink_minedmean'] >= mined_threshold][ben_pre['_ELEVmean'] > ben_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax1.hist(bins[:-1], bins, weights = mined_counts['ben', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5, label = 'Post-mining DEM')
+ax1.hist(bins[:-1], bins, weights = mined_counts['ben', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax1.hist(bins[:-1], bins, weights = mined_counts['ben', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5, label = 'Pre-mining DEM')
+ax1.hist(bins[:-1], bins, weights = mined_counts['ben', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 
 ax1.set_xlim(90, 1e6)
 ax1.set_ylim(0.5, 5e3)
@@ -98,20 +98,18 @@ ax1.set_xscale('log')
 ax1.set_yscale('log')
 
 #plot 2: ben creek, unmined areas
-bins = np.logspace(2, 6, num=20)
-ax2.hist(ben_post['area (m^2)'][ben_post['prop_of_sink_minedmean'] < unmined_threshold][ben_post['_ELEVmean'] > ben_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5, label = 'Post-mining DEM')
-ax2.hist(ben_post['area (m^2)'][ben_post['prop_of_sink_minedmean'] < unmined_threshold][ben_post['_ELEVmean'] > ben_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax2.hist(ben_pre['area (m^2)'][ben_pre['prop_of_sink_minedmean'] < unmined_threshold][ben_pre['_ELEVmean'] > ben_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5, label = 'Pre-mining DEM')
-ax2.hist(ben_pre['area (m^2)'][ben_pre['prop_of_sink_minedmean'] < unmined_threshold][ben_pre['_ELEVmean'] > ben_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax2.hist(bins[:-1], bins, weights = unmined_counts['ben', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5, label = 'Post-mining DEM')
+ax2.hist(bins[:-1], bins, weights = unmined_counts['ben', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax2.hist(bins[:-1], bins, weights = unmined_counts['ben', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5, label = 'Pre-mining DEM')
+ax2.hist(bins[:-1], bins, weights = unmined_counts['ben', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 ax2.set_xscale('log')
 ax2.set_yscale('log')
 
 #plot 3: laurel creek, mined areas
-bins = np.logspace(2, 6, num=20)
-ax3.hist(laurel_post['area (m^2)'][laurel_post['prop_of_sink_minedmean'] >= mined_threshold][laurel_post['_ELEVmean'] > laurel_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5, label = 'Post-mining DEM')
-ax3.hist(laurel_post['area (m^2)'][laurel_post['prop_of_sink_minedmean'] >= mined_threshold][laurel_post['_ELEVmean'] > laurel_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax3.hist(laurel_pre['area (m^2)'][laurel_pre['prop_of_sink_minedmean'] >= mined_threshold][laurel_pre['_ELEVmean'] > laurel_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5, label = 'Pre-mining DEM')
-ax3.hist(laurel_pre['area (m^2)'][laurel_pre['prop_of_sink_minedmean'] >= mined_threshold][laurel_pre['_ELEVmean'] > laurel_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax3.hist(bins[:-1], bins, weights = mined_counts['laurel', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5, label = 'Post-mining DEM')
+ax3.hist(bins[:-1], bins, weights = mined_counts['laurel', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax3.hist(bins[:-1], bins, weights = mined_counts['laurel', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5, label = 'Pre-mining DEM')
+ax3.hist(bins[:-1], bins, weights = mined_counts['laurel', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 ax3.set_xscale('log')
 ax3.set_yscale('log')
 
@@ -119,67 +117,60 @@ ax3.legend()
 
 
 #plot 4: laurel creek, unmined areas
-bins = np.logspace(2, 6, num=20)
-ax4.hist(laurel_post['area (m^2)'][laurel_post['prop_of_sink_minedmean'] < unmined_threshold][laurel_post['_ELEVmean'] > laurel_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
-ax4.hist(laurel_post['area (m^2)'][laurel_post['prop_of_sink_minedmean'] < unmined_threshold][laurel_post['_ELEVmean'] > laurel_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax4.hist(laurel_pre['area (m^2)'][laurel_pre['prop_of_sink_minedmean'] < unmined_threshold][laurel_pre['_ELEVmean'] > laurel_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
-ax4.hist(laurel_pre['area (m^2)'][laurel_pre['prop_of_sink_minedmean'] < unmined_threshold][laurel_pre['_ELEVmean'] > laurel_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax4.hist(bins[:-1], bins, weights = unmined_counts['laurel', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
+ax4.hist(bins[:-1], bins, weights = unmined_counts['laurel', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax4.hist(bins[:-1], bins, weights = unmined_counts['laurel', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
+ax4.hist(bins[:-1], bins, weights = unmined_counts['laurel', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 ax4.set_xscale('log')
 ax4.set_yscale('log')
 
 #plot 5: mud river, mined areas
-bins = np.logspace(2, 6, num=20)
-ax5.hist(mud_post['area (m^2)'][mud_post['prop_of_sink_minedmean'] >= mined_threshold][mud_post['_ELEVmean'] > mud_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
-ax5.hist(mud_post['area (m^2)'][mud_post['prop_of_sink_minedmean'] >= mined_threshold][mud_post['_ELEVmean'] > mud_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax5.hist(mud_pre['area (m^2)'][mud_pre['prop_of_sink_minedmean'] >= mined_threshold][mud_pre['_ELEVmean'] > mud_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
-ax5.hist(mud_pre['area (m^2)'][mud_pre['prop_of_sink_minedmean'] >= mined_threshold][mud_pre['_ELEVmean'] > mud_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax5.hist(bins[:-1], bins, weights = mined_counts['mud', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
+ax5.hist(bins[:-1], bins, weights = mined_counts['mud', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax5.hist(bins[:-1], bins, weights = mined_counts['mud', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
+ax5.hist(bins[:-1], bins, weights = mined_counts['mud', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 ax5.set_xscale('log')
 ax5.set_yscale('log')
 
 #plot 6: mud river, unmined areas
-bins = np.logspace(2, 6, num=20)
-ax6.hist(mud_post['area (m^2)'][mud_post['prop_of_sink_minedmean'] < unmined_threshold][mud_post['_ELEVmean'] > mud_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
-ax6.hist(mud_post['area (m^2)'][mud_post['prop_of_sink_minedmean'] < unmined_threshold][mud_post['_ELEVmean'] > mud_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax6.hist(mud_pre['area (m^2)'][mud_pre['prop_of_sink_minedmean'] < unmined_threshold][mud_pre['_ELEVmean'] > mud_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
-ax6.hist(mud_pre['area (m^2)'][mud_pre['prop_of_sink_minedmean'] < unmined_threshold][mud_pre['_ELEVmean'] > mud_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax6.hist(bins[:-1], bins, weights = unmined_counts['mud', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
+ax6.hist(bins[:-1], bins, weights = unmined_counts['mud', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax6.hist(bins[:-1], bins, weights = unmined_counts['mud', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
+ax6.hist(bins[:-1], bins, weights = unmined_counts['mud', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 ax6.set_xscale('log')
 ax6.set_yscale('log')
 
 #plot 7: spruce fork, mined areas
-bins = np.logspace(2, 6, num=20)
-ax7.hist(spruce_post['area (m^2)'][spruce_post['prop_of_sink_minedmean'] >= mined_threshold][spruce_post['_ELEVmean'] > spruce_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
-ax7.hist(spruce_post['area (m^2)'][spruce_post['prop_of_sink_minedmean'] >= mined_threshold][spruce_post['_ELEVmean'] > spruce_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax7.hist(spruce_pre['area (m^2)'][spruce_pre['prop_of_sink_minedmean'] >= mined_threshold][spruce_pre['_ELEVmean'] > spruce_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
-ax7.hist(spruce_pre['area (m^2)'][spruce_pre['prop_of_sink_minedmean'] >= mined_threshold][spruce_pre['_ELEVmean'] > spruce_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax7.hist(bins[:-1], bins, weights = mined_counts['spruce', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
+ax7.hist(bins[:-1], bins, weights = mined_counts['spruce', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax7.hist(bins[:-1], bins, weights = mined_counts['spruce', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
+ax7.hist(bins[:-1], bins, weights = mined_counts['spruce', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 
 ax7.set_xscale('log')
 ax7.set_yscale('log')
 
 #plot 8: spruce fork, unmined areas
-bins = np.logspace(2, 6, num=20)
-ax8.hist(spruce_post['area (m^2)'][spruce_post['prop_of_sink_minedmean'] < unmined_threshold][spruce_post['_ELEVmean'] > spruce_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
-ax8.hist(spruce_post['area (m^2)'][spruce_post['prop_of_sink_minedmean'] < unmined_threshold][spruce_post['_ELEVmean'] > spruce_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax8.hist(spruce_pre['area (m^2)'][spruce_pre['prop_of_sink_minedmean'] < unmined_threshold][spruce_pre['_ELEVmean'] > spruce_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
-ax8.hist(spruce_pre['area (m^2)'][spruce_pre['prop_of_sink_minedmean'] < unmined_threshold][spruce_pre['_ELEVmean'] > spruce_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax8.hist(bins[:-1], bins, weights = unmined_counts['spruce', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
+ax8.hist(bins[:-1], bins, weights = unmined_counts['spruce', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax8.hist(bins[:-1], bins, weights = unmined_counts['spruce', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
+ax8.hist(bins[:-1], bins, weights = unmined_counts['spruce', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 ax8.set_xscale('log')
 ax8.set_yscale('log')
 
 #plot 9: white oak, mined areas
-bins = np.logspace(2, 6, num=20)
-ax9.hist(white_post['area (m^2)'][white_post['prop_of_sink_minedmean'] >= mined_threshold][white_post['_ELEVmean'] > white_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
-ax9.hist(white_post['area (m^2)'][white_post['prop_of_sink_minedmean'] >= mined_threshold][white_post['_ELEVmean'] > white_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax9.hist(white_pre['area (m^2)'][white_pre['prop_of_sink_minedmean'] >= mined_threshold][white_pre['_ELEVmean'] > white_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
-ax9.hist(white_pre['area (m^2)'][white_pre['prop_of_sink_minedmean'] >= mined_threshold][white_pre['_ELEVmean'] > white_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax9.hist(bins[:-1], bins, weights = mined_counts['white', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
+ax9.hist(bins[:-1], bins, weights = mined_counts['white', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax9.hist(bins[:-1], bins, weights = mined_counts['white', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
+ax9.hist(bins[:-1], bins, weights = mined_counts['white', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 
 ax9.set_xscale('log')
 ax9.set_yscale('log')
 
 #plot 10: white oak, unmined areas
-bins = np.logspace(2, 6, num=20)
-ax10.hist(white_post['area (m^2)'][white_post['prop_of_sink_minedmean'] < unmined_threshold][white_post['_ELEVmean'] > white_elev_threshold], bins, histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
-ax10.hist(white_post['area (m^2)'][white_post['prop_of_sink_minedmean'] < unmined_threshold][white_post['_ELEVmean'] > white_elev_threshold], bins, histtype='step', color = '#fc8d62', linewidth = 2)
-ax10.hist(white_pre['area (m^2)'][white_pre['prop_of_sink_minedmean'] < unmined_threshold][white_pre['_ELEVmean'] > white_elev_threshold], bins, histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
-ax10.hist(white_pre['area (m^2)'][white_pre['prop_of_sink_minedmean'] < unmined_threshold][white_pre['_ELEVmean'] > white_elev_threshold], bins, histtype='step', color = '#8da0cb', linewidth = 2)
+ax10.hist(bins[:-1], bins, weights = unmined_counts['white', 'post'], histtype='stepfilled', color = '#fc8d62', alpha = 0.5)
+ax10.hist(bins[:-1], bins, weights = unmined_counts['white', 'post'], histtype='step', color = '#fc8d62', linewidth = 2)
+ax10.hist(bins[:-1], bins, weights = unmined_counts['white', 'pre'], histtype='stepfilled', color = '#8da0cb', alpha = 0.5)
+ax10.hist(bins[:-1], bins, weights = unmined_counts['white', 'pre'], histtype='step', color = '#8da0cb', linewidth = 2)
 ax10.set_xscale('log')
 ax10.set_yscale('log')
 
@@ -21,62 +21,51 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
+
+from basin_store import elevation_percentile
+from depression_catalog import open_catalog
 
 #import dataset of closed depressions with proportion mined and average elevation;
 #these data derive from flow routing ('see depression_identification.py') and have had
 #proportion mined, depression mean elevation, and depression filled surface elevation 
-#data added by using the zonal statistics tool in QGIS.
-ben_pre = pd.read_csv('bencreek_pre_depressions_prop_mined_elev_filled.csv')
-ben_post = pd.read_csv('bencreek_post_depressions_prop_mined_elev_filled.csv')
-laurel_pre = pd.read_csv('laurelcreek_pre_depressions_prop_mined_elev_filled.csv')
-laurel_post = pd.read_csv('laurelcreek_post_depressions_prop_mined_elev_filled.csv')
-mud_pre = pd.read_csv('mudriver_pre_depressions_prop_mined_elev_filled.csv')
-mud_post = pd.read_csv('mudriver_post_depressions_prop_mined_elev_filled.csv')
-spruce_pre = pd.read_csv('sprucefork_pre_depressions_prop_mined_elev_filled.csv')
-spruce_post = pd.read_csv('sprucefork_post_depressions_prop_mined_elev_filled.csv')
-white_pre = pd.read_csv('whiteoak_pre_depressions_prop_mined_elev_filled.csv')
-white_post = pd.read_csv('whiteoak_post_depressions_prop_mined_elev_filled.csv')
+#data added by using the zonal statistics tool in QGIS. depression_identification.py now
+#writes the same tables itself (see depression_statistics.py). The ten tables are combined
+#into one catalog (see depression_catalog.py), which is rebuilt when a table changes.
+basins = {'ben': 'bencreek', 'laurel': 'laurelcreek', 'mud': 'mudriver', 'spruce': 'sprucefork',
+          'white': 'whiteoak'}
+catalog = open_catalog('depression_catalog',
+                       {(basin, epoch): name + '_' + epoch + '_depressions_prop_mined_elev_filled.csv'
+                        for basin, name in basins.items() for epoch in ['pre', 'post']},
+                       columns=['area (m^2)', '_ELEVmean', '_ELEVFILLEDmean'])
 
 #calculate the volume of each depression by multiplying its area by the difference between
 #its mean elevation and its filled elevation
-ben_pre['dep_volume'] = ben_pre['area (m^2)'] * (ben_pre['_ELEVFILLEDmean'] - ben_pre['_ELEVmean'])
-ben_post['dep_volume'] = ben_post['area (m^2)'] * (ben_post['_ELEVFILLEDmean'] - ben_post['_ELEVmean'])
-laurel_pre['dep_volume'] = laurel_pre['area (m^2)'] * (laurel_pre['_ELEVFILLEDmean'] - laurel_pre['_ELEVmean'])
-laurel_post['dep_volume'] = laurel_post['area (m^2)'] * (laurel_post['_ELEVFILLEDmean'] - laurel_post['_ELEVmean'])
-mud_pre['dep_volume'] = mud_pre['area (m^2)'] * (mud_pre['_ELEVFILLEDmean'] - mud_pre['_ELEVmean'])
-mud_post['dep_volume'] = mud_post['area (m^2)'] * (mud_post['_ELEVFILLEDmean'] - mud_post['_ELEVmean'])
-spruce_pre['dep_volume'] = spruce_pre['area (m^2)'] * (spruce_pre['_ELEVFILLEDmean'] - spruce_pre['_ELEVmean'])
-spruce_post['dep_volume'] = spruce_post['area (m^2)'] * (spruce_post['_ELEVFILLEDmean'] - spruce_post['_ELEVmean'])
-white_pre['dep_volume'] = white_pre['area (m^2)'] * (white_pre['_ELEVFILLEDmean'] - white_pre['_ELEVmean'])
-white_post['dep_volume'] = white_post['area (m^2)'] * (white_post['_ELEVFILLEDmean'] - white_post['_ELEVmean'])
+catalog.table['dep_volume'] = catalog.table['area (m^2)'] * (catalog.table['_ELEVFILLEDmean'] - catalog.table['_ELEVmean'])
 
 #calculate the xxth percentile of pre-mining elevation for each basin. This will be used 
 #to mask out closed depressions that fall low in the landscape because they are in
 #river valleys which are 1) unmined and 2) very subject to DEM errors that generate sinks.
+#The percentiles are computed once per DEM and stored next to it (see basin_store.py), so
+#the DEMs are not loaded here.
 
 percentile = 20
-ben_elev_threshold = np.percentile(ben_pre_topo[ben_pre_topo > 0], percentile)
-laurel_elev_threshold = np.percentile(laurel_pre_topo[laurel_pre_topo > 0], percentile)
-mud_elev_threshold = np.percentile(mud_pre_topo[mud_pre_topo > 0], percentile)
-spruce_elev_threshold = np.percentile(spruce_pre_topo[spruce_pre_topo > 0], percentile)
-white_elev_threshold = np.percentile(white_pre_topo[white_pre_topo > 0], percentile)
+ben_elev_threshold = elevation_percentile("input_dems/bencreek/bencreek_pre_10m.asc", percentile)
+laurel_elev_threshold = elevation_percentile("input_dems/laurelcreek/laurelcreek_pre_10m.asc", percentile)
+mud_elev_threshold = elevation_percentile("input_dems/mudriver/mudriver_pre_10m.asc", percentile)
+spruce_elev_threshold = elevation_percentile("input_dems/sprucefork/sprucefork_pre_10m.asc", percentile)
+white_elev_threshold = elevation_percentile("input_dems/whiteoak/whiteoak_pre_10m.asc", percentile)
 
 #make Figure 8
 x = np.arange(5)
 width = 0.4
 names = ['Ben\n' 'Creek', 'Laurel\n' 'Creek', 'Mud\n' 'River', 'Spruce\n' 'Fork', 'White\n' 'Oak']
-pre_mine_volumes = [ben_pre['dep_volume'][ben_pre['_ELEVmean'] > ben_elev_threshold].sum(),
-                   laurel_pre['dep_volume'][laurel_pre['_ELEVmean'] > laurel_elev_threshold].sum(),
-                   mud_pre['dep_volume'][mud_pre['_ELEVmean'] > mud_elev_threshold].sum(),
-                   spruce_pre['dep_volume'][spruce_pre['_ELEVmean'] > spruce_elev_threshold].sum(),
-                   white_pre['dep_volume'][white_pre['_ELEVmean'] > white_elev_threshold].sum()]
-post_mine_volumes = [ben_post['dep_volume'][ben_post['_ELEVmean'] > ben_elev_threshold].sum(),
-                   laurel_post['dep_volume'][laurel_post['_ELEVmean'] > laurel_elev_threshold].sum(),
-                   mud_post['dep_volume'][mud_post['_ELEVmean'] > mud_elev_threshold].sum(),
-                   spruce_post['dep_volume'][spruce_post['_ELEVmean'] > spruce_elev_threshold].sum(),
-                   white_post['dep_volume'][white_post['_ELEVmean'] > white_elev_threshold].sum()]
-                   
+elev_thresholds = {'ben': ben_elev_threshold, 'laurel': laurel_elev_threshold,
+                   'mud': mud_elev_threshold, 'spruce': spruce_elev_threshold,
+                   'white': white_elev_threshold}
+volumes = catalog.sums('dep_volume', elevation_above=elev_thresholds)
+pre_mine_volumes = [volumes[basin, 'pre'] for basin in basins]
+post_mine_volumes = [volumes[basin, 'post'] for basin in basins]
+
 fig = plt.figure(figsize=(6,4))
 ax = plt.subplot()
 ax.bar(x-0.2, pre_mine_volumes, width, color = '#8da0cb', edgecolor = 'k', label = 'Pre-mining DEM')
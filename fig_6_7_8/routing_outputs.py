@@ -0,0 +1,57 @@
+########################################################################
+#Writing the flow routing outputs of depression_identification.py (Figures 6-8 data).
+
+#Brief description: written with write_esri_ascii, the depression-free elevation and
+#flood status grids of the study basins take several GB (every cell spelled out as text
+#with 18 significant digits, including the 0/1 flood status). With output_format = 'tif',
+#write_outputs() writes them as tiled, DEFLATE-compressed GeoTIFFs instead: the
+#depression-free elevation as float64 or float32, the flood status bit-packed (1 bit per
+#cell). The georeferencing comes from the header of the input DEM, so the outputs line up
+#with the DEMs and mining masks in GIS, and a CRS can be attached (the ASCII files have
+#none).
+
+########################################################################
+
+import os
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from landlab.io.esri_ascii import write_esri_ascii
+
+#output fields and the suffixes of their file names
+fields = {'depression_free_elevation': '_depression_free_elev',
+          'flood_status': '_flood_status'}
+
+#path of the output of field for the DEM name in output_dir
+def output_path(output_dir, name, field, output_format='asc'):
+    return os.path.join(output_dir, name + fields[field] + '.' + output_format)
+
+#write the output fields of a routed Landlab grid. header is the ESRI ASCII header of the
+#input DEM (see depression_statistics.read_ascii_header); dtype is the type of the
+#depression-free elevation in GeoTIFFs.
+def write_outputs(mg, name, header, output_dir, output_format='asc', dtype=np.float64,
+                  crs=None, block_size=256):
+    for field in fields:
+        path = output_path(output_dir, name, field, output_format)
+        if output_format == 'asc':
+            write_esri_ascii(path, mg, names=[field])
+            continue
+
+        #Landlab grids start at the bottom row; rasters at the top
+        values = np.flipud(mg.at_node[field].reshape(mg.shape))
+        profile = {'driver': 'GTiff', 'width': values.shape[1], 'height': values.shape[0],
+                   'count': 1, 'crs': crs, 'compress': 'deflate', 'BIGTIFF': 'IF_SAFER',
+                   'tiled': True, 'blockxsize': block_size, 'blockysize': block_size,
+                   'transform': from_origin(header['xllcorner'],
+                                            header['yllcorner'] + header['nrows'] * header['cellsize'],
+                                            header['cellsize'], header['cellsize'])}
+        if field == 'flood_status':
+            profile.update(dtype='uint8', nbits=1)
+            values = (values == 1).astype(np.uint8)
+        else:
+            profile.update(dtype=np.dtype(dtype).name, predictor=3,
+                           nodata=header.get('nodata_value'))
+            values = values.astype(dtype)
+        with rasterio.open(path, 'w', **profile) as dst:
+            dst.write(values, 1)
+
@@ -0,0 +1,179 @@
+########################################################################
+#Sensitivity of the depression size distributions of Figures 7 and 8 to their thresholds.
+
+#Brief description: fig7.py and fig8.py classify depressions as mined (at least 90% of the
+#depression mined) or unmined (less than 10%) and drop those below the 20th percentile of
+#pre-mining elevation in their basin. ThresholdSweep computes the area histograms and total
+#volumes of every basin and epoch for whole grids of mined thresholds, unmined thresholds,
+#and elevation percentiles at once. Instead of masking the depressions again for every
+#combination, each depression is counted once in a table indexed by its class among the
+#sorted thresholds (how many mined thresholds its proportion mined reaches, how many
+#elevation thresholds it is above) and its area bin; cumulative sums over that table give
+#the counts and volumes of all combinations. Hundreds of combinations take about as long as
+#one.
+
+#Run as a script, it sweeps the grids below over the Figure 7-8 depression catalog and
+#writes threshold_sweep.csv (number and total volume of the selected depressions for every
+#basin, epoch, class, threshold, and percentile) and threshold_sweep_histograms.npz (the
+#area histograms).
+
+########################################################################
+
+import numpy as np
+import pandas as pd
+
+from basin_store import elevation_percentiles
+
+class ThresholdSweep:
+
+    #catalog: a DepressionCatalog with area, prop_of_sink_minedmean and _ELEVmean columns
+    #(and volume_column, if given); dem_paths: dict of basin -> path of the pre-mining DEM
+    #whose elevation percentiles are the thresholds; bins: edges of the area histograms
+    def __init__(self, catalog, dem_paths, mined_thresholds, unmined_thresholds, percentiles,
+                 bins, area_column='area (m^2)', volume_column=None):
+        self.mined_thresholds = np.asarray(mined_thresholds, dtype=np.float64)
+        self.unmined_thresholds = np.asarray(unmined_thresholds, dtype=np.float64)
+        self.percentiles = list(percentiles)
+        self.bins = np.asarray(bins, dtype=np.float64)
+        n_bins = len(self.bins) - 1
+
+        table = catalog.table
+        prop = table['prop_of_sink_minedmean'].to_numpy()
+        elevation = table['_ELEVmean'].to_numpy()
+        area = table[area_column].to_numpy()
+        volume = table[volume_column].to_numpy() if volume_column else np.zeros(len(table))
+        volume = np.where(np.isnan(volume), 0, volume) #NaN volumes are skipped, as pandas does
+
+        #area bin of every depression as np.histogram assigns it; n_bins: outside the bins
+        bin_index = np.searchsorted(self.bins, area, side='right') - 1
+        bin_index[area == self.bins[-1]] = n_bins - 1
+        bin_index[(bin_index < 0) | (bin_index >= n_bins)] = n_bins
+
+        #elevation thresholds of every basin, in the order of percentiles
+        self.elevation_thresholds = {}
+        for basin in {basin for basin, _ in catalog.groups}:
+            values = elevation_percentiles(dem_paths[basin], self.percentiles)
+            self.elevation_thresholds[basin] = np.array([values[q] for q in self.percentiles])
+
+        #(basin, epoch) -> {'mined': (mined thresholds, percentiles, bins + 1),
+        #'unmined': (unmined thresholds, ...), 'all': (percentiles, bins + 1)} counts and volumes;
+        #the last bin counts the depressions outside the histogram bins
+        self.counts, self.volumes = {}, {}
+        for key, rows in catalog.groups.items():
+            z = self.elevation_thresholds[key[0]]
+            counts, volumes = {}, {}
+            for weights, out in [(None, counts), (volume[rows], volumes)]:
+                out.update(_sweep(prop[rows], elevation[rows], bin_index[rows], weights,
+                                  self.mined_thresholds, self.unmined_thresholds, z, n_bins))
+            self.counts[key] = counts
+            self.volumes[key] = {c: v.sum(axis=-1) for c, v in volumes.items()}
+
+    #area histogram of the depressions of basin and epoch in class mining ('mined',
+    #'unmined', or 'all') above the elevation percentile; threshold is the mined or
+    #unmined threshold (ignored for 'all')
+    def histogram(self, basin, epoch, mining, percentile, threshold=None):
+        return self._lookup(self.counts, basin, epoch, mining, percentile, threshold)[:-1]
+
+    #total volume of the depressions selected as in histogram()
+    def volume(self, basin, epoch, mining, percentile, threshold=None):
+        return self._lookup(self.volumes, basin, epoch, mining, percentile, threshold)
+
+    def _lookup(self, results, basin, epoch, mining, percentile, threshold):
+        values = results[basin, epoch][mining]
+        if mining != 'all':
+            grid = self.mined_thresholds if mining == 'mined' else self.unmined_thresholds
+            values = values[int(np.flatnonzero(grid == threshold)[0])]
+        return values[self.percentiles.index(percentile)]
+
+    #one row per basin, epoch, class, threshold, and percentile with the number and total
+    #volume of the selected depressions (also those outside the histogram bins)
+    def table(self):
+        rows = []
+        for (basin, epoch), counts in self.counts.items():
+            volumes = self.volumes[basin, epoch]
+            for mining, grid in [('mined', self.mined_thresholds),
+                                 ('unmined', self.unmined_thresholds), ('all', [np.nan])]:
+                for i, threshold in enumerate(grid):
+                    for j, percentile in enumerate(self.percentiles):
+                        index = (j,) if mining == 'all' else (i, j)
+                        rows.append({'basin': basin, 'epoch': epoch, 'mining': mining,
+                                     'threshold': threshold, 'percentile': percentile,
+                                     'elevation_threshold': self.elevation_thresholds[basin][j],
+                                     'count': counts[mining][index].sum(),
+                                     'volume': volumes[mining][index]})
+        return pd.DataFrame(rows)
+
+    #save the histograms to an .npz file: one array per basin, epoch, and class
+    #('<basin>_<epoch>_<class>', the bin axis last) plus the grids and bin edges
+    def save_histograms(self, path):
+        arrays = {'mined_thresholds': self.mined_thresholds,
+                  'unmined_thresholds': self.unmined_thresholds,
+                  'percentiles': np.asarray(self.percentiles, dtype=np.float64), 'bins': self.bins}
+        for (basin, epoch), counts in self.counts.items():
+            for mining, values in counts.items():
+                arrays['%s_%s_%s' % (basin, epoch, mining)] = values[..., :-1]
+        np.savez_compressed(path, **arrays)
+
+#counts (or sums of weights) of one group of depressions for every combination of mined
+#threshold, unmined threshold, and elevation threshold z, per area bin
+def _sweep(prop, elevation, bin_index, weights, mined_thresholds, unmined_thresholds, z, n_bins):
+    #class of every depression among the sorted thresholds: above[d] > j if it lies above the
+    #j-th smallest elevation threshold, reached[d] > i if its proportion mined is at least
+    #the i-th smallest mined threshold, under[d] <= i if it is below the i-th smallest
+    #unmined threshold. Depressions without a (proportion mined) value are in no class.
+    z_order, m_order, u_order = np.argsort(z), np.argsort(mined_thresholds), np.argsort(unmined_thresholds)
+    has_elevation = ~np.isnan(elevation)
+    has_prop = has_elevation & ~np.isnan(prop)
+    above = np.searchsorted(z[z_order], elevation, side='left')
+    reached = np.searchsorted(mined_thresholds[m_order], prop, side='right')
+    under = np.searchsorted(unmined_thresholds[u_order], prop, side='right')
+    n_z, n_m, n_u = len(z), len(mined_thresholds), len(unmined_thresholds)
+
+    def table(index, n, keep):
+        shape = (n + 1, n_z + 1, n_bins + 1)
+        flat = np.ravel_multi_index((index[keep], above[keep], bin_index[keep]), shape)
+        w = weights[keep] if weights is not None else None
+        return np.bincount(flat, weights=w, minlength=int(np.prod(shape))).reshape(shape)
+
+    #sum over above > j for every j: reversed cumulative sum, dropping the "below all" class
+    def above_each(t):
+        return np.flip(np.cumsum(np.flip(t, axis=1), axis=1), axis=1)[:, 1:]
+
+    mined = above_each(table(reached, n_m, has_prop))
+    mined = np.flip(np.cumsum(np.flip(mined, axis=0), axis=0), axis=0)[1:]
+    unmined = np.cumsum(above_each(table(under, n_u, has_prop)), axis=0)[:n_u]
+    everything = above_each(table(np.zeros(len(prop), dtype=np.int64), 0, has_elevation))[0]
+
+    #back to the order of the grids as given
+    return {'mined': mined[np.argsort(m_order)][:, np.argsort(z_order)],
+            'unmined': unmined[np.argsort(u_order)][:, np.argsort(z_order)],
+            'all': everything[np.argsort(z_order)]}
+
+if __name__ == '__main__':
+    from depression_catalog import open_catalog
+
+    #grids of the sweep: mined thresholds (proportion mined at or above which a depression
+    #is "mined"), unmined thresholds (below which it is "unmined"), and percentiles of
+    #pre-mining elevation below which depressions are dropped
+    mined_thresholds = np.round(np.arange(0.5, 1.0001, 0.05), 2)
+    unmined_thresholds = np.round(np.arange(0.05, 0.5001, 0.05), 2)
+    percentiles = list(range(0, 51, 5))
+
+    #area bins of the histograms (those of Figure 7)
+    bins = np.logspace(2, 6, num=20)
+
+    basins = {'ben': 'bencreek', 'laurel': 'laurelcreek', 'mud': 'mudriver', 'spruce': 'sprucefork',
+              'white': 'whiteoak'}
+    catalog = open_catalog('depression_catalog',
+                           {(basin, epoch): name + '_' + epoch + '_depressions_prop_mined_elev_filled.csv'
+                            for basin, name in basins.items() for epoch in ['pre', 'post']},
+                           columns=['area (m^2)', 'prop_of_sink_minedmean', '_ELEVmean', '_ELEVFILLEDmean'])
+
+    #depression volumes as in fig8.py
+    catalog.table['dep_volume'] = catalog.table['area (m^2)'] * (catalog.table['_ELEVFILLEDmean'] - catalog.table['_ELEVmean'])
+
+    dem_paths = {basin: 'input_dems/' + name + '/' + name + '_pre_10m.asc' for basin, name in basins.items()}
+    sweep = ThresholdSweep(catalog, dem_paths, mined_thresholds, unmined_thresholds, percentiles,
+                           bins, volume_column='dep_volume')
+    sweep.table().to_csv('threshold_sweep.csv', index=False)
+    sweep.save_histograms('threshold_sweep_histograms.npz')
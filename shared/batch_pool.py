@@ -0,0 +1,93 @@
+########################################################################
+#Memory-aware process pool for batches of independent files (Figures 6-8 data).
+
+#Brief description: run_batch() applies a function to a batch of inputs (e.g. DEMs) in a
+#pool of worker processes. The inputs are started largest first, so the big ones do not
+#end up running alone at the end of the batch, and an input is only started while the
+#estimated memory of all running inputs stays below memory_limit (one input always runs,
+#however large). A failure is reported for its input only: exceptions raised by func are
+#caught and handed back. If a worker process dies (e.g. killed for running out of
+#memory), it is not known which of the inputs running at the time it was working on, so
+#each of them is run again on its own in a fresh process: only an input whose process
+#dies while it runs alone is reported as failed. The pool is then restarted for the rest
+#of the batch.
+
+########################################################################
+
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+#error of an input whose worker process died
+died = 'worker process died (out of memory?)'
+
+#run func(item) in a worker process for every item of items (with n_workers = 1, in this
+#process). estimate(item) is the expected peak memory of func(item), in the same units as
+#memory_limit (None: no limit). Yields (item, result, error) as the inputs finish, where
+#error is None on success and the formatted traceback otherwise.
+def run_batch(func, items, n_workers=1, estimate=None, memory_limit=None):
+    sizes = {i: _size(estimate, item) for i, item in enumerate(items)}
+    pending = sorted(sizes, key=sizes.get, reverse=True)
+
+    if n_workers <= 1:
+        for i in pending:
+            yield _call(func, items[i])
+        return
+
+    while pending:
+        running = {}
+        broken = False
+        crashed = []    #inputs that were running when the pool broke
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            while running or (pending and not broken):
+                #start the largest pending inputs that fit next to the running ones
+                for i in list(pending) if not broken else []:
+                    if len(running) >= n_workers:
+                        break
+                    in_use = sum(sizes[j] for j in running.values())
+                    if running and memory_limit is not None and in_use + sizes[i] > memory_limit:
+                        continue
+                    try:
+                        running[pool.submit(_call, func, items[i])] = i
+                    except BrokenProcessPool:
+                        broken = True
+                        break
+                    pending.remove(i)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    try:
+                        yield future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        crashed.append(i)
+
+        #the inputs that were running in a broken pool, one at a time; the rest get a new pool
+        for i in crashed:
+            yield _call_alone(func, items[i]) if len(crashed) > 1 else (items[i], None, died)
+
+#estimate(item), or 0 if there is no estimate or it fails (a broken input then fails in
+#func and is reported there)
+def _size(estimate, item):
+    if estimate is None:
+        return 0
+    try:
+        return estimate(item)
+    except Exception:
+        return 0
+
+#_call(func, item) in a process of its own
+def _call_alone(func, item):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+            return pool.submit(_call, func, item).result()
+        except BrokenProcessPool:
+            return item, None, died
+
+#func(item) with any exception caught, as (item, result, error)
+def _call(func, item):
+    try:
+        return item, func(item), None
+    except Exception:
+        return item, None, traceback.format_exc()
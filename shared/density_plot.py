@@ -0,0 +1,19 @@
+########################################################################
+#Density curves drawn like seaborn's kdeplot, shared by Figure 4 and Figure 10.
+
+#Brief description: fig4.py (posterior densities of the rank correlations, see
+#fig_4/posterior_density.py) and fig10.py (NDVI densities, see fig_10/ndvi_density.py)
+#compute their kernel density curves themselves instead of calling seaborn.kdeplot.
+#plot_density() draws such a curve so that the figures look as before: a plain line whose
+#sticky y edge at 0 keeps matplotlib's autoscaling from adding a margin below the curve.
+
+########################################################################
+
+import numpy as np
+
+#draw the density curve (x, density) on ax the way seaborn.kdeplot draws it (autoscaling
+#leaves no margin below 0); kwargs go to ax.plot
+def plot_density(ax, x, density, **kwargs):
+    line, = ax.plot(x, density, **kwargs)
+    line.sticky_edges.y[:] = [0, np.inf]
+    return line
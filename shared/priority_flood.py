@@ -0,0 +1,203 @@
+########################################################################
+#Priority-Flood depression filling shared by the Figure 4 and Figures 6-8 analyses.
+
+#Brief description: an implementation of the Priority-Flood algorithm
+#(Barnes et al., 2014, Computers & Geosciences 62, 117-127) including the "pit queue"
+#improvement, which sends cells that are raised inside a depression through a FIFO
+#queue instead of the priority queue. Unlike the RichDEM routine used by Landlab's
+#PriorityFloodFlowRouter, it lets the caller choose which cells are outlets (e.g. cells
+#next to nodata, or every cell on the edge of a tile) and it can return, for every cell,
+#the outlet that flooded it (its label) and the neighbor it was flooded from (its
+#parent). The tiled regional router (fig_4/tiled_routing.py) is built on the labels;
+#update_fill() uses the parents to fill a DEM again after some of its cells changed,
+#flooding only the part of the DEM that depends on them.
+
+#Cells are addressed by their flat index in the array; neighbors follow the D8 order
+#used throughout: E, N, W, S, NE, NW, SW, SE (north is row - 1).
+
+#The flood visits the cells one at a time, so it cannot be written as whole-array NumPy
+#operations. Its loop (and the other per-cell loops of the tiled router) is compiled with
+#numba if it is installed, working directly on the NumPy arrays; without numba the same
+#code runs as plain Python on lists, which gives the same results but is much slower
+#and holds several Python objects per cell.
+
+########################################################################
+
+import heapq
+import numpy as np
+from scipy import ndimage
+
+try:
+    from numba import njit
+except ImportError: #the loops then run as plain Python
+    njit = None
+
+#func compiled by numba (if installed); call it with the arrays from loop_arrays()
+def compiled(func):
+    return njit(cache=True, nogil=True)(func) if njit is not None else func
+
+#the arrays a compiled loop works on: the arrays themselves with numba, lists without
+#(plain Python is much faster on lists than on NumPy scalars)
+def loop_arrays(*arrays):
+    if njit is not None:
+        return arrays
+    return tuple(np.asarray(ar).tolist() for ar in arrays)
+
+#(row, column) offsets and lengths (in cells) of the eight D8 neighbors
+d8_offsets = [(0, 1), (-1, 0), (0, -1), (1, 0), (-1, 1), (-1, -1), (1, -1), (1, 1)]
+d8_lengths = np.array([1, 1, 1, 1, 2**0.5, 2**0.5, 2**0.5, 2**0.5])
+
+#valid cells that are outlets of the grid: cells on the edge of the array and cells next
+#to an invalid (nodata) cell
+def edge_and_nodata_cells(valid):
+    padded = np.pad(valid, 1, constant_values=False)
+    touches_invalid = np.zeros(valid.shape, dtype=bool)
+    for dr, dc in d8_offsets:
+        touches_invalid |= ~padded[1 + dr:padded.shape[0] - 1 + dr, 1 + dc:padded.shape[1] - 1 + dc]
+    return valid & touches_invalid
+
+#fill all depressions in z. valid marks the cells with data and seeds the outlet cells,
+#which keep their elevation (or seed_levels, if given, at the seed cells) and from which
+#the flood starts. Returns the filled elevations (nodata cells keep their value from z)
+#and, on request, the label (0..number of seeds - 1, in flat index order of the seeds;
+#-1 for cells not reached) and the parent (flat index of the neighbor a cell was flooded
+#from; -1 for seeds and cells not reached) of every cell.
+def priority_flood(z, valid, seeds, seed_levels=None, return_labels=False,
+                   return_parents=False):
+    nrows, ncols = z.shape
+    width = ncols + 2
+
+    #work on arrays with a one-cell invalid border so no bounds checks are needed
+    zp = np.pad(np.asarray(z, dtype=np.float64), 1).ravel()
+    open_ = np.pad(np.asarray(valid, dtype=bool), 1, constant_values=False).ravel()
+    offsets = np.array([dr * width + dc for dr, dc in d8_offsets], dtype=np.int64)
+
+    seed_rows, seed_cols = np.nonzero(seeds & valid)
+    seed_idx = ((seed_rows + 1) * width + seed_cols + 1).astype(np.int64)
+    if seed_levels is not None:
+        levels = np.asarray(seed_levels, dtype=np.float64)[seed_rows, seed_cols]
+    else:
+        levels = zp[seed_idx]
+
+    filled = zp.copy()
+    label = np.full(len(zp), -1, dtype=np.int64)
+    parent = np.full(len(zp), -1, dtype=np.int64)
+    if len(seed_idx):
+        arrays = loop_arrays(zp, open_, filled, label, parent, offsets, seed_idx, levels,
+                             np.zeros(len(zp), dtype=np.int64))
+        _flood(*arrays)
+        filled, label, parent = (np.asarray(ar) for ar in arrays[2:5])
+
+    filled = filled.astype(np.float64).reshape(nrows + 2, ncols + 2)[1:-1, 1:-1]
+    out = [filled]
+    if return_labels:
+        out.append(label.astype(np.int64).reshape(nrows + 2, ncols + 2)[1:-1, 1:-1])
+    if return_parents:
+        #convert parents from padded to unpadded flat indices
+        p = parent.astype(np.int64)
+        has_parent = p >= 0
+        p[has_parent] = (p[has_parent] // width - 1) * ncols + p[has_parent] % width - 1
+        out.append(p.reshape(nrows + 2, ncols + 2)[1:-1, 1:-1])
+    return out[0] if len(out) == 1 else tuple(out)
+
+#the flood of priority_flood on the padded, flattened grid (filled, label, and parent are
+#updated in place). Cells raised inside a depression go through the pit queue, a FIFO in
+#pit (every cell enters it at most once), instead of the priority queue.
+@compiled
+def _flood(zp, open_, filled, label, parent, offsets, seed_idx, levels, pit):
+    heap = [(levels[0], seed_idx[0])]
+    heap.pop()
+    for k in range(len(seed_idx)):
+        i = seed_idx[k]
+        filled[i] = levels[k]
+        label[i] = k
+        open_[i] = False
+        heap.append((levels[k], i))
+    heapq.heapify(heap)
+    head = tail = 0
+
+    while heap or head < tail:
+        if head < tail:
+            c = pit[head]
+            head += 1
+        else:
+            c = heapq.heappop(heap)[1]
+        fc = filled[c]
+        lc = label[c]
+        for off in offsets:
+            n = c + off
+            if open_[n]:
+                open_[n] = False
+                label[n] = lc
+                parent[n] = c
+                if zp[n] <= fc:
+                    filled[n] = fc
+                    pit[tail] = n
+                    tail += 1
+                else:
+                    heapq.heappush(heap, (zp[n], n))
+
+#update the fill of a DEM after the elevations of some cells changed (e.g. by mining)
+#without flooding the whole DEM again. z_old, filled_old, and parents_old are the
+#elevations and the result of priority_flood(..., return_parents=True) before the change;
+#valid and seeds must be the same before and after. Only cells whose fill can change are
+#flooded again: the changed cells, every flooded depression they lie in or next to (whose
+#level can drop), and all cells flooded from those (their descendants in the flood tree,
+#whose level can rise or drop with them). All other cells keep their fill, which seeds
+#the new flood at the edge of that region, so the result is the same as a full
+#priority_flood of z_new. Returns the filled elevations, the parents (for the next
+#update), and the mask of cells flooded again.
+def update_fill(z_old, filled_old, parents_old, z_new, valid, seeds, changed=None):
+    valid, seeds = np.asarray(valid, dtype=bool), np.asarray(seeds, dtype=bool)
+    if changed is None:
+        changed = valid & (z_old != z_new)
+    nrows, ncols = z_new.shape
+
+    #flooded depressions (8-connected flooded cells, which always share one level) in or
+    #next to a changed cell
+    flooded = valid & (filled_old > z_old)
+    pools, n_pools = ndimage.label(flooded, structure=np.ones((3, 3), dtype=bool))
+    near = ndimage.binary_dilation(changed, structure=np.ones((3, 3), dtype=bool))
+    touched = np.unique(pools[near & flooded])
+    start = changed | (flooded & np.isin(pools, touched))
+
+    #add the descendants of those cells in the flood tree, one generation at a time
+    parents = parents_old.ravel()
+    has_parent = np.flatnonzero(parents >= 0)
+    order = has_parent[np.argsort(parents[has_parent], kind='stable')]
+    bounds = np.searchsorted(parents[order], np.arange(nrows * ncols + 1))
+    region = start.ravel().copy()
+    frontier = np.flatnonzero(region)
+    while len(frontier):
+        lo, hi = bounds[frontier], bounds[frontier + 1]
+        counts = hi - lo
+        children = order[np.repeat(lo - np.cumsum(counts) + counts, counts)
+                         + np.arange(counts.sum())]
+        frontier = children[~region[children]]
+        region[frontier] = True
+    region = region.reshape(nrows, ncols) & valid
+
+    filled = np.array(filled_old, dtype=np.float64)
+    parents = np.array(parents_old)
+    if not region.any():
+        return filled, parents, region
+
+    #flood the region again from its edge (cells outside it keep their fill) and from
+    #the seeds inside it, within the bounding box of the region and its edge
+    edge = valid & ~region & ndimage.binary_dilation(region, structure=np.ones((3, 3), dtype=bool))
+    rows, cols = np.nonzero(region | edge)
+    box = (slice(rows.min(), rows.max() + 1), slice(cols.min(), cols.max() + 1))
+    sub_seeds = edge[box] | (seeds[box] & region[box])
+    sub_filled, sub_parents = priority_flood(
+        z_new[box], (region | edge)[box], sub_seeds,
+        seed_levels=np.where(edge[box], filled_old[box], z_new[box]), return_parents=True)
+
+    #parents from flat indices in the box to flat indices in the grid
+    sub_cols = box[1].stop - box[1].start
+    has_parent = sub_parents >= 0
+    sub_parents[has_parent] = ((sub_parents[has_parent] // sub_cols + box[0].start) * ncols
+                               + sub_parents[has_parent] % sub_cols + box[1].start)
+    in_region = region[box]
+    filled[box][in_region] = sub_filled[in_region]
+    parents[box][in_region] = sub_parents[in_region]
+    return filled, parents, region
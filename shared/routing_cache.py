@@ -0,0 +1,117 @@
+########################################################################
+#Content-addressed cache of filled surfaces shared by the Figure 4 and Figures 6-8
+#pipelines.
+
+#Brief description: depression filling is the most expensive step of flow routing in both
+#pipelines, and the same DEMs (or DEM windows) are filled again by every rerun, by both
+#scripts, and by any new analysis. The filled surface does not depend on the flow metric:
+#Landlab's PriorityFloodFlowRouter fills with RichDEM from the elevations and the closed
+#nodes alone, using only the depression handler, the epsilon setting, and the neighbor
+#topology (D8 for every metric except D4 and Rho4), and then derives the receivers,
+#slopes, and drainage areas of the chosen metric from the filled and the original
+#surface. A CachedFillRouter is a PriorityFloodFlowRouter that looks the filled surface
+#up in a RoutingCache before filling and stores it there after filling, so a D8 run of
+#Figure 4 and a Dinf run of Figures 6-8 over the same grid share one fill, and only the
+#metric-specific products are computed again. They are the same as those of a full run.
+
+#A RoutingCache stores arrays as one .npz file under a key that is the SHA-256 hash of
+#the input arrays (here the elevations and the closed nodes of the grid, which fix the
+#window and its extent) together with everything else that determines the result
+#(depression handler, epsilon, topology, and the Landlab and RichDEM versions). Because
+#the key is computed from the array contents, it does not matter where a DEM came from or
+#what it is called, but only identical inputs match (two clips of the same DEM with
+#different extents are different inputs).
+
+#Files are written to a temporary name and renamed, so several processes (or both
+#pipelines at once) can share one cache directory. Nothing is ever evicted; delete the
+#directory to clear the cache.
+
+########################################################################
+
+import os
+import json
+import hashlib
+import numpy as np
+import landlab
+from landlab.components import PriorityFloodFlowRouter
+
+class RoutingCache:
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    #key of the input arrays and the parameters (JSON-serializable values) of a run
+    def key(self, *arrays, **params):
+        h = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            h.update(json.dumps([array.dtype.str, array.shape]).encode())
+            h.update(array.data)
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npz')
+
+    #dict of the arrays stored under key, or None
+    def get(self, key):
+        try:
+            with np.load(self.path(key)) as f:
+                return {name: f[name] for name in f.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+    #store a dict of arrays under key
+    def put(self, key, products):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%d.partial.npz' % (path[:-4], os.getpid())
+        np.savez(tmp_path, **products)
+        os.replace(tmp_path, path)
+
+class CachedFillRouter(PriorityFloodFlowRouter):
+
+    #the arguments of PriorityFloodFlowRouter, and the RoutingCache of the filled surfaces
+    #(None fills every time). After a run, fill_cached tells whether the last fill came
+    #from the cache.
+    def __init__(self, grid, surface='topographic__elevation', cache=None, **kwargs):
+        super().__init__(grid, surface, **kwargs)
+        self.cache = cache
+        self.fill_cached = False
+
+    #key of the filled surface of the grid for flow_metric
+    def fill_key(self, flow_metric):
+        return self.cache.key(np.asarray(self._surface_values).reshape(self.grid.shape),
+                              np.asarray(self._closed),
+                              depression_handler=self._depression_handler,
+                              epsilon=self._epsilon if self._depression_handler == 'fill' else None,
+                              topology='D4' if flow_metric in ('D4', 'Rho4') else 'D8',
+                              landlab=landlab.__version__,
+                              richdem=self._richdem.__version__)
+
+    #PriorityFloodFlowRouter.remove_depressions, with the filled surface taken from the
+    #cache if it is there (the rest of it, the flow order and the output fields, is
+    #repeated here on the cached surface)
+    def remove_depressions(self, flow_metric='D8'):
+        self.fill_cached = False
+        if self.cache is None:
+            return super().remove_depressions(flow_metric)
+        key = self.fill_key(flow_metric)
+        stored = self.cache.get(key)
+        if stored is None:
+            super().remove_depressions(flow_metric)
+            self.cache.put(key, {'filled': np.asarray(self._depression_free_dem)})
+            return
+
+        self._depression_free_dem = self._richdem.rdarray(stored['filled'], no_data=-9999)
+        self._depression_free_dem.geotransform = [0, 1, 0, 0, 0, -1]
+        ordered = np.array(self._depression_free_dem).reshape(self.grid.number_of_nodes)
+        ordered[np.asarray(self._closed).ravel() == 1] = np.inf
+        self._sort[:] = np.argsort(ordered)
+
+        self.grid.at_node['depression_free_elevation'] = self._depression_free_dem
+        self.grid.at_node['flood_status_code'] = np.where(
+            self.grid.at_node['depression_free_elevation']
+            == self.grid.at_node['topographic__elevation'], 0, 3)
+        self.fill_cached = True
@@ -0,0 +1,101 @@
+########################################################################
+#Per-stage timing and memory instrumentation shared by the Figure 4 and Figures 6-8
+#pipelines.
+
+#Brief description: a StageTimer records, for every item processed (a HUC-12 watershed, an
+#input DEM), the wall time of each named stage (read, grid, routing, statistics, write,
+#...) together with the process's peak resident set size so far and, optionally, the peak
+#Python/NumPy memory traced by tracemalloc during the stage. Descriptive values such as
+#the grid shape or the number of core nodes can be attached to an item with note(). The
+#rows are kept in memory until pop_rows() hands them over, so worker processes can return
+#them with their results, and a StageLog writes them to a csv file in the main process:
+#one row per item and stage, e.g. to find the watersheds that dominate the runtime or to
+#compare runs before and after a Landlab upgrade.
+
+#Tracing memory with tracemalloc slows allocation-heavy code down noticeably, so it is
+#off unless trace_memory=True; peak_mb is then left empty.
+
+########################################################################
+
+import sys
+import csv
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError: #not available on Windows
+    resource = None
+
+columns = ['item', 'stage', 'wall_time', 'peak_mb', 'max_rss_mb']
+
+class StageTimer:
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.item = None
+        self.info = {}
+        self.rows = []
+
+    #begin a new item; info holds descriptive values for its rows
+    def start(self, item, **info):
+        self.item = item
+        self.info = dict(info)
+
+    #add descriptive values to the current item (they apply to all of its rows)
+    def note(self, **info):
+        self.info.update(info)
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.rows.append({'item': self.item, 'stage': name,
+                              'wall_time': time.perf_counter() - start,
+                              'peak_mb': tracemalloc.get_traced_memory()[1] / 2**20
+                                         if self.trace_memory else '',
+                              'max_rss_mb': max_rss_mb(),
+                              'info': self.info})
+
+    #hand over (and forget) the rows recorded so far
+    def pop_rows(self):
+        rows = [dict({k: v for k, v in row.items() if k != 'info'}, **row['info'])
+                for row in self.rows]
+        self.rows = []
+        return rows
+
+#timer.stage(name) if a timer is given, otherwise a context that does nothing
+def stage(timer, name):
+    return timer.stage(name) if timer is not None else nullcontext()
+
+#peak resident set size of this process so far in MB (ru_maxrss is in kB on Linux and in
+#bytes on macOS)
+def max_rss_mb():
+    if resource is None:
+        return ''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+class StageLog:
+
+    #csv file with the standard columns followed by info_columns (values missing from a
+    #row are left empty)
+    def __init__(self, path, info_columns=()):
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, columns + list(info_columns),
+                                      restval='', extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()